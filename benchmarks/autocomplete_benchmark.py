@@ -0,0 +1,104 @@
+"""
+Latency benchmark of the contacts autocomplete.
+
+Seeds a SQLite database file with the books of two users and times, for typed prefixes of 1 to 4 letters:
+
+- ``search``: the contacts list search, ``get_contact_rows(10, 0, prefix)`` (``ILIKE '%prefix%'`` on three columns)
+- ``autocomplete``: ``autocomplete_contacts(prefix, 10)``, range reads of the key indexes
+
+    python -m benchmarks.autocomplete_benchmark [--contacts 50000] [--queries 500]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import string
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from contacts_book.database.models import Base, Contact, User
+from contacts_book.repository.contacts import autocomplete_contacts, get_contact_rows
+
+SYLLABLES = ["ha", "le", "lu", "so", "ma", "ri", "ko", "va", "ne", "ta", "de", "mi", "sa", "ol", "an", "ir"]
+
+
+def word(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+
+
+def fill(session: Session, count: int, rng: random.Random) -> User:
+    users = [User(email=f"bench{number}@ex.ua", password="password") for number in range(2)]
+    session.add_all(users)
+    session.flush()
+    for number in range(count):
+        firstname, lastname = word(rng), word(rng)
+        session.add(
+            Contact(
+                firstname=firstname,
+                lastname=lastname,
+                email=f"{firstname}.{lastname}{number}@ex.ua".lower(),
+                phone=f"+380660{number:06d}",
+                birthday=datetime(1990, 1 + number % 12, 1 + number % 28),
+                description="",
+                user_id=users[number % 2].id,
+            )
+        )
+        if number % 5000 == 0:
+            session.flush()
+    session.commit()
+    return users[0]
+
+
+def percentile(timings: list, share: float) -> float:
+    return statistics.quantiles(timings, n=100)[int(share * 100) - 1]
+
+
+async def measure(query, prefixes: list) -> list:
+    timings = []
+    for prefix in prefixes:
+        start = time.perf_counter()
+        await query(prefix)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+async def run(contacts: int, queries: int) -> None:
+    rng = random.Random(14)
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'autocomplete.db')}")
+        Base.metadata.create_all(engine)
+        with Session(engine) as session:
+            user = fill(session, contacts, rng)
+            prefixes = [
+                "".join(rng.choice(string.ascii_lowercase[:20]) for _ in range(rng.randint(1, 4)))
+                for _ in range(queries)
+            ]
+            print(f"contacts={contacts} (half of them the user's), queries={queries}")
+            for name, query in (
+                ("search", lambda prefix: get_contact_rows(10, 0, prefix, user, session)),
+                ("autocomplete", lambda prefix: autocomplete_contacts(prefix, 10, user, session)),
+            ):
+                await measure(query, prefixes[:20])
+                timings = await measure(query, prefixes)
+                print(
+                    f"{name:<13} p50={statistics.median(timings):7.3f} ms  p95={percentile(timings, 0.95):7.3f} ms"
+                    f"  p99={percentile(timings, 0.99):7.3f} ms"
+                )
+        engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--contacts", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(run(args.contacts, args.queries))
+
+
+if __name__ == "__main__":
+    main()
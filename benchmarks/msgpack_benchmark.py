@@ -0,0 +1,48 @@
+"""
+Round-trip benchmark of the contacts list: JSON (orjson) against MessagePack.
+
+Each round trip encodes the rows on the server side and decodes them on the client side.
+
+    python -m benchmarks.msgpack_benchmark
+"""
+import timeit
+from datetime import datetime
+
+import orjson
+
+from contacts_book.services.content_negotiation import packb, unpackb
+
+
+def make_rows(count: int) -> list:
+    return [
+        {
+            "firstname": f"Firstname{i}",
+            "lastname": f"Lastname{i}",
+            "email": f"contact{i}@ex.ua",
+            "phone": f"+380660{i:06d}",
+            "birthday": datetime(1990, 1 + i % 12, 1 + i % 28),
+            "description": "Some description of the contact " * 3,
+            "id": i,
+            "created_at": datetime(2023, 12, 1, 10, 30),
+            "updated_at": datetime(2023, 12, 1, 10, 30),
+        }
+        for i in range(count)
+    ]
+
+
+def main():
+    for size in (10, 100, 1000):
+        rows = make_rows(size)
+        json_body = orjson.dumps(rows)
+        msgpack_body = packb(rows)
+        number = max(10, 20000 // size)
+        json_time = min(timeit.repeat(lambda: orjson.loads(orjson.dumps(rows)), number=number, repeat=5)) / number
+        msgpack_time = min(timeit.repeat(lambda: unpackb(packb(rows)), number=number, repeat=5)) / number
+        print(
+            f"rows={size:<5} json: {len(json_body):>7} B {json_time * 1000:7.3f} ms   "
+            f"msgpack: {len(msgpack_body):>7} B {msgpack_time * 1000:7.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Connection pool sizing benchmark.
+
+Runs a fixed number of concurrent workers against the pool, each one holding a
+connection for ``--hold-ms`` (the simulated query time), and prints throughput
+and time spent waiting for a connection for every pool size / overflow pair.
+
+    python -m benchmarks.pool_benchmark --url sqlite:///./bench.db --workers 40
+    python -m benchmarks.pool_benchmark --url postgresql+psycopg2://... --hold-ms 5
+"""
+import argparse
+import statistics
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from contacts_book.database.db import TimedQueuePool, pool_status
+
+
+def run(url: str, pool_size: int, max_overflow: int, workers: int, requests: int, hold_ms: float, timeout: float):
+    engine = create_engine(
+        url,
+        poolclass=TimedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=timeout,
+        pool_pre_ping=True,
+    )
+    waits = []
+    timeouts = 0
+    lock = threading.Lock()
+
+    def worker():
+        nonlocal timeouts
+        for _ in range(requests):
+            start = time.perf_counter()
+            try:
+                with engine.connect() as conn:
+                    waited = time.perf_counter() - start
+                    conn.execute(text("SELECT 1"))
+                    time.sleep(hold_ms / 1000)
+            except PoolTimeoutError:
+                with lock:
+                    timeouts += 1
+                continue
+            with lock:
+                waits.append(waited * 1000)
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    stats = pool_status(engine)
+    engine.dispose()
+    waits.sort()
+    p95 = waits[int(len(waits) * 0.95) - 1] if waits else 0.0
+    print(
+        f"pool_size={pool_size:<3} overflow={max_overflow:<3} "
+        f"rps={len(waits) / elapsed:8.1f} "
+        f"wait_avg={statistics.fmean(waits) if waits else 0:7.2f}ms "
+        f"wait_p95={p95:7.2f}ms timeouts={timeouts} "
+        f"pool_wait_max={stats['wait_max_ms']}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="sqlite:///./bench.db")
+    parser.add_argument("--workers", type=int, default=40)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--hold-ms", type=float, default=5.0)
+    parser.add_argument("--timeout", type=float, default=5.0)
+    args = parser.parse_args()
+
+    for pool_size, max_overflow in ((5, 10), (10, 10), (20, 10), (40, 0)):
+        run(args.url, pool_size, max_overflow, args.workers, args.requests, args.hold_ms, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Serialization benchmark for the contacts list response.
+
+Compares, for pages of 10, 100 and 1000 rows loaded from an in-memory SQLite database:
+
+- ``fastapi``: ORM objects, one ContactResponce per row, jsonable_encoder and json.dumps
+  (what FastAPI does for ``response_model=List[ContactResponce]``)
+- ``adapter``: ORM objects, validated and dumped by a prebuilt ``TypeAdapter(List[ContactResponce])``
+- ``rows+orjson``: ``select()`` of the response columns, dictionaries encoded by orjson
+
+    python -m benchmarks.serialization_benchmark
+"""
+import json
+import timeit
+from datetime import datetime
+from typing import List
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from contacts_book.database.models import Base, Contact, User
+from contacts_book.repository.contacts import CONTACT_RESPONSE_COLUMNS
+from contacts_book.schemas import ContactResponce
+
+# built once: validates and dumps a whole list of contacts in pydantic-core
+contact_list_adapter = TypeAdapter(List[ContactResponce])
+
+
+def fill(session: Session, count: int) -> User:
+    user = User(email="bench@ex.ua", password="password")
+    session.add(user)
+    session.add_all(
+        Contact(
+            firstname=f"Firstname{i}",
+            lastname=f"Lastname{i}",
+            email=f"contact{i}@ex.ua",
+            phone=f"+380660{i:06d}",
+            birthday=datetime(1990, 1 + i % 12, 1 + i % 28),
+            description="Some description of the contact " * 3,
+            created_at=datetime(2023, 12, 1),
+            updated_at=datetime(2023, 12, 1),
+            user=user,
+        )
+        for i in range(count)
+    )
+    session.commit()
+    return user
+
+
+def main():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        user_id = fill(session, 1000).id
+
+        for size in (10, 100, 1000):
+            def fastapi_path():
+                session.expunge_all()
+                contacts = session.query(Contact).filter(Contact.user_id == user_id).limit(size).all()
+                models = [ContactResponce.model_validate(contact) for contact in contacts]
+                return json.dumps(jsonable_encoder(models)).encode()
+
+            def adapter_path():
+                session.expunge_all()
+                contacts = session.query(Contact).filter(Contact.user_id == user_id).limit(size).all()
+                return contact_list_adapter.dump_json(
+                    contact_list_adapter.validate_python(contacts, from_attributes=True)
+                )
+
+            def rows_path():
+                stmt = select(*CONTACT_RESPONSE_COLUMNS).where(Contact.user_id == user_id).limit(size)
+                return orjson.dumps([dict(row) for row in session.execute(stmt).mappings()])
+
+            assert json.loads(fastapi_path()) == json.loads(rows_path())
+            number = max(10, 5000 // size)
+            for name, func in (("fastapi", fastapi_path), ("adapter", adapter_path), ("rows+orjson", rows_path)):
+                best = min(timeit.repeat(func, number=number, repeat=5)) / number
+                print(f"rows={size:<5} {name:<12} {best * 1000:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Server benchmark: plain uvicorn (one worker, asyncio loop, h11) against the tuned
+contacts_book.server options (uvloop, httptools, one worker per CPU).
+
+Both servers get the same environment, so point them at a prepared database and Redis
+(.env or environment variables) and pass an access token to benchmark the contacts routes:
+
+    python -m benchmarks.server_benchmark --token <access token> --path /api/contacts --path /api/contacts/upcoming_birthdays
+    python -m benchmarks.server_benchmark --path /api/health/live
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from contacts_book.server import uvicorn_options
+
+DEFAULT_OPTIONS = {"loop": "asyncio", "http": "h11", "workers": 1}
+
+
+def start_server(options: dict, port: int) -> subprocess.Popen:
+    code = (
+        "import uvicorn; "
+        f"uvicorn.run('main:app', port={port}, log_level='warning', access_log=False, "
+        + ", ".join(f"{key}={value!r}" for key, value in options.items())
+        + ")"
+    )
+    process = subprocess.Popen([sys.executable, "-c", code], env=os.environ.copy())
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/health/live", timeout=0.5)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Server did not start")
+
+
+async def load(url: str, headers: dict, concurrency: int, duration: float) -> tuple:
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = await client.get(url, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1] if latencies else 0.0
+    return len(latencies) / duration, p99 * 1000, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", action="append")
+    parser.add_argument("--token", default=None)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+    paths = args.path or ["/api/health/live"]
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+
+    tuned = uvicorn_options()
+    tuned_options = {key: tuned[key] for key in ("loop", "http", "workers", "backlog", "timeout_keep_alive")}
+
+    for name, options, port in (("default", DEFAULT_OPTIONS, 8101), ("tuned", tuned_options, 8102)):
+        process = start_server(options, port)
+        try:
+            for path in paths:
+                rps, p99, errors = asyncio.run(
+                    load(f"http://127.0.0.1:{port}{path}", headers, args.concurrency, args.duration)
+                )
+                print(f"{name:<8} {path:<40} rps={rps:8.1f} p99={p99:7.2f}ms errors={errors}")
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
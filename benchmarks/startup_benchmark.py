@@ -0,0 +1,37 @@
+"""
+Startup benchmark: time to import the application module and to build a new app with create_app().
+
+Every run is a fresh interpreter, like a new uvicorn worker.
+
+    python -m benchmarks.startup_benchmark
+"""
+import statistics
+import subprocess
+import sys
+
+SCRIPT = """
+import time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.create_app()
+created = time.perf_counter()
+print(imported - start, created - imported)
+"""
+
+
+def main(runs: int = 5):
+    imports, factories = [], []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", SCRIPT], capture_output=True, text=True, check=True
+        ).stdout
+        import_time, factory_time = map(float, output.split())
+        imports.append(import_time)
+        factories.append(factory_time)
+    print(f"import main:  median {statistics.median(imports) * 1000:7.1f} ms")
+    print(f"create_app(): median {statistics.median(factories) * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,4 +9,10 @@ YOUR_EMAIL_IS_ALREADY_CONFIRM = "Your email is already confirmed"
 EMAIL_CONFIRMED = "Email confirmed"
 CHECK_YOUR_EMAIL = "Check your email for confirmation."
 CONTACT_ALREADY_AXISTS = "Contact with such unique fields is exists!"
-CONTACT_NOT_FOUND = "Contact not found!"
\ No newline at end of file
+CONTACT_NOT_FOUND = "Contact not found!"
+CONTACTS_QUOTA_EXCEEDED = "Contacts quota exceeded!"
+INVALID_PHONE = "Invalid phone number"
+NOTHING_TO_MERGE = "Nothing to merge: the sources are the target itself"
+ADMIN_ONLY = "Admin access only"
+JOB_NOT_FOUND = "Job not found!"
+DUPLICATES_SEARCH_NOT_FOUND = "No duplicates search, start one first"
@@ -1,31 +1,318 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from fastapi import HTTPException, status
+import threading
+import time
+import weakref
+
+from jose import JWTError, jwt
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import NullPool, QueuePool
+from fastapi import HTTPException, Request, status
 from sqlalchemy.exc import SQLAlchemyError
 
-from contacts_book.conf.config import settings
+from contacts_book.conf.config import Settings, settings
+from contacts_book.database.deadlines import get_query_deadline, raise_for_cancellation
+from contacts_book.database.replicas import ReplicaRouter
+from contacts_book.services.metrics import metrics
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that records how long callers wait for a connection to be handed out.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        # connections are checked out from many threadpool threads at once
+        self._wait_lock = threading.Lock()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            with self._wait_lock:
+                self.wait_count += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+    def wait_stats(self) -> tuple[int, float, float]:
+        """
+        The wait_stats function returns the number of checkouts and the total and longest wait, read together.
+
+        :return: The count, total seconds and max seconds
+        """
+        with self._wait_lock:
+            return self.wait_count, self.wait_total, self.wait_max
+
+
+def create_db_engine(url: str, db_settings: Settings = settings) -> Engine:
+    """
+    The create_db_engine function creates an engine with the pool options from settings.
+        In PgBouncer mode pooling is left to PgBouncer, so the engine opens a connection per checkout.
+        SQLite urls keep the SQLAlchemy defaults, because pool sizing does not apply to them.
+
+    :param url: str: Database url
+    :param db_settings: Settings: Settings with the pool options
+    :return: A configured engine
+    """
+    if make_url(url).get_backend_name() == "sqlite":
+        return create_engine(url, connect_args={"check_same_thread": False})
+
+    if db_settings.db_pgbouncer:
+        return create_engine(url, poolclass=NullPool)
+
+    return create_engine(
+        url,
+        poolclass=TimedQueuePool,
+        pool_size=db_settings.db_pool_size,
+        max_overflow=db_settings.db_max_overflow,
+        pool_timeout=db_settings.db_pool_timeout,
+        pool_recycle=db_settings.db_pool_recycle,
+        pool_pre_ping=db_settings.db_pool_pre_ping,
+    )
+
+
+def pool_status(engine: Engine) -> dict:
+    """
+    The pool_status function returns live statistics of the engine connection pool.
+
+    :param engine: Engine: Engine to inspect
+    :return: A dictionary with pool statistics
+    """
+    pool = engine.pool
+    result = {"pool": type(pool).__name__}
+
+    if isinstance(pool, QueuePool):
+        result.update(
+            {
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": max(pool.overflow(), 0),
+                "max_overflow": pool._max_overflow,
+                "timeout": pool.timeout(),
+            }
+        )
+
+    if isinstance(pool, TimedQueuePool):
+        wait_count, wait_total, wait_max = pool.wait_stats()
+        result.update(
+            {
+                "wait_count": wait_count,
+                "wait_total_ms": round(wait_total * 1000, 3),
+                "wait_avg_ms": round(
+                    wait_total * 1000 / wait_count, 3
+                ) if wait_count else 0.0,
+                "wait_max_ms": round(wait_max * 1000, 3),
+            }
+        )
+
+    return result
 
 
 # sql connection
 SQLALCHEMY_DATABASE_URL = settings.sqlalchemy_database_url
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# engines are created on first use, so importing this module doesn't load the database driver
+_db_settings = settings
+_engine: Engine | None = None
+_replica_router: ReplicaRouter | None = None
+_lock = threading.Lock()
+
+
+def configure_database(db_settings: Settings = settings) -> None:
+    """
+    The configure_database function sets the settings the engines are created from and disposes
+    the engines created before. New engines are created on first use.
+
+    :param db_settings: Settings: Settings with the database urls and pool options
+    :return: None
+    """
+    global _db_settings
+    dispose_database()
+    _db_settings = db_settings
+
+
+def dispose_database() -> None:
+    """
+    The dispose_database function closes the pooled connections of the primary and the replica engines.
+
+    :return: None
+    """
+    global _engine, _replica_router
+    with _lock:
+        if _replica_router is not None:
+            for replica in _replica_router.replicas:
+                replica.dispose()
+        if _engine is not None:
+            _engine.dispose()
+        _engine = None
+        _replica_router = None
+
+
+def get_engine() -> Engine:
+    """
+    The get_engine function returns the engine of the primary database, creating it on first use.
+
+    :return: The primary engine
+    """
+    global _engine
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                _engine = create_db_engine(_db_settings.sqlalchemy_database_url, _db_settings)
+    return _engine
+
+
+def get_replica_router() -> ReplicaRouter:
+    """
+    The get_replica_router function returns the router of read-only sessions, creating the replica engines on first use.
+
+    :return: The replica router
+    """
+    global _replica_router
+    if _replica_router is None:
+        primary = get_engine()
+        with _lock:
+            if _replica_router is None:
+                _replica_router = ReplicaRouter(
+                    primary,
+                    [
+                        create_db_engine(url.strip(), _db_settings)
+                        for url in _db_settings.sqlalchemy_replica_urls.split(",")
+                        if url.strip()
+                    ],
+                    sticky_seconds=_db_settings.db_read_your_writes_seconds,
+                    max_lag=_db_settings.db_replica_max_lag,
+                    check_interval=_db_settings.db_replica_check_interval,
+                )
+    return _replica_router
+
+
+def _collect_db_pool() -> dict:
+    if _engine is None:
+        return {}
+    stats = pool_status(_engine)
+    return {
+        f"db_pool_{name}": value
+        for name, value in stats.items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    }
+
+
+metrics.register_collector(_collect_db_pool)
+
+
+# expire_on_commit=False keeps loaded objects usable after release_connection
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False)
+
+# sessions of the requests in flight, for the memory diagnostics
+open_sessions = weakref.WeakSet()
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _remember_write(session: Session, flush_context) -> None:
+    session.info["wrote"] = True
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _mark_sticky_write(session: Session) -> None:
+    if session.info.pop("wrote", False):
+        get_replica_router().mark_write(session.info.get("sticky_key"))
+        # ReadYourWritesMiddleware shares the write with the other workers before the response starts
+        request_state = session.info.get("request_state")
+        if request_state is not None:
+            request_state.wrote = True
+
+
+def get_sticky_key(request: Request) -> str | None:
+    """
+    The get_sticky_key function returns the key used for read-your-writes stickiness: the subject of the bearer token.
+        The token is not verified here, auth_service does that; the key only selects the engine.
+
+    :param request: Request: Current request
+    :return: Token subject or None
+    """
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return jwt.get_unverified_claims(token).get("sub")
+    except JWTError:
+        return None
+
+
+def release_connection(db: Session) -> None:
+    """
+    The release_connection function ends the current transaction of the session, so its pooled connection
+    goes back to the pool. Call it after the last statement and before slow I/O (Cloudinary, email, bcrypt).
+    The next statement on the session checks out a connection again.
+
+    :param db: Session: Database session
+    :return: None
+    """
+    if db.in_transaction():
+        db.commit()
 
 
 # Dependency
-def get_db():
+def get_db(request: Request):
     """
     The get_db function is a context manager that will automatically close the database session when it goes out of scope.
     It also handles any exceptions that occur within the with block, rolling back changes if necessary.
-    
+    Sessions from get_db use the primary database; commits mark the user as sticky for replica routing.
+    The session is lazy: no connection is checked out until the first statement runs, and it goes back
+    to the pool on every commit, so handlers that return early never touch the pool.
+    Statements are cancelled at the deadline of the route (Deadline) or after DB_STATEMENT_TIMEOUT seconds,
+    which turns into a 504.
+
+    :param request: Request: Current request
+    :return: A database session object
+    """
+    db = SessionLocal(bind=get_engine())
+    db.info["sticky_key"] = get_sticky_key(request)
+    db.info["request_state"] = request.state
+    db.info["query_deadline"] = get_query_deadline(request, _db_settings.db_statement_timeout)
+    open_sessions.add(db)
+    try:
+        yield db
+    except SQLAlchemyError as err:
+        db.rollback()
+        raise_for_cancellation(request, err)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(err))
+    finally:
+        open_sessions.discard(db)
+        db.close()
+
+
+def get_read_db(request: Request):
+    """
+    The get_read_db function is the dependency for read-only handlers.
+        The session uses a healthy replica, or the primary if the user wrote recently on any worker
+        (ReadYourWritesMiddleware checks that) or no replica is healthy.
+
+    :param request: Request: Current request
     :return: A database session object
     """
-    db = SessionLocal()
+    router = get_replica_router()
+    if getattr(request.state, "read_primary", False):
+        engine = router.primary
+    else:
+        engine = router.get_read_engine(get_sticky_key(request))
+    db = SessionLocal(bind=engine)
+    db.info["query_deadline"] = get_query_deadline(request, _db_settings.db_statement_timeout)
+    open_sessions.add(db)
     try:
         yield db
     except SQLAlchemyError as err:
         db.rollback()
+        raise_for_cancellation(request, err)
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(err))
     finally:
+        open_sessions.discard(db)
         db.close()
@@ -0,0 +1,200 @@
+import asyncio
+import sqlite3
+import time
+
+from fastapi import HTTPException, Request, status
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import Pool
+
+from contacts_book.services.metrics import metrics
+
+# sqlite calls the progress handler every this many virtual machine instructions
+SQLITE_PROGRESS_STEPS = 1000
+
+# nginx's status for a request the client closed before the response
+CLIENT_CLOSED_REQUEST = 499
+
+
+class QueryDeadline:
+    """
+    The time by which the database work of a request must be done, shared by all its sessions.
+
+    On Postgres every transaction of the sessions gets ``SET LOCAL statement_timeout`` with the time left;
+    on SQLite a progress handler interrupts the statement after the deadline. ``cancel`` stops the statement
+    that is running now, from any thread: the request's client went away.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+        self.reason = None
+        # connections of the request's sessions that are running a statement now
+        self.executing = set()
+
+    def remaining(self) -> float:
+        """
+        The remaining function returns the seconds left before the deadline.
+
+        :return: Seconds, 0 when the deadline has passed
+        """
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        return self.reason is not None or time.monotonic() >= self.expires_at
+
+    def cancel(self, reason: str) -> bool:
+        """
+        The cancel function cancels the running statements of the request's sessions.
+
+        :param reason: str: Why, "disconnect" or "deadline"
+        :return: True if a statement was running
+        """
+        connections = list(self.executing)
+        if not connections:
+            return False
+        self.reason = self.reason or reason
+        for connection in connections:
+            if isinstance(connection, sqlite3.Connection):
+                connection.interrupt()
+            elif hasattr(connection, "cancel"):
+                # psycopg2 sends a cancel request on another socket, so it can be called from any thread
+                connection.cancel()
+        return True
+
+
+class Deadline:
+    """
+    Route dependency that sets the deadline of the route's database work, like ``RateLimiter`` sets its limit.
+
+    A statement still running at the deadline is cancelled and the route returns 504. On GET routes the
+    client connection is watched too, and the running statement is cancelled when the client disconnects.
+    Add it before the session dependencies: the sessions of get_db and get_read_db pick it up when created.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    async def __call__(self, request: Request):
+        deadline = QueryDeadline(self.seconds)
+        request.state.query_deadline = deadline
+        watcher = None
+        if request.method in ("GET", "HEAD"):
+            # these requests have no body, so the only message left to receive is the disconnect
+            watcher = asyncio.create_task(watch_disconnect(request, deadline))
+        try:
+            yield deadline
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+
+
+async def watch_disconnect(request: Request, deadline: QueryDeadline) -> None:
+    """
+    The watch_disconnect function waits for the client to disconnect and cancels the statement the request
+        is running. The server also reports a disconnect once the response is sent, when nothing runs anymore.
+
+    :param request: Request: Current request
+    :param deadline: QueryDeadline: Deadline of the request
+    :return: None
+    """
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            deadline.cancel("disconnect")
+            return
+
+
+def get_query_deadline(request: Request, default_seconds: float) -> QueryDeadline | None:
+    """
+    The get_query_deadline function returns the deadline set by the route, or a new one of default_seconds.
+
+    :param request: Request: Current request
+    :param default_seconds: float: Deadline of routes without their own, 0 for none
+    :return: The deadline or None
+    """
+    deadline = getattr(request.state, "query_deadline", None)
+    if deadline is None and default_seconds > 0:
+        deadline = QueryDeadline(default_seconds)
+        request.state.query_deadline = deadline
+    return deadline
+
+
+def raise_for_cancellation(request: Request, err: SQLAlchemyError) -> None:
+    """
+    The raise_for_cancellation function turns a statement cancelled by the deadline into a 504, counted
+        in db_deadline_exceeded_total, and one cancelled because the client left into a 499.
+        Other errors are left to the caller.
+
+    :param request: Request: Current request
+    :param err: SQLAlchemyError: Error of the session
+    :return: None
+    """
+    reason = getattr(err, "cancelled_by", None)
+    if reason == "disconnect":
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed the request")
+    if reason == "deadline":
+        route = request.scope.get("route")
+        metrics.inc("db_deadline_exceeded_total", route=getattr(route, "path", request.url.path))
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="The database query took too long"
+        )
+
+
+def _is_cancellation(error: BaseException) -> bool:
+    # 57014 is query_canceled, raised by statement_timeout and by cancel requests
+    return getattr(error, "pgcode", None) == "57014" or (
+        isinstance(error, sqlite3.OperationalError) and str(error) == "interrupted"
+    )
+
+
+@event.listens_for(Session, "after_begin")
+def _apply_deadline(session: Session, transaction, connection) -> None:
+    deadline = session.info.get("query_deadline")
+    if deadline is None:
+        return
+    dbapi_connection = connection.connection.driver_connection
+    connection.info["query_deadline"] = deadline
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.set_progress_handler(deadline.expired, SQLITE_PROGRESS_STEPS)
+    elif connection.dialect.name == "postgresql":
+        timeout_ms = max(int(deadline.remaining() * 1000), 1)
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {timeout_ms}")
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _statement_started(conn, cursor, statement, parameters, context, executemany) -> None:
+    deadline = conn.info.get("query_deadline")
+    if deadline is not None:
+        deadline.executing.add(conn.connection.driver_connection)
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _statement_finished(conn, cursor, statement, parameters, context, executemany) -> None:
+    deadline = conn.info.get("query_deadline")
+    if deadline is not None:
+        deadline.executing.discard(conn.connection.driver_connection)
+
+
+@event.listens_for(Engine, "handle_error")
+def _mark_cancellation(context) -> None:
+    if context.connection is None:
+        return
+    deadline = context.connection.info.get("query_deadline")
+    if deadline is None:
+        return
+    deadline.executing.discard(context.connection.connection.driver_connection)
+    if _is_cancellation(context.original_exception) and context.sqlalchemy_exception is not None:
+        reason = deadline.reason or "deadline"
+        context.sqlalchemy_exception.cancelled_by = reason
+        metrics.inc("db_queries_cancelled_total", reason=reason)
+
+
+@event.listens_for(Pool, "checkin")
+def _clear_deadline(dbapi_connection, connection_record) -> None:
+    if connection_record is not None:
+        connection_record.info.pop("query_deadline", None)
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.set_progress_handler(None, 0)
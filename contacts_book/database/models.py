@@ -1,18 +1,40 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, func
-from sqlalchemy.schema import ForeignKey
-from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, extract, func
+from sqlalchemy.schema import ForeignKey, Index
+from sqlalchemy.orm import relationship, declarative_base, validates
+
+from contacts_book.conf.config import settings
+from contacts_book.services.autocomplete import autocomplete_key
+from contacts_book.services.phones import to_e164
 # from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
 
+# ICU root collation: Latin and Cyrillic names in alphabetical order, whatever the server locale
+NAME_COLLATION = "und-x-icu"
+
+
+def name_type(length: int) -> String:
+    return String(length).with_variant(String(length, collation=NAME_COLLATION), "postgresql")
+
+
+def key_type() -> String:
+    # byte order, so a plain btree index serves prefix ranges whatever the server locale
+    return String().with_variant(String(collation="C"), "postgresql")
+
 
 class Contact(Base):
     __tablename__ = "contacts"
     id = Column(Integer, primary_key=True)
-    firstname = Column(String(50), nullable=False)
-    lastname = Column(String(50))
+    firstname = Column(name_type(50), nullable=False)
+    lastname = Column(name_type(50))
     email = Column(String, unique=True)
     phone = Column(String, unique=True)
+    # phone in E.164, set with phone, for lookups and the uniqueness check
+    phone_e164 = Column(String(16))
+    # autocomplete keys, set with the fields, for prefix matching on an index
+    firstname_key = Column(key_type())
+    lastname_key = Column(key_type())
+    email_key = Column(key_type())
     birthday = Column(DateTime)
     description = Column(String)
     created_at = Column(DateTime, default=func.now())
@@ -20,6 +42,48 @@ class Contact(Base):
     user_id = Column("user_id", ForeignKey("users.id", ondelete="CASCADE"), default=None)
     user = relationship("User", backref="notes")
 
+    __table_args__ = (
+        # one index per sort order of the contacts list, all leading with user_id
+        Index("ix_contacts_user_id_name", "user_id", "lastname", "firstname", "id"),
+        Index("ix_contacts_user_id_created_at", "user_id", "created_at", "id"),
+        Index("ix_contacts_user_id_updated_at", "user_id", "updated_at", "id"),
+        Index("ix_contacts_user_id_phone_e164", "user_id", "phone_e164"),
+        Index("ix_contacts_user_id_firstname_key", "user_id", "firstname_key", "id"),
+        Index("ix_contacts_user_id_lastname_key", "user_id", "lastname_key", "id"),
+        Index("ix_contacts_user_id_email_key", "user_id", "email_key", "id"),
+    )
+
+    @validates("firstname", "lastname", "email")
+    def validate_autocomplete_field(self, key: str, value: str | None) -> str | None:
+        setattr(self, f"{key}_key", autocomplete_key(value))
+        return value
+
+    @validates("phone")
+    def validate_phone(self, key: str, phone: str | None) -> str | None:
+        self.phone_e164 = to_e164(phone, settings.phone_country_code)
+        return phone
+
+
+Index(
+    "ix_contacts_user_id_birthday",
+    Contact.user_id,
+    extract("month", Contact.birthday),
+    extract("day", Contact.birthday),
+    Contact.id,
+)
+
+
+class UserStat(Base):
+    """
+    A counter of the user's contacts, kept up to date by the contact writes: "contacts" is the total,
+    "birthdays:<month>" the contacts born in the month and "created:<YYYY-MM-DD>" the contacts added on the day.
+    """
+
+    __tablename__ = "user_stats"
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    name = Column(String(32), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
 
 class User(Base):
     __tablename__ = "users"
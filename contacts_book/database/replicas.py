@@ -0,0 +1,181 @@
+import itertools
+import threading
+import time
+from typing import Dict, List
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+STICKY_KEY_PREFIX = "replicas:sticky:"
+
+PG_LAG_QUERY = text(
+    "SELECT COALESCE(EXTRACT(EPOCH FROM (now() - pg_last_xact_replay_timestamp())), 0)"
+)
+
+
+class ReplicaRouter:
+    """
+    Chooses the engine for read-only sessions.
+
+    Reads go to a healthy replica (round robin). A user who has written within
+    ``sticky_seconds`` reads from the primary, so they see their own writes; the writes
+    are remembered in the worker and in Redis, so the other workers see them too. A
+    replica that is unreachable or lags more than ``max_lag`` seconds is skipped
+    until the next health check, and with no healthy replica reads go to the primary.
+    """
+
+    def __init__(
+        self,
+        primary: Engine,
+        replicas: List[Engine],
+        sticky_seconds: float = 5.0,
+        max_lag: float = 10.0,
+        check_interval: float = 15.0,
+    ):
+        self.primary = primary
+        self.replicas = replicas
+        self.sticky_seconds = sticky_seconds
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._last_write: Dict[str, float] = {}
+        self._health: Dict[int, tuple] = {}
+        self._cycle = itertools.cycle(range(len(replicas))) if replicas else None
+        self._lock = threading.Lock()
+        self._check_locks = [threading.Lock() for _ in replicas]
+
+    def mark_write(self, key: str | None) -> None:
+        """
+        The mark_write function remembers that the user has just written to the primary.
+
+        :param key: str | None: Sticky key of the user (token subject)
+        :return: None
+        """
+        if not key:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._last_write[key] = now
+            if len(self._last_write) > 10000:
+                self._last_write = {
+                    k: v for k, v in self._last_write.items() if now - v < self.sticky_seconds
+                }
+
+    def is_sticky(self, key: str | None) -> bool:
+        """
+        The is_sticky function checks if the user wrote within the read-your-writes window.
+
+        :param key: str | None: Sticky key of the user (token subject)
+        :return: True if reads of the user must go to the primary
+        """
+        if not key:
+            return False
+        last_write = self._last_write.get(key)
+        return last_write is not None and time.monotonic() - last_write < self.sticky_seconds
+
+    async def remember_write(self, key: str | None, redis) -> None:
+        """
+        The remember_write function shares the read-your-writes window of the user with the other workers:
+            a Redis key that expires after sticky_seconds.
+
+        :param key: str | None: Sticky key of the user (token subject)
+        :param redis: Redis client, or None without Redis
+        :return: None
+        """
+        from redis.exceptions import RedisError
+
+        if not key or redis is None:
+            return
+        try:
+            await redis.set(f"{STICKY_KEY_PREFIX}{key}", 1, px=max(1, int(self.sticky_seconds * 1000)))
+        except RedisError:
+            pass
+
+    async def wrote_recently(self, key: str | None, redis) -> bool:
+        """
+        The wrote_recently function checks if the user wrote within the read-your-writes window on any worker.
+
+        :param key: str | None: Sticky key of the user (token subject)
+        :param redis: Redis client, or None without Redis
+        :return: True if reads of the user must go to the primary
+        """
+        from redis.exceptions import RedisError
+
+        if self.is_sticky(key):
+            return True
+        if not key or redis is None:
+            return False
+        try:
+            return bool(await redis.exists(f"{STICKY_KEY_PREFIX}{key}"))
+        except RedisError:
+            return False
+
+    def replica_lag(self, replica: Engine) -> float:
+        """
+        The replica_lag function returns the replication lag of the replica in seconds.
+            Replicas that are not Postgres (e.g. SQLite in tests) only get a reachability check.
+
+        :param replica: Engine: Replica engine
+        :return: Lag in seconds
+        """
+        with replica.connect() as conn:
+            if replica.dialect.name == "postgresql":
+                return float(conn.execute(PG_LAG_QUERY).scalar() or 0)
+            conn.execute(text("SELECT 1"))
+            return 0.0
+
+    def is_healthy(self, index: int) -> bool:
+        """
+        The is_healthy function returns the cached health of the replica, refreshing it once per check interval.
+            One caller probes the replica; the others keep using the last result meanwhile.
+
+        :param index: int: Index of the replica
+        :return: True if the replica can serve reads
+        """
+        checked_at, healthy = self._health.get(index, (None, False))
+        if checked_at is not None and time.monotonic() - checked_at < self.check_interval:
+            return healthy
+        if not self._check_locks[index].acquire(blocking=False):
+            return healthy
+
+        try:
+            try:
+                healthy = self.replica_lag(self.replicas[index]) <= self.max_lag
+            except SQLAlchemyError:
+                healthy = False
+            self._health[index] = (time.monotonic(), healthy)
+        finally:
+            self._check_locks[index].release()
+        return healthy
+
+    def get_read_engine(self, key: str | None = None) -> Engine:
+        """
+        The get_read_engine function returns the engine a read-only session of the user should use.
+
+        :param key: str | None: Sticky key of the user (token subject)
+        :return: A replica engine, or the primary engine
+        """
+        if not self.replicas or self.is_sticky(key):
+            return self.primary
+
+        for _ in range(len(self.replicas)):
+            with self._lock:
+                index = next(self._cycle)
+            if self.is_healthy(index):
+                return self.replicas[index]
+
+        return self.primary
+
+    def status(self) -> List[dict]:
+        """
+        The status function returns the last health check result of every replica.
+
+        :return: A list of dictionaries with replica health
+        """
+        return [
+            {
+                "replica": str(replica.url.render_as_string(hide_password=True)),
+                "healthy": self._health.get(index, (None, None))[1],
+            }
+            for index, replica in enumerate(self.replicas)
+        ]
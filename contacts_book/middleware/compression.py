@@ -0,0 +1,237 @@
+import zlib
+from typing import Callable, Dict, List
+
+import anyio
+from fastapi import Request
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+
+class GzipEncoder:
+    def __init__(self, level: int = 6):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    def __init__(self, quality: int = 4):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self, level: int = 3):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+def available_encoders() -> Dict[str, Callable]:
+    """
+    The available_encoders function returns the supported encodings, most preferred first.
+        brotli and zstd are used only if their optional packages are installed.
+
+    :return: A dictionary of encoding name to encoder class
+    """
+    encoders = {}
+    if zstandard is not None:
+        encoders["zstd"] = ZstdEncoder
+    if brotli is not None:
+        encoders["br"] = BrotliEncoder
+    encoders["gzip"] = GzipEncoder
+    return encoders
+
+
+def negotiate_encoding(accept_encoding: str, supported: List[str]) -> str | None:
+    """
+    The negotiate_encoding function picks the encoding for the Accept-Encoding header.
+        Encodings with a higher q-value win; on a tie the server preference (order of supported) wins.
+
+    :param accept_encoding: str: Value of the Accept-Encoding header
+    :param supported: List[str]: Supported encodings, most preferred first
+    :return: The encoding name or None to send the body as is
+    """
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+
+    best, best_q = None, 0.0
+    for name in supported:
+        q = accepted.get(name, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def no_compression(request: Request) -> None:
+    """
+    The no_compression function is a route dependency that turns compression off for the route:
+        dependencies=[Depends(no_compression)]
+
+    :param request: Request: Current request
+    :return: None
+    """
+    request.state.no_compression = True
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses with zstd, brotli or gzip, as negotiated with Accept-Encoding.
+
+    Bodies smaller than ``minimum_size`` are sent as is. Bodies larger than ``threadpool_min_size``
+    are compressed in a worker thread. Streaming responses are compressed chunk by chunk and
+    flushed after every chunk, so clients get data as it is produced.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1000,
+        threadpool_min_size: int = 256 * 1024,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.threadpool_min_size = threadpool_min_size
+        self.encoders = available_encoders()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(
+            Headers(scope=scope).get("accept-encoding", ""), list(self.encoders)
+        )
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, scope, send, encoding)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, scope: Scope, send: Send, encoding: str):
+        self.middleware = middleware
+        self.scope = scope
+        self.downstream = send
+        self.encoding = encoding
+        self.start_message: Message | None = None
+        self.encoder = None
+        self.passthrough = False
+
+    def skip(self, headers: Headers) -> bool:
+        if self.scope.get("state", {}).get("no_compression"):
+            return True
+        if "content-encoding" in headers:
+            return True
+        if self.start_message["status"] < 200 or self.start_message["status"] in (204, 304):
+            return True
+        content_type = headers.get("content-type", "")
+        # an encoder per open event stream would hold its window for the life of the connection
+        if content_type.startswith("text/event-stream"):
+            return True
+        return content_type.startswith(("image/", "video/", "audio/")) or "zip" in content_type
+
+    async def encode(self, func: Callable, data: bytes) -> bytes:
+        if len(data) > self.middleware.threadpool_min_size:
+            return await anyio.to_thread.run_sync(func, data)
+        return func(data)
+
+    def start_headers(self) -> MutableHeaders:
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        return headers
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            self.passthrough = self.skip(Headers(raw=message["headers"]))
+            if self.passthrough:
+                await self.downstream(message)
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.downstream(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.encoder is None and not more_body:
+            # whole body in one message
+            if len(body) < self.middleware.minimum_size:
+                await self.downstream(self.start_message)
+                await self.downstream(message)
+                return
+
+            def compress_all(data: bytes) -> bytes:
+                encoder = self.middleware.encoders[self.encoding]()
+                return encoder.compress(data) + encoder.finish()
+
+            compressed = await self.encode(compress_all, body)
+            headers = self.start_headers()
+            headers["Content-Length"] = str(len(compressed))
+            await self.downstream(self.start_message)
+            await self.downstream({"type": "http.response.body", "body": compressed})
+            return
+
+        if self.encoder is None:
+            # streaming response
+            self.encoder = self.middleware.encoders[self.encoding]()
+            headers = self.start_headers()
+            del headers["Content-Length"]
+            await self.downstream(self.start_message)
+
+        if more_body:
+            chunk = await self.encode(lambda data: self.encoder.compress(data) + self.encoder.flush(), body)
+        else:
+            chunk = await self.encode(lambda data: self.encoder.compress(data) + self.encoder.finish(), body)
+        await self.downstream(
+            {"type": "http.response.body", "body": chunk, "more_body": more_body}
+        )
@@ -0,0 +1,90 @@
+import time
+from typing import Iterable, Tuple
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from contacts_book.services.concurrency_limit import AdaptiveLimiter, LimitExceeded, Priority
+from contacts_book.services.metrics import metrics
+
+# a pattern that ends with "*" matches the paths that start with it, any other pattern one path
+Rule = Tuple[str, str, Priority | None]
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    Admits requests through the adaptive limiter of the worker and sheds the ones it can't take
+    with a fast 503 and ``Retry-After``, instead of letting them queue for the database pool.
+
+    The priority of a request is the one of the first rule matching its method ("*" for any) and path,
+    ``default`` if none does. A rule with priority None exempts the path, for long-lived streams.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        limiter: AdaptiveLimiter,
+        rules: Iterable[Rule] = (),
+        default: Priority = Priority.normal,
+        retry_after: int = 1,
+    ):
+        self.app = app
+        self.limiter = limiter
+        self.rules = list(rules)
+        self.default = default
+        self.retry_after = retry_after
+
+    def priority(self, method: str, path: str) -> Priority | None:
+        """
+        The priority function returns the priority of the request, or None if it is exempt.
+
+        :param method: str: Request method
+        :param path: str: Request path
+        :return: The priority or None
+        """
+        for rule_method, pattern, priority in self.rules:
+            if rule_method not in ("*", method):
+                continue
+            if pattern.endswith("*"):
+                if path.startswith(pattern[:-1]):
+                    return priority
+            elif path.rstrip("/") == pattern.rstrip("/"):
+                return priority
+        return self.default
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        priority = self.priority(scope["method"], scope["path"])
+        if priority is None:
+            await self.app(scope, receive, send)
+            return
+
+        label = priority.name
+        try:
+            waited = await self.limiter.acquire(priority)
+        except LimitExceeded as err:
+            metrics.inc("concurrency_rejected_total", priority=label, reason=err.reason)
+            response = JSONResponse(
+                {"detail": "The server is busy, retry later"},
+                status_code=503,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+        metrics.observe("concurrency_queue_wait_seconds", waited, priority=label)
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def status_send(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, status_send)
+        finally:
+            self.limiter.release(priority, time.perf_counter() - start, overloaded=status_code in (503, 504))
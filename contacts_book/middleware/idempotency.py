@@ -0,0 +1,260 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import uuid
+from typing import Iterable, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from contacts_book.services.metrics import metrics
+from contacts_book.services.redis_pool import redis_pool
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "idempotency:"
+
+# statuses that say nothing about the outcome of the request: a retry with the same key has to run again
+UNSTORED_STATUSES = {408, 409, 429}
+
+# extends the pending marker only if it is still ours
+EXTEND_LUA_SCRIPT = """if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("PEXPIRE", KEYS[1], ARGV[2])
+end
+return 0"""
+
+# deletes the pending marker only if it is still ours
+RELEASE_LUA_SCRIPT = """if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0"""
+
+
+class IdempotencyMiddleware:
+    """
+    Serves retries of write requests that carry an ``Idempotency-Key`` header from Redis.
+
+    The first request with a key runs and its response is stored for ``ttl`` seconds, unless it is a server
+    error, 408, 409 or 429. Repeats get the stored response with ``Idempotent-Replayed: true`` before routing,
+    so they touch neither the database nor bcrypt; repeats that arrive while the first one runs wait for it.
+    The first request keeps the key locked while it runs, extending the lock every third of ``lock_timeout``;
+    a repeat still waiting after ``lock_timeout`` seconds gets a 409. A first request that fails frees the key
+    and a waiting repeat runs; one whose worker died frees it when the lock expires. Keys are scoped to the
+    method, path and Authorization header, and a key reused with another body gets a 422. Without Redis
+    requests run as usual.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        routes: Iterable[Tuple[str, str]],
+        ttl: int = 86400,
+        lock_timeout: float = 30.0,
+        poll_interval: float = 0.05,
+    ):
+        self.app = app
+        self.routes = {(method, path.rstrip("/")) for method, path in routes}
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or (scope["method"], scope["path"].rstrip("/")) not in self.routes:
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        idempotency_key = headers.get("idempotency-key")
+        redis = redis_pool.client
+        if not idempotency_key or redis is None:
+            await self.app(scope, receive, send)
+            return
+
+        from redis.exceptions import RedisError
+
+        body, receive = await self.read_body(receive)
+        fingerprint = hashlib.sha256(body).hexdigest()
+        scope_key = "\n".join(
+            (scope["method"], scope["path"], headers.get("authorization", ""), idempotency_key)
+        )
+        key = KEY_PREFIX + hashlib.sha256(scope_key.encode()).hexdigest()
+
+        # the token tells this request's marker from the marker of a later request with the key
+        pending = json.dumps({"state": "pending", "fingerprint": fingerprint, "token": uuid.uuid4().hex})
+        try:
+            while True:
+                acquired = await redis.set(key, pending, nx=True, px=int(self.lock_timeout * 1000))
+                if acquired:
+                    break
+                stored = await self.wait(redis, key, fingerprint)
+                if stored is not None:
+                    break
+                # the first request failed and released the key: run this one
+        except RedisError:
+            logger.warning("Idempotency key store failed, running the request", exc_info=True)
+            await self.app(scope, receive, send)
+            return
+
+        if acquired:
+            await self.run(redis, key, pending, fingerprint, scope, receive, send)
+        elif stored["fingerprint"] != fingerprint:
+            response = JSONResponse(
+                {"detail": "Idempotency-Key was used with another request body"}, status_code=422
+            )
+            await response(scope, receive, send)
+        elif stored["state"] != "done":
+            response = JSONResponse(
+                {"detail": "A request with this Idempotency-Key is in progress"}, status_code=409
+            )
+            await response(scope, receive, send)
+        else:
+            await self.replay(stored, send)
+
+    @staticmethod
+    async def read_body(receive: Receive) -> Tuple[bytes, Receive]:
+        """
+        The read_body function reads the whole request body and returns it with a receive function
+            that hands it to the app again.
+
+        :param receive: Receive: ASGI receive function
+        :return: The body and the new receive function
+        """
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+        sent = False
+
+        async def replay_receive() -> Message:
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        return body, replay_receive
+
+    async def wait(self, redis, key: str, fingerprint: str) -> dict | None:
+        """
+        The wait function waits for the first request with the key to finish and returns what it stored:
+            its response, or its pending marker if it is still running after lock_timeout or has another body.
+            Returns None if the first request failed and left nothing.
+
+        :param redis: Redis client
+        :param key: str: Redis key of the Idempotency-Key
+        :param fingerprint: str: Hash of the request body
+        :return: The stored value or None
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.lock_timeout
+        while True:
+            value = await redis.get(key)
+            if value is None:
+                return None
+            stored = json.loads(value)
+            if stored["state"] == "done" or stored["fingerprint"] != fingerprint:
+                return stored
+            if loop.time() >= deadline:
+                return stored
+            await asyncio.sleep(self.poll_interval)
+
+    async def run(
+        self, redis, key: str, pending: str, fingerprint: str, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        """
+        The run function runs the request and stores its response as soon as the last body chunk is sent,
+            before background tasks run. Until then the pending marker is kept alive. Server errors, 408, 409
+            and 429 are not stored, so the request can be retried.
+
+        :param redis: Redis client
+        :param key: str: Redis key of the Idempotency-Key
+        :param pending: str: Pending marker of this request
+        :param fingerprint: str: Hash of the request body
+        :param scope: Scope: ASGI scope
+        :param receive: Receive: ASGI receive function
+        :param send: Send: ASGI send function
+        :return: None
+        """
+        from redis.exceptions import RedisError
+
+        start = {}
+        chunks = []
+        stored = False
+
+        async def store_send(message: Message) -> None:
+            nonlocal stored
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                status = start["status"]
+                if not message.get("more_body", False) and status < 500 and status not in UNSTORED_STATUSES:
+                    response = {
+                        "state": "done",
+                        "fingerprint": fingerprint,
+                        "status": status,
+                        "headers": [
+                            [name.decode("latin-1"), value.decode("latin-1")]
+                            for name, value in start.get("headers", [])
+                        ],
+                        "body": base64.b64encode(b"".join(chunks)).decode(),
+                    }
+                    try:
+                        await redis.set(key, json.dumps(response), ex=self.ttl)
+                        stored = True
+                    except RedisError:
+                        logger.warning("Idempotent response was not stored", exc_info=True)
+            await send(message)
+
+        keeper = asyncio.create_task(self.keep_locked(redis, key, pending))
+        try:
+            await self.app(scope, receive, store_send)
+        finally:
+            keeper.cancel()
+            if not stored:
+                try:
+                    await redis.eval(RELEASE_LUA_SCRIPT, 1, key, pending)
+                except RedisError:
+                    logger.warning("Idempotency key was not released", exc_info=True)
+
+    async def keep_locked(self, redis, key: str, pending: str) -> None:
+        """
+        The keep_locked function extends the pending marker of a running request every third of lock_timeout,
+            so the key does not expire under a slow request and let a repeat run it again.
+
+        :param redis: Redis client
+        :param key: str: Redis key of the Idempotency-Key
+        :param pending: str: Pending marker of the request
+        :return: None
+        """
+        from redis.exceptions import RedisError
+
+        while True:
+            await asyncio.sleep(self.lock_timeout / 3)
+            try:
+                if not await redis.eval(EXTEND_LUA_SCRIPT, 1, key, pending, int(self.lock_timeout * 1000)):
+                    return
+            except RedisError:
+                logger.warning("Idempotency key lock was not extended", exc_info=True)
+
+    @staticmethod
+    async def replay(stored: dict, send: Send) -> None:
+        """
+        The replay function sends the stored response.
+
+        :param stored: dict: Stored response
+        :param send: Send: ASGI send function
+        :return: None
+        """
+        metrics.inc("idempotency_replays_total")
+        headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in stored["headers"]]
+        headers.append((b"idempotent-replayed", b"true"))
+        await send({"type": "http.response.start", "status": stored["status"], "headers": headers})
+        await send({"type": "http.response.body", "body": base64.b64decode(stored["body"])})
@@ -0,0 +1,19 @@
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from contacts_book.services.loop_watchdog import LoopWatchdog
+
+
+class LoopWatchdogMiddleware:
+    """
+    Tells the loop watchdog which request the current task serves, so blocks can be attributed to a route.
+    """
+
+    def __init__(self, app: ASGIApp, watchdog: LoopWatchdog):
+        self.app = app
+        self.watchdog = watchdog
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            # the router adds the matched route to this same scope dict later
+            self.watchdog.track(scope)
+        await self.app(scope, receive, send)
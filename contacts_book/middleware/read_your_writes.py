@@ -0,0 +1,41 @@
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from contacts_book.database.db import get_replica_router, get_sticky_key
+from contacts_book.services.redis_pool import redis_pool
+
+READ_METHODS = ("GET", "HEAD")
+
+
+class ReadYourWritesMiddleware:
+    """
+    Keeps the read-your-writes window of the replica router across workers. Before a read request it checks
+    in Redis whether the user wrote recently on any worker, and get_read_db then uses the primary. When a request
+    has committed a write, the write is stored in Redis before the response starts, so the next request of the
+    client finds it whichever worker serves it. Only added when replicas are configured.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        key = get_sticky_key(request)
+        if not key:
+            await self.app(scope, receive, send)
+            return
+
+        router = get_replica_router()
+        if scope["method"] in READ_METHODS:
+            request.state.read_primary = await router.wrote_recently(key, redis_pool.client)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start" and getattr(request.state, "wrote", False):
+                await router.remember_write(key, redis_pool.client)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,15 +1,72 @@
-from typing import List
+from collections import Counter, defaultdict
+from typing import List, Tuple
 from datetime import datetime, timedelta
 
-from sqlalchemy import or_, and_
+from sqlalchemy import or_, and_, delete, extract, func, select, union_all
 from sqlalchemy.orm import Session
 
 from contacts_book.database.models import Contact, User
-from contacts_book.schemas import ContactModel
+from contacts_book.repository.stats import (
+    TOTAL,
+    apply_stats,
+    contact_stats,
+    reserve_contacts,
+    stats_change,
+)
+from contacts_book.conf.config import settings
+from contacts_book.schemas import ContactModel, ContactSort
+from contacts_book.services.autocomplete import autocomplete_key, prefix_range
+from contacts_book.services.phones import to_e164
+from contacts_book.services.single_flight import single_flight
+
+# sort orders of the contacts list, each matching an index of the contacts table after user_id;
+# id is the tie-breaker, so pages don't overlap
+CONTACT_SORT_ORDERS = {
+    "name": (Contact.lastname, Contact.firstname, Contact.id),
+    "created_at": (Contact.created_at, Contact.id),
+    "updated_at": (Contact.updated_at, Contact.id),
+    "birthday": (extract("month", Contact.birthday), extract("day", Contact.birthday), Contact.id),
+}
+
+
+def contacts_order_by(sort: ContactSort | str) -> list:
+    """
+    The contacts_order_by function returns the ORDER BY expressions of the sort order.
+        All expressions go in the same direction, so the database reads the index forwards or backwards
+        instead of sorting.
+
+    :param sort: ContactSort | str: Sort order, "-" prefix for descending
+    :return: A list of order by expressions
+    """
+    sort = ContactSort(sort).value
+    columns = CONTACT_SORT_ORDERS[sort.lstrip("-")]
+    if sort.startswith("-"):
+        return [column.desc() for column in columns]
+    return list(columns)
+
+
+def contact_search(search: str):
+    """
+    The contact_search function returns the filter of the contacts whose firstname, lastname or email
+        contains the search string, in any case.
+
+    :param search: str: Search string
+    :return: A filter expression
+    """
+    return or_(
+        Contact.firstname.icontains(search),
+        Contact.lastname.icontains(search),
+        Contact.email.icontains(search),
+    )
 
 
 async def get_contacts(
-    limit: int, offset: int, search: str | None, user: User, db: Session
+    limit: int,
+    offset: int,
+    search: str | None,
+    user: User,
+    db: Session,
+    sort: ContactSort | str = ContactSort.name,
 ) -> List[Contact]:
     """
     The get_contacts function returns a list of contacts for the user.
@@ -22,21 +79,16 @@ async def get_contacts(
     :param search: str | None: Filter the contacts by firstname, lastname or email
     :param user: User: Get the user id to filter the contacts by
     :param db: Session: Pass the database session to the function
+    :param sort: ContactSort | str: Sort order of the contacts
     :return: A list of contacts
     """
     if search:
         return (
             db.query(Contact)
             .filter(
-                and_(
-                    Contact.user_id == user.id,
-                    or_(
-                        Contact.firstname.icontains(search),
-                        Contact.lastname.icontains(search),
-                        Contact.email.icontains(search),
-                    ),
-                )
+                and_(Contact.user_id == user.id, contact_search(search))
             )
+            .order_by(*contacts_order_by(sort))
             .limit(limit)
             .offset(offset)
             .all()
@@ -45,12 +97,150 @@ async def get_contacts(
     return (
         db.query(Contact)
         .filter(Contact.user_id == user.id)
+        .order_by(*contacts_order_by(sort))
         .limit(limit)
         .offset(offset)
         .all()
     )
 
 
+async def count_contacts(search: str, user: User, db: Session) -> int:
+    """
+    The count_contacts function counts the user's contacts that match the search.
+
+    :param search: str: Filter the contacts by firstname, lastname or email
+    :param user: User: Get the user id to filter the contacts by
+    :param db: Session: Pass the database session to the function
+    :return: The number of matching contacts
+    """
+    return db.execute(
+        select(func.count()).where(Contact.user_id == user.id, contact_search(search))
+    ).scalar()
+
+
+async def estimate_contacts(search: str, user: User, db: Session, total: int, sample: int) -> Tuple[int, bool]:
+    """
+    The estimate_contacts function estimates how many of the user's contacts match the search
+        from the matches among a sample of about sample of them. The sample takes every n-th id, so it spreads
+        over the whole book, old and new contacts alike, unlike the first rows of a LIMIT. The query still reads
+        all the user's rows to pick the sample; only the search is matched against fewer of them, so it is cheaper
+        than an exact count but still grows with the book. Small books are counted exactly.
+
+    :param search: str: Filter the contacts by firstname, lastname or email
+    :param user: User: Get the user id to filter the contacts by
+    :param db: Session: Pass the database session to the function
+    :param total: int: Number of the user's contacts
+    :param sample: int: Number of contacts to look at
+    :return: The number of matching contacts and whether it is estimated
+    """
+    stride = total // max(sample, 1)
+    if stride <= 1:
+        return await count_contacts(search, user, db), False
+    sampled, matches = db.execute(
+        select(func.count(), func.count().filter(contact_search(search))).where(
+            Contact.user_id == user.id, Contact.id % stride == 0
+        )
+    ).one()
+    if not sampled:
+        return await count_contacts(search, user, db), False
+    return round(matches * total / sampled), True
+
+
+# columns of ContactResponce, in the response order
+CONTACT_RESPONSE_COLUMNS = (
+    Contact.firstname,
+    Contact.lastname,
+    Contact.email,
+    Contact.phone,
+    Contact.birthday,
+    Contact.description,
+    Contact.id,
+    Contact.created_at,
+    Contact.updated_at,
+)
+
+CONTACT_DATETIME_FIELDS = ("birthday", "created_at", "updated_at")
+
+
+def contact_rows_from_json(rows: List[dict]) -> List[dict]:
+    """
+    The contact_rows_from_json function turns contact rows decoded from JSON back into column rows:
+        the datetimes, which JSON keeps as ISO strings, are parsed again.
+
+    :param rows: List[dict]: Contact rows decoded from JSON
+    :return: A list of dictionaries with the contact fields
+    """
+    for row in rows:
+        for field in CONTACT_DATETIME_FIELDS:
+            if row.get(field) is not None:
+                row[field] = datetime.fromisoformat(row[field])
+    return rows
+
+
+@single_flight.coalesce(decode=contact_rows_from_json)
+def get_contact_rows(
+    limit: int,
+    offset: int,
+    search: str | None,
+    user: User,
+    db: Session,
+    sort: ContactSort | str = ContactSort.name,
+) -> List[dict]:
+    """
+    The get_contact_rows function returns the same page as get_contacts, as plain dictionaries.
+        Only the response columns are selected and no ORM objects are built, so the rows
+        can be encoded to JSON directly. Identical concurrent calls share one read, in the threadpool.
+
+    :param limit: int: Limit the number of contacts returned
+    :param offset: int: Specify the number of records to skip before returning
+    :param search: str | None: Filter the contacts by firstname, lastname or email
+    :param user: User: Get the user id to filter the contacts by
+    :param db: Session: Pass the database session to the function
+    :param sort: ContactSort | str: Sort order of the contacts
+    :return: A list of dictionaries with the contact fields
+    """
+    stmt = select(*CONTACT_RESPONSE_COLUMNS).where(Contact.user_id == user.id)
+
+    if search:
+        stmt = stmt.where(contact_search(search))
+
+    stmt = stmt.order_by(*contacts_order_by(sort))
+    rows = db.execute(stmt.limit(limit).offset(offset)).mappings().all()
+    return [dict(row) for row in rows]
+
+
+async def get_contact_rows_by_ids(ids: List[int], user: User, db: Session) -> List[dict]:
+    """
+    The get_contact_rows_by_ids function returns the contacts of the user with the given ids, as plain dictionaries,
+        with one IN query. Ids of other users' contacts are skipped like missing ones.
+
+    :param ids: List[int]: Ids of the contacts
+    :param user: User: Get the user id to filter the contacts by
+    :param db: Session: Pass the database session to the function
+    :return: A list of dictionaries with the contact fields
+    """
+    stmt = select(*CONTACT_RESPONSE_COLUMNS).where(
+        Contact.user_id == user.id, Contact.id.in_(set(ids))
+    )
+    return [dict(row) for row in db.execute(stmt).mappings().all()]
+
+
+async def get_contacts_by_ids(ids: List[int], user: User, db: Session) -> List[Contact]:
+    """
+    The get_contacts_by_ids function returns the contacts of the user with the given ids, with one IN query.
+
+    :param ids: List[int]: Ids of the contacts
+    :param user: User: Get the user id to filter the contacts by
+    :param db: Session: Pass the database session to the function
+    :return: A list of contacts
+    """
+    return (
+        db.query(Contact)
+        .filter(Contact.user_id == user.id, Contact.id.in_(set(ids)))
+        .all()
+    )
+
+
 async def get_contact_by_id(contact_id: int, user: User, db: Session) -> Contact | None:
     """
     The get_contact_by_id function returns a contact from the database based on its id.
@@ -68,45 +258,146 @@ async def get_contact_by_id(contact_id: int, user: User, db: Session) -> Contact
     )
 
 
+def phone_e164(phone: str | None) -> str | None:
+    return to_e164(phone, settings.phone_country_code)
+
+
+async def get_contact_rows_by_phone(phone: str, user: User, db: Session) -> List[dict]:
+    """
+    The get_contact_rows_by_phone function returns the contacts of the user with the phone, in any format,
+        as plain dictionaries. It is one query on the (user_id, phone_e164) index.
+
+    :param phone: str: Phone in E.164
+    :param user: User: Get the user id to filter the contacts by
+    :param db: Session: Pass the database session to the function
+    :return: A list of dictionaries with the contact fields
+    """
+    stmt = (
+        select(*CONTACT_RESPONSE_COLUMNS)
+        .where(Contact.user_id == user.id, Contact.phone_e164 == phone)
+        .order_by(Contact.id)
+    )
+    return [dict(row) for row in db.execute(stmt).mappings().all()]
+
+
+AUTOCOMPLETE_KEYS = (Contact.firstname_key, Contact.lastname_key, Contact.email_key)
+
+
+async def autocomplete_contacts(prefix: str, limit: int, user: User, db: Session) -> List[dict]:
+    """
+    The autocomplete_contacts function returns the first contacts of the user whose firstname, lastname or email
+        starts with the prefix, in any case and with or without accents. Each field is one range read of its
+        (user_id, key, id) index, at most limit rows long, so the time doesn't grow with the book;
+        the three reads are one query.
+
+    :param prefix: str: What the user has typed
+    :param limit: int: Number of contacts returned
+    :param user: User: Get the user id to filter the contacts by
+    :param db: Session: Pass the database session to the function
+    :return: A list of dictionaries with the id, firstname, lastname and email, ordered by the matched key
+    """
+    prefix = autocomplete_key(prefix)
+    if not prefix:
+        return []
+    low, high = prefix_range(prefix)
+    queries = []
+    for key in AUTOCOMPLETE_KEYS:
+        stmt = select(Contact.id, Contact.firstname, Contact.lastname, Contact.email, key.label("match")).where(
+            Contact.user_id == user.id, key >= low
+        )
+        if high is not None:
+            stmt = stmt.where(key < high)
+        queries.append(select(stmt.order_by(key, Contact.id).limit(limit).subquery()))
+
+    suggestions = {}
+    for row in sorted(db.execute(union_all(*queries)).mappings().all(), key=lambda row: (row["match"], row["id"])):
+        if row["id"] not in suggestions:
+            suggestions[row["id"]] = {
+                "id": row["id"],
+                "firstname": row["firstname"],
+                "lastname": row["lastname"],
+                "email": row["email"],
+            }
+    return list(suggestions.values())[:limit]
+
+
 async def get_contact_by_unique_fields(
-    body: ContactModel, user: User, db: Session
+    body: ContactModel, user: User, db: Session, exclude_id: int | None = None
 ) -> Contact | None:
     """
     The get_contact_by_unique_fields function is used to retrieve a contact from the database by either phone or email.
         The function takes in a ContactModel object, which contains the phone and/or email of the contact we are looking for.
         It also takes in an authenticated user object, so that we can ensure that only contacts belonging to this user are returned.
+        Phones are compared in E.164 too, so the same number in another format is found.
+        On update the contact itself is excluded, so a match with its own email doesn't hide another contact
+        that has the phone.
 
     :param body: ContactModel: Get the contact model from the request body
     :param user: User: Get the user id from the user object
     :param db: Session: Pass the database session to the function
+    :param exclude_id: int | None: Id of the contact being updated
     :return: An object of the contact class or none
     """
+    conditions = [
+        Contact.user_id == user.id,
+        or_(
+            Contact.phone == body.phone,
+            # a phone that is not a number has no E.164 to compare, and NULL must not match
+            Contact.phone_e164 == (phone_e164(body.phone) or body.phone),
+            Contact.email == body.email,
+        ),
+    ]
+    if exclude_id is not None:
+        conditions.append(Contact.id != exclude_id)
+    return db.query(Contact).filter(and_(*conditions)).first()
+
+
+async def get_contacts_by_unique_fields(
+    bodies: List[ContactModel], user: User, db: Session
+) -> List[Contact]:
+    """
+    The get_contacts_by_unique_fields function returns the contacts of the user that have the phone or the email
+        of any of the given bodies, with one query. Phones are compared in E.164 too.
+
+    :param bodies: List[ContactModel]: Contact models from the request body
+    :param user: User: Get the user id from the user object
+    :param db: Session: Pass the database session to the function
+    :return: A list of contacts
+    """
     return (
         db.query(Contact)
         .filter(
-            and_(
-                Contact.user_id == user.id,
-                or_(Contact.phone == body.phone, Contact.email == body.email),
-            )
+            Contact.user_id == user.id,
+            or_(
+                Contact.phone.in_({body.phone for body in bodies}),
+                Contact.phone_e164.in_({phone_e164(body.phone) for body in bodies} - {None}),
+                Contact.email.in_({body.email for body in bodies}),
+            ),
         )
-        .first()
+        .all()
     )
 
 
-async def create_contact(body: ContactModel, user: User, db: Session) -> Contact:
+async def create_contact(body: ContactModel, user: User, db: Session, quota: int = 0) -> Contact:
     """
     The create_contact function creates a new contact in the database.
 
     The create_contact function takes a ContactModel object and uses it to create a new contact in the database. The user is also passed into this function, as well as an SQLAlchemy Session object for interacting with the database. This function returns an instance of Contact that was created.
+    The user's stats are updated in the same transaction.
 
     :param body: ContactModel: Pass the contact model to the function
     :param user: User: Get the user id from the jwt token
     :param db: Session: Pass the database session into the function
+    :param quota: int: Most contacts of the user, 0 for no limit
     :return: An instance of contact
+    :raises ContactsQuotaExceeded: When the user has as many contacts as the quota allows
     """
+    reserve_contacts(user.id, 1, quota, db)
     contact = Contact(user=user, **body.model_dump())
 
     db.add(contact)
+    db.flush()
+    apply_stats(user.id, contact_stats(contact), db)
     db.commit()
     db.refresh(contact)
 
@@ -133,6 +424,7 @@ async def update_contact(
     contact = await get_contact_by_id(contact_id, user, db)
 
     if contact:
+        before = contact_stats(contact)
         contact.firstname = body.firstname
         contact.lastname = body.lastname
         contact.phone = body.phone
@@ -140,11 +432,113 @@ async def update_contact(
         contact.birthday = body.birthday
         contact.description = body.description
 
+        apply_stats(user.id, stats_change(before, contact_stats(contact)), db)
         db.commit()
+        db.refresh(contact)
 
     return contact
 
 
+async def update_contacts(
+    changes: List[Tuple[Contact, ContactModel]], db: Session
+) -> List[Contact]:
+    """
+    The update_contacts function updates many contacts in one transaction, with the stats of their users.
+        The contacts are reloaded with one query after the commit, to get their new updated_at.
+
+    :param changes: List[Tuple[Contact, ContactModel]]: Contacts with their new data
+    :param db: Session: Pass the database session to the function
+    :return: A list of the updated contacts
+    """
+    if not changes:
+        return []
+
+    deltas = defaultdict(Counter)
+    for contact, body in changes:
+        deltas[contact.user_id].subtract(contact_stats(contact))
+        for field in ContactModel.model_fields:
+            setattr(contact, field, getattr(body, field))
+        deltas[contact.user_id].update(contact_stats(contact))
+
+    for user_id, delta in deltas.items():
+        apply_stats(user_id, delta, db)
+    db.commit()
+
+    return (
+        db.query(Contact)
+        .filter(Contact.id.in_([contact.id for contact, _ in changes]))
+        .populate_existing()
+        .all()
+    )
+
+
+async def delete_contacts(ids: List[int], user: User, db: Session) -> List[int]:
+    """
+    The delete_contacts function deletes the contacts of the user with the given ids, with one DELETE statement.
+        The user's stats are updated from the deleted rows in the same transaction.
+
+    :param ids: List[int]: Ids of the contacts
+    :param user: User: Get the user id to filter the contacts by
+    :param db: Session: Pass the database session to the function
+    :return: Ids of the deleted contacts
+    """
+    stmt = (
+        delete(Contact)
+        .where(Contact.user_id == user.id, Contact.id.in_(set(ids)))
+        .returning(Contact.id, Contact.birthday, Contact.created_at)
+    )
+    deleted = db.execute(stmt, execution_options={"synchronize_session": False}).all()
+
+    deltas = Counter({TOTAL: len(deleted)})
+    for row in deleted:
+        deltas.update(contact_stats(row))
+    apply_stats(user.id, {name: -count for name, count in deltas.items()}, db)
+    db.commit()
+
+    return [row.id for row in deleted]
+
+
+# fields a merged contact takes from the duplicates when it has none
+MERGE_FIELDS = ("lastname", "email", "phone", "birthday")
+
+
+async def merge_contacts(target: Contact, sources: List[Contact], user: User, db: Session) -> Contact:
+    """
+    The merge_contacts function merges duplicate contacts into the target contact, in one transaction.
+        The target keeps its fields and takes the empty ones from the sources, in their order;
+        the descriptions are joined. The sources are deleted and the user's stats are updated.
+
+    :param target: Contact: The contact that is kept
+    :param sources: List[Contact]: Duplicates of the target, deleted after the merge
+    :param user: User: Owner of the contacts
+    :param db: Session: Pass the database session to the function
+    :return: The merged contact
+    """
+    deltas = Counter({TOTAL: -len(sources)})
+    deltas.subtract(contact_stats(target))
+    values = {field: getattr(target, field) for field in MERGE_FIELDS}
+    descriptions = [target.description]
+    for source in sources:
+        deltas.subtract(contact_stats(source))
+        for field in MERGE_FIELDS:
+            if not values[field]:
+                values[field] = getattr(source, field)
+        descriptions.append(source.description)
+        db.delete(source)
+    # the sources go first: the email and phone are unique
+    db.flush()
+
+    for field, value in values.items():
+        setattr(target, field, value)
+    target.description = "\n".join(dict.fromkeys(text for text in descriptions if text))
+    deltas.update(contact_stats(target))
+    apply_stats(user.id, deltas, db)
+    db.commit()
+    db.refresh(target)
+
+    return target
+
+
 async def delete_contact(contact_id: int, user: User, db: Session) -> Contact:
     """
     The delete_contact function deletes a contact from the database.
@@ -163,6 +557,9 @@ async def delete_contact(contact_id: int, user: User, db: Session) -> Contact:
     contact = await get_contact_by_id(contact_id, user, db)
 
     if contact:
+        deltas = contact_stats(contact)
+        deltas[TOTAL] += 1
+        apply_stats(user.id, {name: -count for name, count in deltas.items()}, db)
         db.delete(contact)
         db.commit()
 
@@ -197,7 +594,24 @@ async def get_upcoming_birthdays(user: User, db: Session) -> List[Contact]:
     #     offset += limit
     cur_contacts = await get_contacts(100000, 0, None, user, db)
 
-    # get list of next seven days
+    list_dates = next_seven_days()
+
+    # equalization dates
+    for contact in cur_contacts:
+        # year = 1, this is equalization dates by month and day
+        if datetime(1, contact.birthday.month, contact.birthday.day) in list_dates:
+            res_contacts.append(contact)
+
+    return res_contacts
+
+
+def next_seven_days() -> List[datetime]:
+    """
+    The next_seven_days function returns the seven days after today, with year 1,
+        so birthdays can be compared with them by month and day.
+
+    :return: A list of dates
+    """
     date = datetime(datetime.now().year, datetime.now().month, datetime.now().day)
     list_dates = []
 
@@ -207,11 +621,25 @@ async def get_upcoming_birthdays(user: User, db: Session) -> List[Contact]:
         # year = 1 for next equalization dates by month and day
         list_dates.append(datetime(1, date.month, date.day))
         count += 1
+    return list_dates
 
-    # equalization dates
-    for contact in cur_contacts:
-        # year = 1, this is equalization dates by month and day
-        if datetime(1, contact.birthday.month, contact.birthday.day) in list_dates:
-            res_contacts.append(contact)
 
-    return res_contacts
+@single_flight.coalesce(decode=contact_rows_from_json)
+def get_upcoming_birthday_rows(user: User, db: Session) -> List[dict]:
+    """
+    The get_upcoming_birthday_rows function returns the same contacts as get_upcoming_birthdays,
+        as plain dictionaries. Identical concurrent calls share one read, in the threadpool.
+
+    :param user: User: Get the user id to filter the contacts by
+    :param db: Session: Pass the database session to the function
+    :return: A list of dictionaries with the contact fields
+    """
+    list_dates = next_seven_days()
+    rows = db.execute(
+        select(*CONTACT_RESPONSE_COLUMNS).where(Contact.user_id == user.id).order_by(*contacts_order_by("name"))
+    ).mappings()
+    return [
+        dict(row)
+        for row in rows
+        if row["birthday"] is not None and datetime(1, row["birthday"].month, row["birthday"].day) in list_dates
+    ]
@@ -0,0 +1,272 @@
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Tuple
+
+from sqlalchemy import Date, delete, extract, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from contacts_book.database.models import Contact, User, UserStat
+from contacts_book.services.metrics import metrics
+
+# counter of all the contacts of the user
+TOTAL = "contacts"
+# write version of the user's contacts, bumped by every write; keys of the cached counts include it
+VERSION = "version"
+
+
+class ContactsQuotaExceeded(Exception):
+    """
+    The user already has as many contacts as the quota allows.
+    """
+
+
+def birthday_stat(month: int) -> str:
+    return f"birthdays:{month}"
+
+
+def created_stat(day: date) -> str:
+    return f"created:{day.isoformat()}"
+
+
+def contact_stats(contact) -> Counter:
+    """
+    The contact_stats function returns the counters a contact counts towards, apart from the total.
+
+    :param contact: Contact or row with birthday and created_at
+    :return: A counter of the stat names
+    """
+    stats = Counter()
+    if contact.birthday is not None:
+        stats[birthday_stat(contact.birthday.month)] += 1
+    if contact.created_at is not None:
+        stats[created_stat(contact.created_at.date())] += 1
+    return stats
+
+
+def stats_change(before: Counter, after: Counter) -> Dict[str, int]:
+    """
+    The stats_change function returns the deltas that turn the before counters into the after ones.
+
+    :param before: Counter: Counters of the contact before the change
+    :param after: Counter: Counters of the contact after the change
+    :return: A dictionary of the non-zero deltas
+    """
+    return {name: after[name] - before[name] for name in before | after if after[name] != before[name]}
+
+
+def lock_order(name: str) -> Tuple[bool, str]:
+    """
+    The lock_order function is the sort key of the counter rows in every write: the total first, as create
+        locks it on its own before the others, then the rest by name. Writers that lock the rows of a user
+        in the same order can't deadlock each other.
+
+    :param name: str: Counter name
+    :return: The sort key
+    """
+    return name != TOTAL, name
+
+
+def _insert(db: Session):
+    # both dialects have INSERT ... ON CONFLICT; the sqlite one is the default, like for the test databases
+    dialect = db.get_bind().dialect.name
+    return (postgresql if dialect == "postgresql" else sqlite).insert(UserStat)
+
+
+def apply_stats(user_id: int, deltas: Dict[str, int], db: Session) -> None:
+    """
+    The apply_stats function adds the deltas to the user's counters with one upsert,
+        in the transaction of the contact write, so the counters are committed with the contacts.
+        The write version of the user is bumped too, even without deltas.
+
+    :param user_id: int: Id of the user
+    :param deltas: Dict[str, int]: Deltas of the counters by name
+    :param db: Session: Pass the database session to the function
+    :return: None
+    """
+    # in lock order, so concurrent writes lock the rows in the same order
+    rows = [
+        {"user_id": user_id, "name": name, "value": delta}
+        for name, delta in sorted({**deltas, VERSION: 1}.items(), key=lambda item: lock_order(item[0]))
+        if delta
+    ]
+    stmt = _insert(db).values(rows)
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[UserStat.user_id, UserStat.name],
+            set_={"value": UserStat.value + stmt.excluded.value},
+        )
+    )
+
+
+def reserve_contacts(user_id: int, count: int, quota: int, db: Session) -> None:
+    """
+    The reserve_contacts function adds count to the user's total, if the total stays within the quota.
+        The check and the increment are one statement, and the counter row stays locked until the commit,
+        so concurrent creates can't go over the quota together. The total comes first in the lock order,
+        so apply_stats can lock the other counters after it. On error the caller rolls back.
+
+    :param user_id: int: Id of the user
+    :param count: int: Number of contacts to add
+    :param quota: int: Most contacts of a user, 0 for no limit
+    :param db: Session: Pass the database session to the function
+    :return: None
+    :raises ContactsQuotaExceeded: When the total would go over the quota
+    """
+    if quota and count > quota:
+        raise ContactsQuotaExceeded()
+
+    stmt = _insert(db).values(user_id=user_id, name=TOTAL, value=count)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserStat.user_id, UserStat.name],
+        set_={"value": UserStat.value + stmt.excluded.value},
+        where=(UserStat.value + stmt.excluded.value <= quota) if quota else None,
+    ).returning(UserStat.value)
+
+    if db.execute(stmt).first() is None:
+        raise ContactsQuotaExceeded()
+
+
+def recent_days(today: date, days: int) -> List[date]:
+    return [today - timedelta(days=number) for number in range(days)]
+
+
+async def get_contacts_count(user: User, db: Session) -> int:
+    """
+    The get_contacts_count function returns the number of the user's contacts from the maintained total,
+        with one primary key lookup.
+
+    :param user: User: Get the user id
+    :param db: Session: Pass the database session to the function
+    :return: The number of contacts
+    """
+    value = db.execute(
+        select(UserStat.value).where(UserStat.user_id == user.id, UserStat.name == TOTAL)
+    ).scalar()
+    return max(value or 0, 0)
+
+
+async def get_list_counters(user: User, db: Session) -> Tuple[int, int]:
+    """
+    The get_list_counters function returns the number of the user's contacts and the write version
+        of the contacts, with one query.
+
+    :param user: User: Get the user id
+    :param db: Session: Pass the database session to the function
+    :return: The number of contacts and the write version
+    """
+    values = dict(
+        db.execute(
+            select(UserStat.name, UserStat.value).where(
+                UserStat.user_id == user.id, UserStat.name.in_([TOTAL, VERSION])
+            )
+        ).all()
+    )
+    return max(values.get(TOTAL, 0), 0), values.get(VERSION, 0)
+
+
+async def get_user_stats(user: User, db: Session, days: int = 7, today: date | None = None) -> dict:
+    """
+    The get_user_stats function returns the dashboard counts of the user: all contacts, contacts with
+        a birthday this month and contacts added in the last days. It reads days + 2 counters by primary key,
+        however many contacts the user has.
+
+    :param user: User: Get the user id
+    :param db: Session: Pass the database session to the function
+    :param days: int: Days that count as recent, today included
+    :param today: date | None: Current date, today by default
+    :return: A dictionary with total, birthdays_this_month and recently_added
+    """
+    today = today or datetime.now().date()
+    recent = [created_stat(day) for day in recent_days(today, days)]
+    month = birthday_stat(today.month)
+
+    values = dict(
+        db.execute(
+            select(UserStat.name, UserStat.value).where(
+                UserStat.user_id == user.id, UserStat.name.in_([TOTAL, month, *recent])
+            )
+        ).all()
+    )
+    return {
+        "total": max(values.get(TOTAL, 0), 0),
+        "birthdays_this_month": max(values.get(month, 0), 0),
+        "recently_added": max(sum(values.get(name, 0) for name in recent), 0),
+    }
+
+
+def reconcile_user_stats(user_id: int, db: Session, days: int = 7, today: date | None = None) -> int:
+    """
+    The reconcile_user_stats function counts the user's contacts again and repairs the counters that drifted.
+        Counters of the days older than the recent ones are removed, nothing reads them.
+        Repairs bump the write version, so counts cached with the old counters are not used anymore.
+        The counter rows are locked first, so writes committed meanwhile are neither lost nor counted twice.
+        Repairs are counted in user_stats_drift_total. The caller commits.
+
+    :param user_id: int: Id of the user
+    :param db: Session: Pass the database session to the function
+    :param days: int: Days that count as recent, today included
+    :param today: date | None: Current date, today by default
+    :return: The number of counters repaired
+    """
+    today = today or datetime.now().date()
+    since = today - timedelta(days=days - 1)
+
+    # in lock order, like the writes
+    current = dict(
+        db.execute(
+            select(UserStat.name, UserStat.value)
+            .where(UserStat.user_id == user_id)
+            .order_by(UserStat.name != TOTAL, UserStat.name)
+            .with_for_update()
+        ).all()
+    )
+    current.pop(VERSION, None)
+
+    actual = {
+        TOTAL: db.execute(select(func.count()).where(Contact.user_id == user_id)).scalar()
+    }
+    month = extract("month", Contact.birthday)
+    for number, count in db.execute(
+        select(month, func.count())
+        .where(Contact.user_id == user_id, Contact.birthday.is_not(None))
+        .group_by(month)
+    ):
+        actual[birthday_stat(int(number))] = count
+    day = func.date(Contact.created_at, type_=Date)
+    for created, count in db.execute(
+        select(day, func.count())
+        .where(Contact.user_id == user_id, Contact.created_at >= datetime.combine(since, time()))
+        .group_by(day)
+    ):
+        actual[created_stat(created)] = count
+
+    repaired = {name: value for name, value in actual.items() if current.get(name) != value}
+    drifted = [
+        name
+        for name in repaired.keys() | (current.keys() - actual.keys())
+        if current.get(name, 0) != actual.get(name, 0)
+        and not (name.startswith("created:") and name < created_stat(since))
+    ]
+
+    if repaired:
+        stmt = _insert(db).values(
+            [
+                {"user_id": user_id, "name": name, "value": value}
+                for name, value in sorted(repaired.items(), key=lambda item: lock_order(item[0]))
+            ]
+        )
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[UserStat.user_id, UserStat.name],
+                set_={"value": stmt.excluded.value},
+            )
+        )
+    stale = current.keys() - actual.keys()
+    if stale:
+        db.execute(delete(UserStat).where(UserStat.user_id == user_id, UserStat.name.in_(stale)))
+
+    if drifted:
+        apply_stats(user_id, {}, db)
+        metrics.inc("user_stats_drift_total", len(drifted))
+    return len(drifted)
@@ -16,11 +16,12 @@ from fastapi.security import (
 )
 from sqlalchemy.orm import Session
 
-from contacts_book.database.db import get_db
+from contacts_book.database.db import get_db, release_connection
 from contacts_book.schemas import UserModel, UserResponse, TokenModel, RequestEmail
 from contacts_book.repository import users as repository_users
 from contacts_book.services.auth import auth_service
 from contacts_book.services.email import send_email
+from contacts_book.services.jobs import jobs
 from contacts_book.conf import messages
 
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -40,7 +41,7 @@ async def signup(
     The signup function creates a new user in the database.
     
     :param body: UserModel: Validate the request body against the usermodel schema
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks
+    :param background_tasks: BackgroundTasks: Send the email without Redis, when it can't be enqueued
     :param request: Request: Get the base url of the server
     :param db: Session: Get the database session
     :param : Get the user's email address
@@ -53,12 +54,14 @@ async def signup(
             status_code=status.HTTP_409_CONFLICT, detail=messages.ACCOUNT_ALREADY_EXISTS
         )
 
+    # don't hold a pooled connection while bcrypt runs
+    release_connection(db)
     body.password = auth_service.get_password_hash(body.password)
 
     new_user = await repository_users.create_user(body, db)
 
-    background_tasks.add_task(
-        send_email, new_user.email, new_user.username, request.base_url
+    await jobs.submit(
+        background_tasks, send_email, new_user.email, new_user.username, str(request.base_url)
     )
 
     return {"user": new_user, "detail": messages.USER_SUCCESSFULLY__CREATED}
@@ -89,6 +92,7 @@ async def login(
             status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.EMAIL_NOT_CONFIRMED
         )
 
+    release_connection(db)
     if not auth_service.verify_password(body.password, user.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.INVALID_PASSWORD
@@ -187,7 +191,7 @@ async def request_email(
     the send_email function from utils/mailer.py.
     
     :param body: RequestEmail: Pass the email address to the function
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
+    :param background_tasks: BackgroundTasks: Send the email without Redis, when it can't be enqueued
     :param request: Request: Get the base_url of the server
     :param db: Session: Get the database session
     :param : Get the user's email address
@@ -198,7 +202,7 @@ async def request_email(
     if user:
         if user.confirmed:
             return {"message": messages.YOUR_EMAIL_IS_ALREADY_CONFIRM}
-        background_tasks.add_task(
-            send_email, user.email, user.username, str(request.base_url)
+        await jobs.submit(
+            background_tasks, send_email, user.email, user.username, str(request.base_url)
         )
     return {"message": messages.CHECK_YOUR_EMAIL}
@@ -1,71 +1,308 @@
-from typing import List
+import asyncio
+import json
+from typing import List, Tuple
 
-from fastapi import APIRouter, HTTPException, Depends, status, Path, Query
+from fastapi import APIRouter, HTTPException, Depends, status, Path, Query, Response, Request, Header
+from fastapi.responses import StreamingResponse
 from fastapi_limiter.depends import RateLimiter
 from sqlalchemy.orm import Session
 
-from contacts_book.database.db import get_db
+from contacts_book.database.db import get_db, get_read_db
+from contacts_book.database.deadlines import Deadline
 from contacts_book.database.models import User
-from contacts_book.schemas import ContactModel, ContactResponce
+from contacts_book.schemas import (
+    ContactBatchGetResponse,
+    ContactBatchResult,
+    ContactBatchUpdate,
+    ContactIds,
+    ContactMerge,
+    ContactModel,
+    ContactResponce,
+    ContactSort,
+    ContactStatsResponse,
+    ContactSuggestion,
+    DuplicatesResponse,
+    JobResponse,
+)
 from contacts_book.repository import contacts as repository_contacts
+from contacts_book.repository import stats as repository_stats
 from contacts_book.services.auth import auth_service
+from contacts_book.services.change_feed import change_feed
+from contacts_book.services.dedup import get_duplicates_search, start_duplicates_search
+from contacts_book.services.list_count import list_count
+from contacts_book.services.content_negotiation import (
+    MsgPackRoute,
+    negotiated_response,
+)
+from contacts_book.services.rate_limit import WeightedRateLimiter
+from contacts_book.services.jobs import jobs
+from contacts_book.services.redis_pool import get_redis
 from contacts_book.conf import messages
+from contacts_book.conf.config import settings
+
+router = APIRouter(prefix="/contacts", tags=["Contacts"], route_class=MsgPackRoute)
+
+# batch endpoints spend one hit per item
+batch_limiter = WeightedRateLimiter(times=100, seconds=60)
+
+
+def contact_event(event: str, contact) -> Tuple[str, str]:
+    """
+    The contact_event function returns the change feed event of a created or updated contact.
+
+    :param event: str: Event type
+    :param contact: Contact: The contact
+    :return: The event type and its JSON data
+    """
+    return event, ContactResponce.model_validate(contact).model_dump_json()
+
+
+def deleted_event(contact_id: int) -> Tuple[str, str]:
+    """
+    The deleted_event function returns the change feed event of a deleted contact.
 
-router = APIRouter(prefix="/contacts", tags=["Contacts"])
+    :param contact_id: int: Id of the deleted contact
+    :return: The event type and its JSON data
+    """
+    return "contact.deleted", json.dumps({"id": contact_id})
 
 
 @router.get(
     "/",
     response_model=List[ContactResponce],
     description="No more than 10 requests per minute",
-    dependencies=[Depends(RateLimiter(times=10, seconds=60))],
+    dependencies=[Depends(RateLimiter(times=10, seconds=60)), Depends(Deadline(settings.db_read_deadline))],
     name="Read contacts",
 )
 async def get_contacts(
+    request: Request,
     limit: int = Query(10, le=100),
     offset: int = 0,
     search: str | None = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(auth_service.get_current_user),
+    sort: ContactSort = ContactSort.name,
+    count: bool = False,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(auth_service.get_current_reader),
 ):
     """
-    The get_contacts function returns a list of contacts.
+    The get_contacts function returns a list of contacts, as JSON or as MessagePack for Accept: application/msgpack.
+        Contacts are sorted by name, created_at, updated_at or birthday (month and day); "-" sorts descending.
+        With count=true the X-Total-Count header has the number of matching contacts; for searches in big books
+        it is estimated, and X-Total-Count-Estimated is true.
     
+    :param request: Request: Get the Accept header
     :param limit: int: Limit the number of contacts returned
     :param le: Limit the number of contacts returned to 100
     :param offset: int: Specify the number of records to skip before returning results
     :param search: str | None: Search for contacts by name
+    :param sort: ContactSort: Sort order of the contacts
+    :param count: bool: Add the X-Total-Count header
     :param db: Session: Pass the database session to the repository layer
     :param current_user: User: Get the current user from the database
     :param : Limit the number of contacts returned
     :return: A list of contacts
     """
-    return await repository_contacts.get_contacts(
-        limit, offset, search, current_user, db
+    # column rows are encoded as they are, without ORM objects and pydantic models
+    rows = await repository_contacts.get_contact_rows(
+        limit, offset, search, current_user, db, sort
     )
+    response = negotiated_response(request, rows)
+    if count:
+        total, estimated = await list_count.get_total(search, current_user, db)
+        response.headers["X-Total-Count"] = str(total)
+        if estimated:
+            response.headers["X-Total-Count-Estimated"] = "true"
+    return response
 
 
 @router.get(
     "/upcoming_birthdays",
+    response_model=List[ContactResponce],
     description="No more than 10 requests per minute",
-    dependencies=[Depends(RateLimiter(times=10, seconds=60))],
+    dependencies=[Depends(RateLimiter(times=10, seconds=60)), Depends(Deadline(settings.db_read_deadline))],
     name="Upcoming birthdays",
 )
 async def get_upcoming_birthdays(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(auth_service.get_current_user),
+    request: Request,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(auth_service.get_current_reader),
 ):
     """
     The get_contact function returns a list of contacts that have upcoming birthdays.
         The current_user is passed in as an argument to the function, and then used to query the database for all contacts associated with that user.
         The get_upcoming_birthdays function from repository/contacts.py is called, which queries the database for all contacts whose birthday falls within 7 days of today's date.
     
+    :param request: Request: Get the Accept header
     :param db: Session: Get the database session
     :param current_user: User: Get the current user's id
     :param : Get the current user and the db parameter is used to get a database connection
     :return: A list of contacts
     """
-    return await repository_contacts.get_upcoming_birthdays(current_user, db)
+    # column rows, shared by identical concurrent calls
+    rows = await repository_contacts.get_upcoming_birthday_rows(current_user, db)
+    return negotiated_response(request, rows)
+
+
+@router.get(
+    "/stats",
+    response_model=ContactStatsResponse,
+    description="No more than 10 requests per minute",
+    dependencies=[Depends(RateLimiter(times=10, seconds=60))],
+    name="Contacts stats",
+)
+async def get_contacts_stats(
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(auth_service.get_current_reader),
+):
+    """
+    The get_contacts_stats function returns the dashboard counts of the user: all contacts, contacts with
+        a birthday this month and contacts added in the last STATS_RECENT_DAYS days, with the quota.
+        The counts are read from the user's maintained stats, not counted.
+
+    :param db: Session: Pass the database session to the repository layer
+    :param current_user: User: Get the current user from the database
+    :return: A dictionary with the counts
+    """
+    stats = await repository_stats.get_user_stats(current_user, db, settings.stats_recent_days)
+    return {
+        **stats,
+        "recent_days": settings.stats_recent_days,
+        "quota": settings.contacts_quota or None,
+    }
+
+
+@router.get(
+    "/duplicates",
+    response_model=DuplicatesResponse,
+    description="No more than 10 requests per minute",
+    dependencies=[Depends(RateLimiter(times=10, seconds=60)), Depends(get_redis)],
+    name="Duplicate contacts",
+)
+async def get_duplicates(
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(auth_service.get_current_reader),
+):
+    """
+    The get_duplicates function returns the result of the user's latest duplicates search:
+        groups of contact ids that are likely the same person, with their score. While the search runs
+        the groups are empty; stale is true when the contacts changed after the search.
+
+    :param db: Session: Pass the database session to the repository layer
+    :param current_user: User: Get the current user from the database
+    :return: The status of the search and the groups
+    """
+    job = await get_duplicates_search(current_user)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=messages.DUPLICATES_SEARCH_NOT_FOUND
+        )
+
+    result = job["result"] or {}
+    response = {"job_id": job["id"], "status": job["status"], **result}
+    if "version" in result:
+        _, version = await repository_stats.get_list_counters(current_user, db)
+        response["stale"] = version != result["version"]
+    return response
+
+
+@router.get(
+    "/autocomplete",
+    response_model=List[ContactSuggestion],
+    description="No more than 120 requests per minute",
+    dependencies=[Depends(RateLimiter(times=120, seconds=60)), Depends(Deadline(settings.db_read_deadline))],
+    name="Autocomplete contacts",
+)
+async def autocomplete_contacts(
+    request: Request,
+    q: str = Query(min_length=1, max_length=50),
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(auth_service.get_current_reader),
+):
+    """
+    The autocomplete_contacts function is the type-ahead of the contacts: it returns the first contacts
+        whose firstname, lastname or email starts with q. Unlike the search of the contacts list,
+        it reads an index instead of scanning the book, so it can be called on every keystroke.
+
+    :param request: Request: Get the Accept header
+    :param q: str: What the user has typed
+    :param limit: int: Number of contacts returned
+    :param db: Session: Pass the database session to the repository layer
+    :param current_user: User: Get the current user from the database
+    :return: A list of contact suggestions
+    """
+    rows = await repository_contacts.autocomplete_contacts(q, limit, current_user, db)
+    return negotiated_response(request, rows)
+
+
+@router.get(
+    "/lookup",
+    response_model=List[ContactResponce],
+    description="No more than 30 requests per minute",
+    dependencies=[Depends(RateLimiter(times=30, seconds=60))],
+    name="Find contacts by phone",
+)
+async def lookup_phone(
+    request: Request,
+    phone: str = Query(min_length=1, max_length=32),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(auth_service.get_current_reader),
+):
+    """
+    The lookup_phone function answers "who is this number?": it returns the user's contacts with the phone,
+        in whatever format the phone was saved or is asked, with one query on the E.164 index.
+
+    :param request: Request: Get the Accept header
+    :param phone: str: Phone in any format, like +380 66 111 1111 or 066-111-11-11
+    :param db: Session: Pass the database session to the repository layer
+    :param current_user: User: Get the current user from the database
+    :return: A list of contacts
+    """
+    e164 = repository_contacts.phone_e164(phone)
+    if e164 is None:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=messages.INVALID_PHONE
+        )
+    rows = await repository_contacts.get_contact_rows_by_phone(e164, current_user, db)
+    return negotiated_response(request, rows)
+
+
+@router.get(
+    "/events",
+    description="No more than 10 connections per minute",
+    dependencies=[Depends(RateLimiter(times=10, seconds=60))],
+    name="Contact changes",
+    response_class=StreamingResponse,
+)
+async def get_contact_events(
+    last_event_id: str | None = Header(None),
+    current_user: User = Depends(auth_service.get_current_reader),
+):
+    """
+    The get_contact_events function streams the changes of the user's contacts as Server-Sent Events:
+        contact.created, contact.updated and contact.deleted. A client that reconnects with Last-Event-ID
+        gets the events it missed; a reset event means they are gone and the contacts should be reloaded.
+
+    :param last_event_id: str | None: Id of the last event the client got
+    :param current_user: User: Get the current user
+    :return: A text/event-stream response
+    """
+    if change_feed.redis is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Redis is not connected"
+        )
+    try:
+        await change_feed.start()
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Change feed is not available"
+        )
+
+    return StreamingResponse(
+        change_feed.stream(current_user.id, last_event_id, settings.change_feed_heartbeat),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.get(
@@ -77,8 +314,8 @@ async def get_upcoming_birthdays(
 )
 async def get_contact(
     contact_id: int = Path(ge=1),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(auth_service.get_current_user),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(auth_service.get_current_reader),
 ):
     """
     The get_contact function returns a contact by its id.
@@ -114,6 +351,7 @@ async def create_contact(
 ):
     """
     The create_contact function creates a new contact in the database.
+        A user that has CONTACTS_QUOTA contacts already gets 403.
     
     :param body: ContactModel: Get the data from the request body
     :param db: Session: Pass the database session to the function
@@ -131,7 +369,16 @@ async def create_contact(
             detail=messages.CONTACT_ALREADY_AXISTS,
         )
 
-    contact = await repository_contacts.create_contact(body, current_user, db)
+    try:
+        contact = await repository_contacts.create_contact(
+            body, current_user, db, settings.contacts_quota
+        )
+    except repository_stats.ContactsQuotaExceeded:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=messages.CONTACTS_QUOTA_EXCEEDED,
+        )
+    await change_feed.publish(current_user.id, [contact_event("contact.created", contact)])
 
     return contact
 
@@ -160,10 +407,10 @@ async def update_contact(
     :return: A contactmodel object
     """
     contact = await repository_contacts.get_contact_by_unique_fields(
-        body, current_user, db
+        body, current_user, db, exclude_id=contact_id
     )
 
-    if contact and contact.id != contact_id:
+    if contact:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail=messages.CONTACT_ALREADY_AXISTS,
@@ -178,6 +425,7 @@ async def update_contact(
             status_code=status.HTTP_404_NOT_FOUND, detail=messages.CONTACT_NOT_FOUND
         )
 
+    await change_feed.publish(current_user.id, [contact_event("contact.updated", contact)])
     return contact
 
 
@@ -210,4 +458,220 @@ async def delete_contact(
             status_code=status.HTTP_404_NOT_FOUND, detail=messages.CONTACT_NOT_FOUND
         )
 
+    await change_feed.publish(current_user.id, [deleted_event(contact_id)])
     return contact
+
+
+@router.post(
+    "/duplicates",
+    response_model=JobResponse,
+    description="No more than 2 requests per minute",
+    dependencies=[Depends(RateLimiter(times=2, seconds=60)), Depends(get_redis)],
+    name="Find duplicate contacts",
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def find_duplicates(current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The find_duplicates function starts a search for duplicate contacts of the user, as a job.
+        Its result is read with GET /duplicates, its progress with GET /api/jobs/{job_id}.
+
+    :param current_user: User: Get the current user from the database
+    :return: The job
+    """
+    job_id = await start_duplicates_search(current_user)
+    return await jobs.get(job_id)
+
+
+@router.post(
+    "/merge",
+    response_model=ContactResponce,
+    description="No more than 10 requests per minute",
+    dependencies=[Depends(RateLimiter(times=10, seconds=30))],
+    name="Merge contacts",
+)
+async def merge_contacts(
+    body: ContactMerge,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_user),
+):
+    """
+    The merge_contacts function merges duplicate contacts into the target contact: the target takes
+        the empty fields from the sources and the sources are deleted. All the contacts must exist.
+
+    :param body: ContactMerge: Id of the contact that is kept and ids of its duplicates
+    :param db: Session: Pass the database session to the repository layer
+    :param current_user: User: Get the current user from the database
+    :return: The merged contact
+    """
+    source_ids = [contact_id for contact_id in dict.fromkeys(body.source_ids) if contact_id != body.target_id]
+    contacts = {
+        contact.id: contact
+        for contact in await repository_contacts.get_contacts_by_ids(
+            [body.target_id, *source_ids], current_user, db
+        )
+    }
+    if not source_ids:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=messages.NOTHING_TO_MERGE
+        )
+    if len(contacts) != len(source_ids) + 1:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=messages.CONTACT_NOT_FOUND
+        )
+
+    contact = await repository_contacts.merge_contacts(
+        contacts[body.target_id], [contacts[contact_id] for contact_id in source_ids], current_user, db
+    )
+    await change_feed.publish(
+        current_user.id,
+        [*(deleted_event(contact_id) for contact_id in source_ids), contact_event("contact.updated", contact)],
+    )
+    return contact
+
+
+@router.post(
+    "/batch_get",
+    response_model=ContactBatchGetResponse,
+    description="No more than 100 contacts per minute",
+    name="Read contacts by ids",
+)
+async def batch_get_contacts(
+    body: ContactIds,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(auth_service.get_current_reader),
+):
+    """
+    The batch_get_contacts function returns the contacts with the given ids, in the order of the ids,
+        loaded with one IN query. Ids that are not found are returned in missing.
+
+    :param body: ContactIds: Ids of the contacts
+    :param request: Request: Get the Accept header and the rate limit key
+    :param response: Response: Response of the rate limiter
+    :param db: Session: Pass the database session to the repository layer
+    :param current_user: User: Get the current user from the database
+    :return: A dictionary with the found contacts and the missing ids
+    """
+    await batch_limiter.hit(request, response, len(body.ids))
+
+    rows = await repository_contacts.get_contact_rows_by_ids(body.ids, current_user, db)
+    found = {row["id"]: row for row in rows}
+    ids = list(dict.fromkeys(body.ids))
+    return negotiated_response(
+        request,
+        {
+            "contacts": [found[contact_id] for contact_id in ids if contact_id in found],
+            "missing": [contact_id for contact_id in ids if contact_id not in found],
+        },
+    )
+
+
+@router.post(
+    "/batch_update",
+    response_model=List[ContactBatchResult],
+    description="No more than 100 contacts per minute",
+    name="Update contacts",
+)
+async def batch_update_contacts(
+    body: ContactBatchUpdate,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_user),
+):
+    """
+    The batch_update_contacts function updates many contacts in one transaction.
+        Every item gets its own result: 200 with the updated contact, 404 if the contact is not found,
+        409 if its phone or email belongs to another contact or to an earlier item of the batch.
+        Items that fail are skipped, the others are committed together.
+
+    :param body: ContactBatchUpdate: Contacts with their ids and new data
+    :param request: Request: Get the rate limit key
+    :param response: Response: Response of the rate limiter
+    :param db: Session: Pass the database session to the repository layer
+    :param current_user: User: Get the current user from the database
+    :return: A list of results, in the order of the items
+    """
+    await batch_limiter.hit(request, response, len(body.items))
+
+    contacts = {
+        contact.id: contact
+        for contact in await repository_contacts.get_contacts_by_ids(
+            [item.id for item in body.items], current_user, db
+        )
+    }
+    owners = {}
+    for contact in await repository_contacts.get_contacts_by_unique_fields(
+        body.items, current_user, db
+    ):
+        owners[("phone", contact.phone_e164 or contact.phone)] = contact.id
+        owners[("email", contact.email)] = contact.id
+
+    results, changes = [], []
+    for item in body.items:
+        keys = (("phone", repository_contacts.phone_e164(item.phone) or item.phone), ("email", item.email))
+        if item.id not in contacts:
+            results.append(
+                {"id": item.id, "status": status.HTTP_404_NOT_FOUND, "detail": messages.CONTACT_NOT_FOUND}
+            )
+        elif any(owners.get(key, item.id) != item.id for key in keys):
+            results.append(
+                {"id": item.id, "status": status.HTTP_409_CONFLICT, "detail": messages.CONTACT_ALREADY_AXISTS}
+            )
+        else:
+            # later items can't take the phone or email of this one
+            owners.update((key, item.id) for key in keys)
+            changes.append((contacts[item.id], item))
+            results.append({"id": item.id, "status": status.HTTP_200_OK})
+
+    updated = {
+        contact.id: contact
+        for contact in await repository_contacts.update_contacts(changes, db)
+    }
+    for result in results:
+        if result["status"] == status.HTTP_200_OK:
+            result["contact"] = updated[result["id"]]
+    await change_feed.publish(
+        current_user.id, [contact_event("contact.updated", contact) for contact in updated.values()]
+    )
+
+    return results
+
+
+@router.post(
+    "/batch_delete",
+    response_model=List[ContactBatchResult],
+    description="No more than 100 contacts per minute",
+    name="Delete contacts",
+)
+async def batch_delete_contacts(
+    body: ContactIds,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_user),
+):
+    """
+    The batch_delete_contacts function deletes the contacts with the given ids with one DELETE statement.
+        Every id gets its own result: 200 if the contact was deleted, 404 if it was not found.
+
+    :param body: ContactIds: Ids of the contacts
+    :param request: Request: Get the rate limit key
+    :param response: Response: Response of the rate limiter
+    :param db: Session: Pass the database session to the repository layer
+    :param current_user: User: Get the current user from the database
+    :return: A list of results, in the order of the ids
+    """
+    await batch_limiter.hit(request, response, len(body.ids))
+
+    deleted_ids = await repository_contacts.delete_contacts(body.ids, current_user, db)
+    await change_feed.publish(current_user.id, [deleted_event(contact_id) for contact_id in deleted_ids])
+    deleted = set(deleted_ids)
+
+    return [
+        {"id": contact_id, "status": status.HTTP_200_OK}
+        if contact_id in deleted
+        else {"id": contact_id, "status": status.HTTP_404_NOT_FOUND, "detail": messages.CONTACT_NOT_FOUND}
+        for contact_id in dict.fromkeys(body.ids)
+    ]
@@ -0,0 +1,164 @@
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+
+from contacts_book.database.db import get_engine, get_replica_router, open_sessions, pool_status
+from contacts_book.database.models import User
+from contacts_book.services.auth import auth_service
+from contacts_book.services.loop_watchdog import loop_watchdog
+from contacts_book.services.memory import memory_profiler, session_stats
+from contacts_book.services.metrics import metrics
+from contacts_book.services.redis_pool import redis_pool
+
+router = APIRouter(prefix="/diagnostics", tags=["diagnostics"])
+
+
+@router.get("/pool")
+async def get_pool_status(current_user: User = Depends(auth_service.get_current_admin)):
+    """
+    The get_pool_status function returns live statistics of the database connection pool:
+        connections checked out, overflow in use and time spent waiting for a connection.
+
+    :param current_user: User: Get the current admin
+    :return: A dictionary with pool statistics
+    """
+    return pool_status(get_engine())
+
+
+@router.get("/replicas")
+async def get_replicas_status(current_user: User = Depends(auth_service.get_current_admin)):
+    """
+    The get_replicas_status function returns the last health check result of every read replica.
+
+    :param current_user: User: Get the current admin
+    :return: A list of dictionaries with replica health
+    """
+    return get_replica_router().status()
+
+
+@router.get("/redis")
+async def get_redis_status(current_user: User = Depends(auth_service.get_current_admin)):
+    """
+    The get_redis_status function returns the usage of the shared Redis connection pool.
+
+    :param current_user: User: Get the current admin
+    :return: A dictionary with the pool usage
+    """
+    return redis_pool.stats()
+
+
+@router.get("/event_loop")
+async def get_event_loop_blocks(current_user: User = Depends(auth_service.get_current_admin)):
+    """
+    The get_event_loop_blocks function returns the latest event loop blocks found by the loop watchdog,
+        with their duration, route and the stack of the blocking code.
+
+    :param current_user: User: Get the current admin
+    :return: A list of blocks, newest last
+    """
+    return list(loop_watchdog.blocks)
+
+
+@router.get("/memory")
+async def get_memory_status(current_user: User = Depends(auth_service.get_current_admin)):
+    """
+    The get_memory_status function returns whether tracemalloc is tracing, the traced memory and the snapshot ids.
+
+    :param current_user: User: Get the current admin
+    :return: A dictionary with the tracing state
+    """
+    return memory_profiler.status()
+
+
+@router.post("/memory/start")
+async def start_memory_tracing(
+    frames: int = Query(1, ge=1, le=50),
+    current_user: User = Depends(auth_service.get_current_admin),
+):
+    """
+    The start_memory_tracing function starts tracemalloc in this worker. Tracing slows down every allocation,
+        so stop it when the investigation is over.
+
+    :param frames: int: Number of frames stored per allocation
+    :param current_user: User: Get the current admin
+    :return: A dictionary with the tracing state
+    """
+    return memory_profiler.start(frames)
+
+
+@router.post("/memory/stop")
+async def stop_memory_tracing(current_user: User = Depends(auth_service.get_current_admin)):
+    """
+    The stop_memory_tracing function stops tracemalloc and drops the snapshots.
+
+    :param current_user: User: Get the current admin
+    :return: A dictionary with the tracing state
+    """
+    return memory_profiler.stop()
+
+
+# snapshots and diffs take a while on a big heap, so these handlers run in the threadpool
+@router.post("/memory/snapshots")
+def take_memory_snapshot(
+    limit: int = Query(10, ge=1, le=100),
+    current_user: User = Depends(auth_service.get_current_admin),
+):
+    """
+    The take_memory_snapshot function takes a tracemalloc snapshot and returns its id and biggest allocations by line.
+
+    :param limit: int: Number of lines to return
+    :param current_user: User: Get the current admin
+    :return: A dictionary with the snapshot id and the top lines
+    """
+    try:
+        return memory_profiler.take_snapshot(limit)
+    except RuntimeError as err:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(err))
+
+
+@router.get("/memory/snapshots/{first_id}/diff/{second_id}")
+def diff_memory_snapshots(
+    first_id: int,
+    second_id: int,
+    group_by: Literal["filename", "lineno"] = "lineno",
+    limit: int = Query(20, ge=1, le=200),
+    current_user: User = Depends(auth_service.get_current_admin),
+):
+    """
+    The diff_memory_snapshots function compares two snapshots grouped by file or by line, largest growth first.
+
+    :param first_id: int: Id of the older snapshot
+    :param second_id: int: Id of the newer snapshot
+    :param group_by: str: filename or lineno
+    :param limit: int: Number of entries to return
+    :param current_user: User: Get the current admin
+    :return: A list of dictionaries with the size and count differences
+    """
+    try:
+        return memory_profiler.diff(first_id, second_id, group_by, limit)
+    except KeyError as err:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Snapshot {err} not found")
+
+
+@router.get("/memory/sessions")
+async def get_session_identity_maps(current_user: User = Depends(auth_service.get_current_admin)):
+    """
+    The get_session_identity_maps function returns the number of ORM objects held by every open request session,
+        by type. A big identity map means a handler loads more rows than it needs.
+
+    :param current_user: User: Get the current admin
+    :return: A list of dictionaries, biggest identity map first
+    """
+    return session_stats(open_sessions)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    The get_metrics function returns the metrics of this worker in the Prometheus text format.
+        It has no authentication, so Prometheus can scrape it; the metrics hold no user data.
+
+    :return: Metrics as text
+    """
+    return metrics.render()
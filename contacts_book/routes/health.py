@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends, Response, status
+
+from contacts_book.services.health import HealthChecker, get_health_checker
+
+router = APIRouter(prefix="/health", tags=["health"])
+
+
+@router.get("/live")
+async def liveness():
+    """
+    The liveness function answers the liveness probe. It does no I/O: if the event loop
+    can run this handler, the process is alive.
+
+    :return: A dictionary with the status
+    """
+    return {"status": "ok"}
+
+
+@router.get("/ready")
+async def readiness(response: Response, health_checker: HealthChecker = Depends(get_health_checker)):
+    """
+    The readiness function answers the readiness probe with the cached state of the database,
+    Redis and the connection pool. It returns 503 while the database or Redis is unavailable.
+
+    :param response: Response: Set the status code of the response
+    :param health_checker: HealthChecker: Readiness checker of the application
+    :return: A dictionary with the result of every check
+    """
+    result = await health_checker.get_readiness()
+    if not result["ready"]:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return result
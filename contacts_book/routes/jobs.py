@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from contacts_book.conf import messages
+from contacts_book.database.models import User
+from contacts_book.schemas import JobResponse
+from contacts_book.services.auth import auth_service
+from contacts_book.services.jobs import jobs
+from contacts_book.services.redis_pool import get_redis
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+@router.get("/{job_id}", response_model=JobResponse, dependencies=[Depends(get_redis)])
+async def get_job(job_id: str, current_user: User = Depends(auth_service.get_current_reader)):
+    """
+    The get_job function returns the status, progress and result of a job of the current user.
+        Finished jobs are kept for JOBS_RESULT_TTL seconds.
+
+    :param job_id: str: Job id returned when the job was started
+    :param current_user: User: Get the current user
+    :return: The job
+    """
+    job = await jobs.get(job_id)
+    if job is None or job["user_id"] != current_user.id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=messages.JOB_NOT_FOUND)
+    return job
@@ -1,7 +1,6 @@
 from fastapi import APIRouter, Depends, status, UploadFile, File
 from sqlalchemy.orm import Session
-import cloudinary
-import cloudinary.uploader
+from starlette.concurrency import run_in_threadpool
 
 from contacts_book.database.db import get_db
 from contacts_book.database.models import User
@@ -15,7 +14,7 @@ router = APIRouter(prefix="/users", tags=["users"])
 
 
 @router.get("/me/", response_model=UserDb)
-async def read_users_me(current_user: User = Depends(auth_service.get_current_user)):
+async def read_users_me(current_user: User = Depends(auth_service.get_current_reader)):
     """
     The read_users_me function returns the current user's information.
         ---
@@ -46,8 +45,10 @@ async def update_avatar_user(file: UploadFile = File(), current_user: User = Dep
     :param db: Session: Get the database session
     :return: The user object
     """
+    # current_user is loaded with the connection already released, so the upload runs without a pooled connection;
+    # the cloudinary client is blocking, so it runs in the threadpool
     public_id = CloudImage.generate_name_avatar(current_user.email)
-    r = CloudImage.upload(file.file, public_id)
+    r = await run_in_threadpool(CloudImage.upload, file.file, public_id)
     src_url = CloudImage.get_url_for_avatar(public_id, r)
     user = await repository_users.update_avatar(current_user.email, src_url, db)
     return user
\ No newline at end of file
@@ -1,4 +1,7 @@
 from datetime import datetime
+from enum import Enum
+from typing import Any, List
+
 from pydantic import BaseModel, Field, EmailStr
 
 
@@ -24,6 +27,68 @@ class ContactResponce(ContactModel):
         from_attributes = True
 
 
+class ContactSort(str, Enum):
+    """
+    Orders of the contacts list; "-" sorts descending. Every order has an index in the contacts table.
+    """
+
+    name = "name"
+    name_desc = "-name"
+    created_at = "created_at"
+    created_at_desc = "-created_at"
+    updated_at = "updated_at"
+    updated_at_desc = "-updated_at"
+    birthday = "birthday"
+    birthday_desc = "-birthday"
+
+
+BATCH_MAX_SIZE = 100
+
+
+class ContactIds(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=BATCH_MAX_SIZE)
+
+
+class ContactBatchItem(ContactModel):
+    id: int = Field(ge=1)
+
+
+class ContactSuggestion(BaseModel):
+    id: int
+    firstname: str
+    lastname: str | None = None
+    email: str | None = None
+
+
+class ContactBatchUpdate(BaseModel):
+    items: List[ContactBatchItem] = Field(min_length=1, max_length=BATCH_MAX_SIZE)
+
+
+class ContactBatchGetResponse(BaseModel):
+    contacts: List[ContactResponce]
+    missing: List[int]
+
+
+class ContactBatchResult(BaseModel):
+    id: int
+    status: int
+    detail: str | None = None
+    contact: ContactResponce | None = None
+
+
+class ContactStatsResponse(BaseModel):
+    total: int
+    birthdays_this_month: int
+    recently_added: int
+    recent_days: int
+    quota: int | None = None
+
+
+class ContactMerge(BaseModel):
+    target_id: int = Field(ge=1)
+    source_ids: List[int] = Field(min_length=1, max_length=BATCH_MAX_SIZE)
+
+
 # Users
 class UserModel(BaseModel):
     username: str = Field(min_length=5, max_length=16)
@@ -55,3 +120,41 @@ class TokenModel(BaseModel):
 
 class RequestEmail(BaseModel):
     email: EmailStr
+
+
+# Jobs
+class JobStatus(str, Enum):
+    queued = "queued"
+    running = "running"
+    retrying = "retrying"
+    succeeded = "succeeded"
+    failed = "failed"
+
+
+class JobResponse(BaseModel):
+    id: str
+    task: str
+    queue: str
+    status: JobStatus
+    attempts: int
+    max_retries: int
+    progress: Any = None
+    result: Any = None
+    error: str | None = None
+    created_at: datetime
+    scheduled_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+
+
+class DuplicateGroup(BaseModel):
+    score: float
+    ids: List[int]
+
+
+class DuplicatesResponse(BaseModel):
+    job_id: str
+    status: JobStatus
+    stale: bool = False
+    contacts: int | None = None
+    groups: List[DuplicateGroup] = []
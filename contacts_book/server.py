@@ -0,0 +1,185 @@
+"""
+Production server entry point.
+
+    python -m contacts_book.server
+
+Without preload and worker pinning the app runs on uvicorn with its own worker processes. With
+``SERVER_PRELOAD`` or ``SERVER_PIN_WORKERS`` it runs on gunicorn (the ``server`` extra) with uvicorn workers,
+because only gunicorn can import the app once in the master and fork the workers from it.
+"""
+import os
+
+from contacts_book.conf.config import Settings, settings
+
+APP = "main:app"
+
+
+def available_cpus() -> int:
+    """
+    The available_cpus function returns the number of CPUs this process may run on (cgroup/affinity aware).
+
+    :return: Number of CPUs
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def worker_count(app_settings: Settings = settings) -> int:
+    """
+    The worker_count function returns SERVER_WORKERS, or one worker per available CPU when it is 0.
+        Workers are async, so one per core keeps every core busy without extra context switches.
+
+    :param app_settings: Settings: Server settings
+    :return: Number of worker processes
+    """
+    return app_settings.server_workers or available_cpus()
+
+
+def event_loop(app_settings: Settings = settings) -> str:
+    """
+    The event_loop function returns uvloop if it is installed and asked for, asyncio otherwise.
+
+    :param app_settings: Settings: Server settings
+    :return: Name of the event loop implementation for uvicorn
+    """
+    if app_settings.server_loop != "uvloop":
+        return app_settings.server_loop
+    try:
+        import uvloop  # noqa: F401
+    except ImportError:
+        return "asyncio"
+    return "uvloop"
+
+
+def http_protocol(app_settings: Settings = settings) -> str:
+    """
+    The http_protocol function returns httptools if it is installed and asked for, h11 otherwise.
+
+    :param app_settings: Settings: Server settings
+    :return: Name of the HTTP protocol implementation for uvicorn
+    """
+    if app_settings.server_http != "httptools":
+        return app_settings.server_http
+    try:
+        import httptools  # noqa: F401
+    except ImportError:
+        return "h11"
+    return "httptools"
+
+
+def uvicorn_options(app_settings: Settings = settings) -> dict:
+    """
+    The uvicorn_options function returns the uvicorn options built from the settings.
+
+    :param app_settings: Settings: Server settings
+    :return: A dictionary of uvicorn.run keyword arguments
+    """
+    return {
+        "host": app_settings.server_host,
+        "port": app_settings.server_port,
+        "workers": worker_count(app_settings),
+        "loop": event_loop(app_settings),
+        "http": http_protocol(app_settings),
+        "backlog": app_settings.server_backlog,
+        "timeout_keep_alive": app_settings.server_keep_alive,
+        "timeout_graceful_shutdown": app_settings.server_graceful_timeout,
+        "access_log": app_settings.server_access_log,
+        "proxy_headers": True,
+    }
+
+
+def gunicorn_options(app_settings: Settings = settings) -> dict:
+    """
+    The gunicorn_options function returns the gunicorn config for the uvicorn workers.
+
+    :param app_settings: Settings: Server settings
+    :return: A dictionary of gunicorn settings
+    """
+    loop, http = event_loop(app_settings), http_protocol(app_settings)
+    worker_class = (
+        "uvicorn.workers.UvicornWorker"
+        if (loop, http) == ("uvloop", "httptools")
+        else "uvicorn.workers.UvicornH11Worker"
+    )
+    options = {
+        "bind": f"{app_settings.server_host}:{app_settings.server_port}",
+        "workers": worker_count(app_settings),
+        "worker_class": worker_class,
+        "preload_app": app_settings.server_preload,
+        "backlog": app_settings.server_backlog,
+        "keepalive": app_settings.server_keep_alive,
+        "graceful_timeout": app_settings.server_graceful_timeout,
+        "accesslog": "-" if app_settings.server_access_log else None,
+    }
+    if app_settings.server_pin_workers:
+        options["post_fork"] = pin_worker
+    return options
+
+
+def pin_worker(server, worker) -> None:
+    """
+    The pin_worker function is the gunicorn post_fork hook that pins every worker to one CPU, round robin.
+
+    :param server: Gunicorn arbiter
+    :param worker: Gunicorn worker
+    :return: None
+    """
+    cpus = sorted(os.sched_getaffinity(0))
+    cpu = cpus[worker.age % len(cpus)]
+    os.sched_setaffinity(0, {cpu})
+    server.log.info("Worker %s pinned to CPU %s", worker.pid, cpu)
+
+
+def run_gunicorn(app_settings: Settings = settings) -> None:
+    """
+    The run_gunicorn function runs the app on gunicorn with uvicorn workers.
+        With preload the app is imported in the master; engines and Redis are created lazily
+        or in the lifespan, so no connection is shared by the forked workers.
+
+    :param app_settings: Settings: Server settings
+    :return: None
+    """
+    from gunicorn.app.base import BaseApplication
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for key, value in gunicorn_options(app_settings).items():
+                if value is not None:
+                    self.cfg.set(key, value)
+
+        def load(self):
+            from main import app
+
+            return app
+
+    Application().run()
+
+
+def run_uvicorn(app_settings: Settings = settings) -> None:
+    """
+    The run_uvicorn function runs the app on uvicorn.
+
+    :param app_settings: Settings: Server settings
+    :return: None
+    """
+    import uvicorn
+
+    uvicorn.run(APP, **uvicorn_options(app_settings))
+
+
+def main() -> None:
+    """
+    The main function starts the server chosen by the settings.
+
+    :return: None
+    """
+    if settings.server_preload or settings.server_pin_workers:
+        run_gunicorn(settings)
+    else:
+        run_uvicorn(settings)
+
+
+if __name__ == "__main__":
+    main()
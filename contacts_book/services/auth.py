@@ -2,25 +2,38 @@
 # import redis
 from typing import Optional
 from datetime import datetime, timedelta
+from functools import cached_property
 
 from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 
-from contacts_book.database.db import get_db
+from contacts_book.database.db import get_db, get_read_db, release_connection
 from contacts_book.repository import users as repository_users
 from contacts_book.conf.config import settings
+from contacts_book.conf import messages
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
     SECRET_KEY = settings.secret_key
     ALGORITHM = settings.algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
     # r = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0)
 
+    @cached_property
+    def pwd_context(self):
+        """
+        The pwd_context property creates the passlib context on first use, so passlib and bcrypt
+            are not loaded at import.
+
+        :param self: Represent the instance of the class
+        :return: A CryptContext object
+        """
+        from passlib.context import CryptContext
+
+        return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
     def verify_password(self, plain_password, hashed_password):
         """
         The verify_password function takes a plain-text password and the hashed version of that password,
@@ -128,17 +141,16 @@ class Auth:
                 detail="Could not validate credentials",
             )
 
-    async def get_current_user(
-        self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
-    ):
+    async def get_user_from_token(self, token: str, db: Session):
         """
-        The get_current_user function is a dependency that will be used in the
-            protected endpoints. It takes a token as an argument and returns the user
-            object if it's valid, otherwise raises an exception.
-        
+        The get_user_from_token function decodes the access token and loads its user from the given session.
+            It raises an exception if the token or the user is not valid.
+
+        The read transaction is ended right away, so the handler does not hold a pooled connection.
+
         :param self: Represent the instance of a class
-        :param token: str: Get the token from the authorization header
-        :param db: Session: Pass the database session to the function
+        :param token: str: Access token
+        :param db: Session: Session to load the user with
         :return: A user object
         """
         credentials_exception = HTTPException(
@@ -160,10 +172,59 @@ class Auth:
             raise credentials_exception
 
         user = await repository_users.get_user_by_email(email, db)
+        release_connection(db)
         if user is None:
             raise credentials_exception
         return user
 
+    async def get_current_user(
+        self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
+    ):
+        """
+        The get_current_user function is a dependency that will be used in the
+            protected endpoints. It takes a token as an argument and returns the user
+            object if it's valid, otherwise raises an exception.
+            The user is loaded from the primary database, so write handlers can modify it.
+
+        :param self: Represent the instance of a class
+        :param token: str: Get the token from the authorization header
+        :param db: Session: Pass the database session to the function
+        :return: A user object
+        """
+        return await self.get_user_from_token(token, db)
+
+    async def get_current_reader(
+        self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_read_db)
+    ):
+        """
+        The get_current_reader function is the get_current_user dependency for read-only endpoints.
+            The user is loaded with the same read session as the handler, from a replica when one is available.
+
+        :param self: Represent the instance of a class
+        :param token: str: Get the token from the authorization header
+        :param db: Session: Pass the read-only database session to the function
+        :return: A user object
+        """
+        return await self.get_user_from_token(token, db)
+
+    async def get_current_admin(
+        self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_read_db)
+    ):
+        """
+        The get_current_admin function is the get_current_user dependency for admin-only endpoints.
+            Admins are the users whose email is listed in the ADMIN_EMAILS setting (comma separated).
+
+        :param self: Represent the instance of a class
+        :param token: str: Get the token from the authorization header
+        :param db: Session: Pass the read-only database session to the function
+        :return: A user object
+        """
+        user = await self.get_user_from_token(token, db)
+        admins = {email.strip().lower() for email in settings.admin_emails.split(",") if email.strip()}
+        if user.email.lower() not in admins:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=messages.ADMIN_ONLY)
+        return user
+
     async def create_email_token(self, data: dict):
         """
         The create_email_token function creates a JWT token that is used to verify the user's email address.
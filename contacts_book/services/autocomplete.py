@@ -0,0 +1,38 @@
+import unicodedata
+
+MAX_CODE_POINT = 0x10FFFF
+
+
+def autocomplete_key(value: str | None) -> str | None:
+    """
+    The autocomplete_key function returns the form of a name or email that prefixes are matched against:
+        casefolded, without the accents of Latin letters and with single spaces,
+        so "Zoë  O'Neil" starts with "zoe o".
+
+    :param value: str | None: Name or email
+    :return: The key, or None for an empty value
+    """
+    if not value:
+        return None
+    chars = []
+    for char in unicodedata.normalize("NFKD", value.casefold()):
+        # accents of Latin letters only: й and и are different Ukrainian letters
+        if unicodedata.combining(char) and chars and chars[-1].isascii():
+            continue
+        chars.append(char)
+    value = " ".join(unicodedata.normalize("NFC", "".join(chars)).split())
+    return value or None
+
+
+def prefix_range(prefix: str) -> tuple[str, str | None]:
+    """
+    The prefix_range function returns the bounds of the keys that start with the prefix:
+        key >= low and key < high, a range a btree index reads directly, unlike LIKE with a pattern.
+
+    :param prefix: str: Normalized prefix
+    :return: The low and high bounds; high is None when there is no upper bound
+    """
+    last = ord(prefix[-1])
+    if last == MAX_CODE_POINT:
+        return prefix, None
+    return prefix, prefix[:-1] + chr(last + 1)
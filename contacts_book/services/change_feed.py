@@ -0,0 +1,319 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Dict, List, Set, Tuple
+
+from contacts_book.conf.config import settings
+from contacts_book.services.metrics import metrics
+from contacts_book.services.redis_pool import redis_pool
+
+logger = logging.getLogger(__name__)
+
+STREAM_PREFIX = "contacts:feed:"
+CHANNEL_PREFIX = "contacts:feed:live:"
+
+# adds the event to the replay stream and publishes it in one step, so the channel order is the stream order
+PUBLISH_LUA_SCRIPT = """local id = redis.call("XADD", KEYS[1], "MAXLEN", "~", ARGV[1], "*", "event", ARGV[2], "data", ARGV[3])
+redis.call("PEXPIRE", KEYS[1], ARGV[4])
+redis.call("PUBLISH", KEYS[2], id .. "\\n" .. ARGV[2] .. "\\n" .. ARGV[3])
+return id"""
+
+Event = Tuple[str, str, str]
+
+# id of the reset event when the stream of the user is empty: the replay after it starts at the beginning
+EMPTY_STREAM_ID = "0-0"
+
+
+def format_event(event_id: str, event: str, data: str) -> str:
+    """
+    The format_event function returns the event in the Server-Sent Events format.
+
+    :param event_id: str: Event id, sent back by the client in Last-Event-ID
+    :param event: str: Event type
+    :param data: str: Event data, JSON without new lines
+    :return: The event as text
+    """
+    return f"id: {event_id}\nevent: {event}\ndata: {data}\n\n"
+
+
+def parse_event_id(event_id: str) -> Tuple[int, int]:
+    """
+    The parse_event_id function turns a Redis stream id into a tuple that compares in stream order.
+
+    :param event_id: str: Stream id, milliseconds-sequence
+    :return: A tuple of two integers
+    """
+    milliseconds, _, sequence = event_id.partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+
+class ChangeFeed:
+    """
+    Contact change events of every user, fanned out to all workers through Redis.
+
+    ``publish`` adds the event to the user's Redis stream, a replay buffer capped at ``replay_size`` events,
+    and publishes it on the user's channel; the stream id is the event id. Each worker subscribes to the channel
+    of a user while the user has a stream open on it, so it only gets the events of its own subscribers,
+    and hands them to their queues.
+    A subscriber that falls ``queue_size`` events behind, or misses events while Redis reconnects,
+    gets a reset event and should reload the contacts; its id is the last event in the replay buffer.
+    """
+
+    def __init__(self, replay_size: int = 1000, replay_ttl: int = 86400, queue_size: int = 100):
+        self.replay_size = replay_size
+        self.replay_ttl = replay_ttl
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._channels: Dict[str, asyncio.Event] = {}
+        self._pubsub = None
+        self._listener = None
+        self._ready = None
+        self._wakeup = None
+        self._subscription_lock = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def redis(self):
+        return redis_pool.client
+
+    async def publish(self, user_id: int, events: List[Tuple[str, str]]) -> List[str]:
+        """
+        The publish function sends the events of the user to every worker, in one round trip.
+            Errors are logged and counted but not raised: the change is committed already.
+
+        :param user_id: int: Owner of the contacts
+        :param events: List[Tuple[str, str]]: Event types with their JSON data
+        :return: Ids of the published events
+        """
+        if self.redis is None or not events:
+            return []
+
+        from redis.exceptions import RedisError
+
+        keys = (f"{STREAM_PREFIX}{user_id}", f"{CHANNEL_PREFIX}{user_id}")
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for event, data in events:
+                    pipe.eval(
+                        PUBLISH_LUA_SCRIPT,
+                        2,
+                        *keys,
+                        self.replay_size,
+                        event,
+                        data,
+                        self.replay_ttl * 1000,
+                    )
+                ids = await pipe.execute()
+        except RedisError:
+            logger.exception("Contact events of user %s were not published", user_id)
+            metrics.inc("change_feed_publish_errors_total")
+            return []
+        metrics.inc("change_feed_events_total", len(ids))
+        return ids
+
+    async def replay(self, user_id: int, last_event_id: str) -> List[Event] | None:
+        """
+        The replay function returns the events published after last_event_id, or None when some of them
+            are no longer in the replay buffer.
+
+        :param user_id: int: Owner of the contacts
+        :param last_event_id: str: Id of the last event the client got
+        :return: A list of events, oldest first, or None
+        """
+        try:
+            last = parse_event_id(last_event_id)
+        except ValueError:
+            return None
+        entries = await self.redis.xrange(f"{STREAM_PREFIX}{user_id}", min=last_event_id)
+        if entries and last != (0, 0) and parse_event_id(entries[0][0]) != last:
+            # the last event was trimmed, so may be the ones after it
+            return None
+        return [
+            (event_id, fields["event"], fields["data"])
+            for event_id, fields in entries
+            if parse_event_id(event_id) > last
+        ]
+
+    async def reset_event(self, user_id: int) -> str:
+        """
+        The reset_event function returns the reset event, with the id of the last event in the replay buffer.
+            The client reconnects with it in Last-Event-ID after reloading the contacts, so it gets the events
+            published since, instead of another reset for the id that is no longer in the buffer.
+
+        :param user_id: int: Owner of the contacts
+        :return: The reset event as text
+        """
+        entries = await self.redis.xrevrange(f"{STREAM_PREFIX}{user_id}", count=1)
+        event_id = entries[0][0] if entries else EMPTY_STREAM_ID
+        return format_event(event_id, "reset", "{}")
+
+    def _dispatch(self, user_key: str, message: str) -> None:
+        event = tuple(message.split("\n", 2))
+        for queue in list(self._subscribers.get(user_key, ())):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._reset(queue)
+
+    def _reset(self, queue: asyncio.Queue) -> None:
+        # None tells the subscriber to send a reset; make room for it
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self.redis.pubsub()
+            self._pubsub = pubsub
+            try:
+                # after a reconnect, subscribe again to the channels of the current subscribers
+                self._channels = {
+                    user_key: self._channels.get(user_key) or asyncio.Event() for user_key in self._subscribers
+                }
+                for subscribed in self._channels.values():
+                    subscribed.clear()
+                if self._channels:
+                    await pubsub.subscribe(*(f"{CHANNEL_PREFIX}{user_key}" for user_key in self._channels))
+                self._ready.set()
+                while True:
+                    self._wakeup.clear()
+                    if not pubsub.subscribed:
+                        # no channels, so no connection to read from until the next subscriber
+                        await self._wakeup.wait()
+                        continue
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message is None:
+                        continue
+                    user_key = message["channel"][len(CHANNEL_PREFIX):]
+                    if message["type"] == "message":
+                        self._dispatch(user_key, message["data"])
+                    elif message["type"] == "subscribe" and user_key in self._channels:
+                        self._channels[user_key].set()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Change feed subscription failed, reconnecting")
+                self._ready.clear()
+                # events published in the meantime are lost for the live subscribers
+                for queues in self._subscribers.values():
+                    for queue in queues:
+                        self._reset(queue)
+                await asyncio.sleep(1)
+            finally:
+                self._pubsub = None
+                await pubsub.close()
+
+    async def _subscribe(self, user_key: str, timeout: float = 5.0) -> None:
+        async with self._subscription_lock:
+            subscribed = self._channels.get(user_key)
+            if subscribed is None:
+                subscribed = self._channels[user_key] = asyncio.Event()
+                # while reconnecting, the listener subscribes to the channel itself
+                if self._pubsub is not None:
+                    await self._pubsub.subscribe(f"{CHANNEL_PREFIX}{user_key}")
+                    self._wakeup.set()
+        # the confirmation comes after the events published before the subscription
+        await asyncio.wait_for(subscribed.wait(), timeout)
+
+    async def _unsubscribe(self, user_key: str) -> None:
+        async with self._subscription_lock:
+            # a new stream of the user may have opened since the last one closed
+            if user_key in self._subscribers or self._pubsub is None:
+                return
+            self._channels.pop(user_key, None)
+            await self._pubsub.unsubscribe(f"{CHANNEL_PREFIX}{user_key}")
+
+    def _release(self, user_key: str) -> None:
+        task = asyncio.get_running_loop().create_task(self._unsubscribe(user_key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def start(self, timeout: float = 5.0) -> None:
+        """
+        The start function starts the subscription of this worker, if it is not running, and waits until it is ready.
+
+        :param timeout: float: Seconds to wait for the subscription
+        :return: None
+        """
+        if self._listener is None or self._listener.done():
+            self._ready = asyncio.Event()
+            self._wakeup = asyncio.Event()
+            self._subscription_lock = asyncio.Lock()
+            self._listener = asyncio.create_task(self._listen())
+        await asyncio.wait_for(self._ready.wait(), timeout)
+
+    async def stream(
+        self, user_id: int, last_event_id: str | None = None, heartbeat: float = 15.0
+    ) -> AsyncIterator[str]:
+        """
+        The stream function yields the Server-Sent Events of the user: first the events missed since last_event_id,
+            then the live ones. A comment is sent after heartbeat seconds without events, to keep proxies from
+            closing the connection.
+
+        :param user_id: int: Owner of the contacts
+        :param last_event_id: str | None: Last-Event-ID of a reconnecting client
+        :param heartbeat: float: Seconds between keep-alive comments
+        :return: An async iterator of event texts
+        """
+        user_key = str(user_id)
+        queue = asyncio.Queue(self.queue_size + 1)
+        await self.start()
+        self._subscribers.setdefault(user_key, set()).add(queue)
+        metrics.inc("change_feed_connections_total")
+        try:
+            # subscribe before reading the replay buffer, so no event falls between the two
+            await self._subscribe(user_key)
+            yield "retry: 3000\n\n"
+            last = (0, 0)
+            if last_event_id:
+                missed = await self.replay(user_id, last_event_id)
+                if missed is None:
+                    yield await self.reset_event(user_id)
+                    return
+                last = parse_event_id(last_event_id)
+                for event_id, event, data in missed:
+                    last = parse_event_id(event_id)
+                    yield format_event(event_id, event, data)
+
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if item is None:
+                    yield await self.reset_event(user_id)
+                    return
+                event_id, event, data = item
+                if parse_event_id(event_id) <= last:
+                    continue
+                last = parse_event_id(event_id)
+                yield format_event(event_id, event, data)
+        finally:
+            queues = self._subscribers.get(user_key, set())
+            queues.discard(queue)
+            if not queues:
+                self._subscribers.pop(user_key, None)
+                # in a task: the generator may be closed without a chance to await
+                self._release(user_key)
+
+    async def stop(self) -> None:
+        """
+        The stop function cancels the subscription of this worker.
+
+        :return: None
+        """
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+            self._channels = {}
+
+
+change_feed = ChangeFeed(
+    replay_size=settings.change_feed_replay_size,
+    replay_ttl=settings.change_feed_replay_ttl,
+    queue_size=settings.change_feed_queue_size,
+)
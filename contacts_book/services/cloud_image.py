@@ -1,17 +1,29 @@
 import hashlib
-import cloudinary
-import cloudinary.uploader
+from functools import lru_cache
 
 from contacts_book.conf.config import settings
 
 
-class CloudImage():
+@lru_cache
+def get_cloudinary():
+    """
+    The get_cloudinary function imports and configures cloudinary on first use.
+
+    :return: The configured cloudinary module
+    """
+    import cloudinary
+    import cloudinary.uploader
+
     cloudinary.config(
         cloud_name=settings.cloudinary_name,
         api_key=settings.cloudinary_api_key,
         api_secret=settings.cloudinary_api_secret,
         secure=True
     )
+    return cloudinary
+
+
+class CloudImage():
 
     @staticmethod
     def generate_name_avatar(email: str):
@@ -37,7 +49,7 @@ class CloudImage():
         :param public_id: str: Specify the name of the file that will be uploaded to cloudinary
         :return: A dictionary
         """
-        r = cloudinary.uploader.upload(file, public_id=public_id, overwrite=True)
+        r = get_cloudinary().uploader.upload(file, public_id=public_id, overwrite=True)
         return r
     
     @staticmethod
@@ -51,5 +63,5 @@ class CloudImage():
         :param r: Get the version of the image
         :return: A url for the avatar
         """
-        src_url = cloudinary.CloudinaryImage(public_id).build_url(width=250, height=250, crop='fill', version=r.get('version'))
+        src_url = get_cloudinary().CloudinaryImage(public_id).build_url(width=250, height=250, crop='fill', version=r.get('version'))
         return src_url
\ No newline at end of file
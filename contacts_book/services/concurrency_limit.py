@@ -0,0 +1,181 @@
+import asyncio
+import heapq
+import itertools
+import time
+import weakref
+from enum import IntEnum
+from typing import List, Tuple
+
+from contacts_book.conf.config import Settings
+from contacts_book.services.metrics import metrics
+
+# limiters of the applications of this process, for the metrics
+_limiters: "weakref.WeakSet[AdaptiveLimiter]" = weakref.WeakSet()
+
+
+class Priority(IntEnum):
+    """
+    Priority of a route under load: lower values are admitted first. Critical requests are never queued.
+    """
+
+    critical = 0
+    high = 1
+    normal = 2
+    low = 3
+
+
+class LimitExceeded(Exception):
+    """
+    The request was not admitted: the queue was full, it waited too long or it was shed for a more important one.
+    """
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class AdaptiveLimiter:
+    """
+    Limits the requests a worker runs at once, with a limit that adapts to the latency (AIMD).
+
+    Every request that finishes within ``target_latency`` while the limit is in use adds ``1 / limit``
+    to it, so the limit grows by one per round of requests; a slower request, or one that ended with 503/504,
+    cuts it by ``backoff``, at most once per ``target_latency``. Requests over the limit wait in a priority
+    queue for up to ``queue_timeout`` seconds; when the queue is full a request of a higher priority takes
+    the place of the lowest one queued, the others are rejected at once.
+    """
+
+    def __init__(
+        self,
+        initial: int = 20,
+        min_limit: int = 4,
+        max_limit: int = 200,
+        target_latency: float = 0.5,
+        backoff: float = 0.9,
+        max_queue: int = 100,
+        queue_timeout: float = 1.0,
+    ):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.inflight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+        self._last_decrease = 0.0
+        _limiters.add(self)
+
+    @classmethod
+    def from_settings(cls, app_settings: Settings) -> "AdaptiveLimiter":
+        """
+        The from_settings function creates the concurrency limiter of an application.
+
+        :param app_settings: Settings: Settings of the application
+        :return: An AdaptiveLimiter
+        """
+        return cls(
+            initial=app_settings.concurrency_limit_initial,
+            min_limit=app_settings.concurrency_limit_min,
+            max_limit=app_settings.concurrency_limit_max,
+            target_latency=app_settings.concurrency_target_latency,
+            max_queue=app_settings.concurrency_queue_size,
+            queue_timeout=app_settings.concurrency_queue_timeout,
+        )
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, priority: Priority) -> float:
+        """
+        The acquire function admits the request, waiting in the queue if the worker is at its limit.
+
+        :param priority: Priority: Priority of the route
+        :return: Seconds spent in the queue
+        :raises LimitExceeded: When the request is not admitted
+        """
+        if priority == Priority.critical or (self.inflight < int(self.limit) and not self._waiters):
+            self.inflight += 1
+            return 0.0
+
+        if len(self._waiters) >= self.max_queue:
+            lowest = max(self._waiters)
+            if lowest[0] <= priority:
+                raise LimitExceeded("queue_full")
+            self._waiters.remove(lowest)
+            heapq.heapify(self._waiters)
+            lowest[2].set_exception(LimitExceeded("shed"))
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        entry = (int(priority), next(self._order), future)
+        heapq.heappush(self._waiters, entry)
+        start = loop.time()
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise LimitExceeded("timeout")
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # admitted just as the caller went away
+                self.inflight -= 1
+                self._wake()
+            raise
+        finally:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+        return loop.time() - start
+
+    def release(self, priority: Priority, latency: float, overloaded: bool = False) -> None:
+        """
+        The release function ends an admitted request, adapts the limit to its latency and admits the next ones.
+
+        :param priority: Priority: Priority of the request
+        :param latency: float: Seconds the request ran
+        :param overloaded: bool: The request failed in a way that means overload, for example a 503 or 504
+        :return: None
+        """
+        self.inflight -= 1
+        if priority != Priority.critical:
+            if overloaded or latency > self.target_latency:
+                now = time.monotonic()
+                if now - self._last_decrease >= self.target_latency:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = now
+            elif self.inflight + 1 >= int(self.limit):
+                # grow only while the limit is in use, so an idle worker doesn't raise it for nothing
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.inflight < int(self.limit):
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self.inflight += 1
+            future.set_result(None)
+
+    def stats(self) -> dict:
+        """
+        The stats function returns the limit, the requests running and the requests queued.
+
+        :return: A dictionary
+        """
+        return {"limit": round(self.limit, 2), "inflight": self.inflight, "queued": self.queued}
+
+
+def _collect_concurrency() -> dict:
+    # one application per process in production; test applications add up
+    stats = [limiter.stats() for limiter in list(_limiters)]
+    return {
+        "concurrency_limit": sum(item["limit"] for item in stats),
+        "concurrency_inflight": sum(item["inflight"] for item in stats),
+        "concurrency_queued": sum(item["queued"] for item in stats),
+    }
+
+
+metrics.register_collector(_collect_concurrency)
@@ -0,0 +1,145 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Dict
+
+import msgpack
+import orjson
+from fastapi import HTTPException, Request, Response, status
+from fastapi.responses import ORJSONResponse
+from fastapi.routing import APIRoute
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_SECOND = timedelta(seconds=1)
+
+
+def _encode_default(obj: Any) -> Any:
+    if isinstance(obj, datetime):
+        # naive datetimes from the database are UTC
+        return (obj - (_EPOCH if obj.tzinfo is None else _EPOCH_UTC)) // _SECOND
+    if isinstance(obj, date):
+        return (date(obj.year, obj.month, obj.day) - _EPOCH.date()).days * 86400
+    raise TypeError(f"Can not encode {type(obj).__name__} to msgpack")
+
+
+def packb(obj: Any) -> bytes:
+    """
+    The packb function encodes the object to MessagePack; datetimes become integer unix timestamps.
+
+    :param obj: Any: Object to encode
+    :return: Encoded bytes
+    """
+    return msgpack.packb(obj, default=_encode_default, use_bin_type=True)
+
+
+def unpackb(data: bytes) -> Any:
+    """
+    The unpackb function decodes MessagePack bytes.
+
+    :param data: bytes: Encoded bytes
+    :return: Decoded object
+    """
+    return msgpack.unpackb(data, raw=False)
+
+
+def accept_qualities(accept: str) -> Dict[str, float]:
+    """
+    The accept_qualities function returns the q-value of every media range of the Accept header.
+
+    :param accept: str: Value of the Accept header
+    :return: A dictionary of the lowercase media ranges and their q-values
+    """
+    qualities = {}
+    for item in accept.split(","):
+        media_type, *params = item.split(";")
+        media_type = media_type.strip().lower()
+        if not media_type:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[media_type] = q
+    return qualities
+
+
+def wants_msgpack(request: Request) -> bool:
+    """
+    The wants_msgpack function checks if the client prefers MessagePack to JSON in the Accept header.
+        The media type with the higher q-value wins. On a tie JSON wins if the client named it,
+        and MessagePack wins over the JSON matched by a wildcard only.
+
+    :param request: Request: Current request
+    :return: True if the response should be MessagePack
+    """
+    qualities = accept_qualities(request.headers.get("accept", ""))
+    msgpack_q = max((qualities.get(media_type, 0.0) for media_type in MSGPACK_MEDIA_TYPES), default=0.0)
+    if msgpack_q <= 0:
+        return False
+    if "application/json" in qualities:
+        return msgpack_q > qualities["application/json"]
+    return msgpack_q >= qualities.get("application/*", qualities.get("*/*", 0.0))
+
+
+class MsgPackResponse(Response):
+    media_type = MSGPACK_MEDIA_TYPES[0]
+
+    def render(self, content: Any) -> bytes:
+        return packb(content)
+
+
+def negotiated_response(request: Request, content: Any) -> Response:
+    """
+    The negotiated_response function returns the content as MessagePack or JSON, as asked by the Accept header.
+
+    :param request: Request: Current request
+    :param content: Any: Plain data (dictionaries, lists, datetimes) to send
+    :return: A MsgPackResponse or an ORJSONResponse
+    """
+    if wants_msgpack(request):
+        return MsgPackResponse(content)
+    return ORJSONResponse(content)
+
+
+class MsgPackRequest(Request):
+    async def body(self) -> bytes:
+        if not hasattr(self, "_body"):
+            raw = await super().body()
+            try:
+                self._body = orjson.dumps(unpackb(raw))
+            except (ValueError, msgpack.ExtraData, orjson.JSONEncodeError):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Invalid MessagePack body",
+                )
+        return self._body
+
+
+class MsgPackRoute(APIRoute):
+    """
+    Route that also accepts MessagePack request bodies (Content-Type: application/msgpack).
+
+    The body is decoded and handed to FastAPI as JSON, so validation and the OpenAPI schema
+    are the same for both formats.
+    """
+
+    def get_route_handler(self) -> Callable:
+        original_route_handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+            if content_type in MSGPACK_MEDIA_TYPES:
+                scope = dict(request.scope)
+                scope["headers"] = [
+                    (key, b"application/json" if key == b"content-type" else value)
+                    for key, value in request.scope["headers"]
+                ]
+                request = MsgPackRequest(scope, request.receive)
+            return await original_route_handler(request)
+
+        return route_handler
@@ -0,0 +1,271 @@
+import re
+import unicodedata
+from collections import defaultdict
+from difflib import SequenceMatcher
+from itertools import combinations
+from typing import Dict, Iterable, List, Set
+
+from sqlalchemy import select
+
+from contacts_book.conf.config import settings
+from contacts_book.database.db import SessionLocal, get_engine
+from contacts_book.database.models import Contact, User, UserStat
+from contacts_book.repository import stats as repository_stats
+from contacts_book.services.jobs import jobs
+from contacts_book.services.metrics import metrics
+from contacts_book.services.redis_pool import redis_pool
+
+LATEST_KEY_PREFIX = "dedup:latest:"
+
+# Ukrainian and Russian letters, so Cyrillic and Latin spellings of a name get the same phonetic key
+CYRILLIC_TO_LATIN = str.maketrans(
+    {
+        "а": "a", "б": "b", "в": "v", "г": "h", "ґ": "g", "д": "d", "е": "e", "є": "ie", "ё": "e",
+        "ж": "zh", "з": "z", "и": "y", "і": "i", "ї": "i", "й": "i", "к": "k", "л": "l", "м": "m",
+        "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "kh",
+        "ц": "ts", "ч": "ch", "ш": "sh", "щ": "shch", "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "iu",
+        "я": "ia",
+    }
+)
+
+SOUNDEX_CODES = {
+    **dict.fromkeys("bfpv", "1"),
+    **dict.fromkeys("cgjkqsxz", "2"),
+    **dict.fromkeys("dt", "3"),
+    "l": "4",
+    **dict.fromkeys("mn", "5"),
+    "r": "6",
+}
+
+# phones are compared by their last digits, so national and international formats match
+PHONE_DIGITS = 9
+
+
+def normalize_name(name: str | None) -> str:
+    """
+    The normalize_name function lowercases the name, transliterates Cyrillic letters, drops accents
+        and keeps only letters and single spaces.
+
+    :param name: str | None: Name to normalize
+    :return: The normalized name
+    """
+    if not name:
+        return ""
+    name = unicodedata.normalize("NFKD", name.casefold().translate(CYRILLIC_TO_LATIN))
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    return " ".join(re.sub(r"[^a-z]+", " ", name).split())
+
+
+def normalize_phone(phone: str | None) -> str:
+    """
+    The normalize_phone function returns the last PHONE_DIGITS digits of the phone, or all its digits if it is shorter.
+
+    :param phone: str | None: Phone to normalize
+    :return: The digits
+    """
+    return re.sub(r"\D", "", phone or "")[-PHONE_DIGITS:]
+
+
+def normalize_email(email: str | None) -> str:
+    """
+    The normalize_email function lowercases the email and drops the +tag of its local part,
+        and the dots too for Gmail addresses.
+
+    :param email: str | None: Email to normalize
+    :return: The normalized email
+    """
+    local, _, domain = (email or "").strip().lower().partition("@")
+    local = local.split("+", 1)[0]
+    if domain in ("gmail.com", "googlemail.com"):
+        local, domain = local.replace(".", ""), "gmail.com"
+    return f"{local}@{domain}" if domain else local
+
+
+def soundex(word: str) -> str:
+    """
+    The soundex function returns the American Soundex code of a normalized word: names that sound alike,
+        like Smith and Smyth, get the same code.
+
+    :param word: str: Lowercase Latin word
+    :return: The code, empty for an empty word
+    """
+    if not word:
+        return ""
+    code, previous = word[0], SOUNDEX_CODES.get(word[0])
+    for char in word[1:]:
+        digit = SOUNDEX_CODES.get(char)
+        if digit and digit != previous:
+            code += digit
+        if char not in "hw":
+            previous = digit
+    return (code + "000")[:4]
+
+
+def prepare(contact) -> dict:
+    """
+    The prepare function returns the normalized fields of a contact and its blocking keys:
+        the normalized phone, the email local part and the phonetic keys of the names.
+
+    :param contact: Contact or row with id, firstname, lastname, email, phone and birthday
+    :return: A dictionary
+    """
+    tokens = sorted(normalize_name(f"{contact.firstname or ''} {contact.lastname or ''}").split())
+    phone = normalize_phone(contact.phone)
+    email = normalize_email(contact.email)
+    keys = set()
+    if len(phone) >= 7:
+        keys.add(f"phone:{phone}")
+    if email:
+        keys.add(f"email:{email.partition('@')[0]}")
+    if tokens:
+        # sorted, so swapped first and last names share the key
+        keys.add("name:" + ":".join(sorted(soundex(token) for token in tokens)))
+    return {
+        "id": contact.id,
+        "name": " ".join(tokens),
+        "phone": phone,
+        "email": email,
+        "birthday": contact.birthday.date() if contact.birthday else None,
+        "keys": keys,
+    }
+
+
+def similarity(first: dict, second: dict) -> float:
+    """
+    The similarity function scores how likely two prepared contacts are the same person, from 0 to 1:
+        a shared phone or email weighs 0.6, the name similarity 0.3 and the same birthday 0.1.
+        A name alone never reaches the default threshold.
+
+    :param first: dict: Prepared contact
+    :param second: dict: Prepared contact
+    :return: The score
+    """
+    same_contact = (first["phone"] and first["phone"] == second["phone"]) or (
+        first["email"] and first["email"] == second["email"]
+    )
+    name = 0.0
+    if first["name"] and second["name"]:
+        name = SequenceMatcher(None, first["name"], second["name"]).ratio()
+    birthday = first["birthday"] is not None and first["birthday"] == second["birthday"]
+    return round(0.6 * bool(same_contact) + 0.3 * name + 0.1 * birthday, 3)
+
+
+def find_duplicates(contacts: Iterable, threshold: float = 0.75, max_block_size: int = 100) -> dict:
+    """
+    The find_duplicates function groups the contacts that are likely the same person.
+        Contacts are compared only with the contacts that share a blocking key, so the work grows with
+        the size of the blocks and not with the square of the book. Blocks bigger than max_block_size
+        (a shared office phone, a very common name) are skipped. Pairs scoring at least the threshold
+        are joined into groups.
+
+    :param contacts: Iterable: Contacts or rows with id, firstname, lastname, email, phone and birthday
+    :param threshold: float: Lowest score of duplicates
+    :param max_block_size: int: Largest block that is compared
+    :return: A dictionary with the groups, the number of contacts and the number of comparisons
+    """
+    prepared = [prepare(contact) for contact in contacts]
+    blocks: Dict[str, List[int]] = defaultdict(list)
+    for index, contact in enumerate(prepared):
+        for key in contact["keys"]:
+            blocks[key].append(index)
+
+    scores = {}
+    for members in blocks.values():
+        if len(members) < 2 or len(members) > max_block_size:
+            continue
+        for pair in combinations(members, 2):
+            if pair not in scores:
+                scores[pair] = similarity(prepared[pair[0]], prepared[pair[1]])
+
+    # union-find of the duplicate pairs
+    parents = {}
+
+    def find(index: int) -> int:
+        parents.setdefault(index, index)
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    for (first, second), score in scores.items():
+        if score >= threshold:
+            parents[find(first)] = find(second)
+
+    groups: Dict[int, Set[int]] = defaultdict(set)
+    best: Dict[int, float] = defaultdict(float)
+    for (first, second), score in scores.items():
+        if score >= threshold:
+            root = find(first)
+            groups[root].update((first, second))
+            best[root] = max(best[root], score)
+
+    result = [
+        {"score": best[root], "ids": sorted(prepared[index]["id"] for index in members)}
+        for root, members in groups.items()
+    ]
+    result.sort(key=lambda group: (-group["score"], group["ids"]))
+    return {"groups": result, "contacts": len(prepared), "comparisons": len(scores)}
+
+
+DEDUP_COLUMNS = (Contact.id, Contact.firstname, Contact.lastname, Contact.email, Contact.phone, Contact.birthday)
+
+
+def collect_duplicates(user_id: int) -> dict:
+    """
+    The collect_duplicates function loads the contacts of the user with the write version of the contacts,
+        and finds the groups of duplicates among them. It blocks: the job runs it in the threadpool.
+
+    :param user_id: int: Id of the user
+    :return: A dictionary with the groups of contact ids, the version and the numbers of contacts and comparisons
+    """
+    db = SessionLocal(bind=get_engine())
+    try:
+        if db.get(User, user_id) is None:
+            return {"groups": [], "contacts": 0, "comparisons": 0, "version": 0}
+        version = db.execute(
+            select(UserStat.value).where(UserStat.user_id == user_id, UserStat.name == repository_stats.VERSION)
+        ).scalar()
+        rows = db.execute(select(*DEDUP_COLUMNS).where(Contact.user_id == user_id)).all()
+    finally:
+        db.close()
+    result = find_duplicates(rows, settings.dedup_threshold, settings.dedup_max_block_size)
+    return {**result, "version": version or 0}
+
+
+@jobs.task(name="find_duplicates", max_retries=1)
+async def find_duplicate_contacts(user_id: int) -> dict:
+    """
+    The find_duplicate_contacts function finds the groups of duplicate contacts of the user.
+        The result has the write version of the contacts it was computed from, to tell when it is stale.
+
+    :param user_id: int: Id of the user
+    :return: A dictionary with the groups of contact ids, the version and the numbers of contacts and comparisons
+    """
+    # loading and scoring block: both run in the threadpool, so the worker keeps polling and renewing leases
+    result = await jobs.run_sync(collect_duplicates, user_id)
+    metrics.inc("dedup_comparisons_total", result["comparisons"])
+    return result
+
+
+async def start_duplicates_search(user: User) -> str:
+    """
+    The start_duplicates_search function enqueues the duplicates search of the user and remembers it
+        as the user's latest one.
+
+    :param user: User: The user
+    :return: The job id
+    """
+    job_id = await jobs.enqueue(find_duplicate_contacts, user.id, user_id=user.id)
+    await redis_pool.client.set(f"{LATEST_KEY_PREFIX}{user.id}", job_id, ex=jobs.result_ttl)
+    return job_id
+
+
+async def get_duplicates_search(user: User) -> dict | None:
+    """
+    The get_duplicates_search function returns the job of the user's latest duplicates search.
+
+    :param user: User: The user
+    :return: The job, or None if there is none or it has expired
+    """
+    job_id = await redis_pool.client.get(f"{LATEST_KEY_PREFIX}{user.id}")
+    return await jobs.get(job_id) if job_id else None
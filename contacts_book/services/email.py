@@ -1,27 +1,42 @@
+import logging
+from functools import lru_cache
 from pathlib import Path
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
 from pydantic import EmailStr
 
 from contacts_book.services.auth import auth_service
+from contacts_book.services.jobs import current_job, jobs
 from contacts_book.conf.config import settings
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=settings.mail_username,
-    MAIL_PASSWORD=settings.mail_password,
-    MAIL_FROM=settings.mail_from,
-    MAIL_PORT=settings.mail_port,
-    MAIL_SERVER=settings.mail_server,
-    MAIL_FROM_NAME="Contacts book",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
-)
+logger = logging.getLogger(__name__)
 
 
+@lru_cache
+def get_mail_config():
+    """
+    The get_mail_config function builds the fastapi_mail connection config on first use.
+        fastapi_mail is imported here and not at module level, because importing it is slow.
+
+    :return: A ConnectionConfig object
+    """
+    from fastapi_mail import ConnectionConfig
+
+    return ConnectionConfig(
+        MAIL_USERNAME=settings.mail_username,
+        MAIL_PASSWORD=settings.mail_password,
+        MAIL_FROM=settings.mail_from,
+        MAIL_PORT=settings.mail_port,
+        MAIL_SERVER=settings.mail_server,
+        MAIL_FROM_NAME="Contacts book",
+        MAIL_STARTTLS=False,
+        MAIL_SSL_TLS=True,
+        USE_CREDENTIALS=True,
+        VALIDATE_CERTS=True,
+        TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
+    )
+
+
+@jobs.task(queue="email", max_retries=5)
 async def send_email(email: EmailStr, username: str, host: str):
     """
     The send_email function sends an email to the user with a link to confirm their email address.
@@ -34,7 +49,11 @@ async def send_email(email: EmailStr, username: str, host: str):
     :param username: str: Pass the username to the email template
     :param host: str: Pass the hostname of the server to the template
     :return: A coroutine object
+    :raises ConnectionErrors: When it runs as a job, so the worker retries it
     """
+    from fastapi_mail import FastMail, MessageSchema, MessageType
+    from fastapi_mail.errors import ConnectionErrors
+
     try:
         token_verification = await auth_service.create_email_token({"sub": email})
         message = MessageSchema(
@@ -44,7 +63,9 @@ async def send_email(email: EmailStr, username: str, host: str):
             subtype=MessageType.html
         )
 
-        fm = FastMail(conf)
+        fm = FastMail(get_mail_config())
         await fm.send_message(message, template_name="email_template.html")
     except ConnectionErrors as err:
-        print(err)
\ No newline at end of file
+        if current_job() is not None:
+            raise
+        logger.error("Confirmation email to %s was not sent: %s", email, err)
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import time
+
+from fastapi import Request
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from contacts_book.conf.config import Settings
+from contacts_book.database.db import get_engine, pool_status
+
+logger = logging.getLogger(__name__)
+
+
+class HealthChecker:
+    """
+    Readiness checks of the database, Redis and the connection pool.
+
+    The result is cached and refreshed by a background task every ``interval`` seconds, so probes
+    only read the cache. If the cache is older than ``3 * interval`` (the task is not running)
+    one probe refreshes it while concurrent probes wait for that same refresh.
+    """
+
+    def __init__(self, db_engine: Engine | None = None, interval: float = 5.0, saturation_threshold: float = 0.9):
+        self._engine = db_engine
+        self.interval = interval
+        self.saturation_threshold = saturation_threshold
+        self.redis = None
+        self._result: dict | None = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    @classmethod
+    def from_settings(cls, app_settings: Settings) -> "HealthChecker":
+        """
+        The from_settings function creates the readiness checker of an application.
+
+        :param app_settings: Settings: Settings of the application
+        :return: A HealthChecker
+        """
+        return cls(
+            interval=app_settings.health_check_interval,
+            saturation_threshold=app_settings.health_pool_saturation_threshold,
+        )
+
+    @property
+    def engine(self) -> Engine:
+        # the application engine is looked up on use, so it can be created lazily
+        return self._engine if self._engine is not None else get_engine()
+
+    def check_db(self) -> dict:
+        """
+        The check_db function runs SELECT 1 on the database.
+
+        :return: A dictionary with the check result
+        """
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            return {"ok": True}
+        except Exception as err:
+            return {"ok": False, "error": str(err)}
+
+    async def check_redis(self) -> dict:
+        """
+        The check_redis function pings Redis.
+
+        :return: A dictionary with the check result
+        """
+        if self.redis is None:
+            return {"ok": False, "error": "Redis is not configured"}
+        try:
+            await self.redis.ping()
+            return {"ok": True}
+        except Exception as err:
+            return {"ok": False, "error": str(err)}
+
+    def check_pool(self) -> dict:
+        """
+        The check_pool function reports the share of the connection pool in use.
+
+        :return: A dictionary with the pool saturation
+        """
+        stats = pool_status(self.engine)
+        capacity = stats.get("size", 0) + stats.get("max_overflow", 0)
+        saturation = stats.get("checked_out", 0) / capacity if capacity else 0.0
+        return {
+            "ok": saturation < self.saturation_threshold,
+            "checked_out": stats.get("checked_out", 0),
+            "capacity": capacity,
+            "saturation": round(saturation, 3),
+        }
+
+    async def refresh(self) -> dict:
+        """
+        The refresh function runs all checks and stores the result in the cache.
+            The database check runs in a thread, so it does not block the event loop.
+
+        :return: The readiness result
+        """
+        db, redis_result = await asyncio.gather(
+            asyncio.to_thread(self.check_db), self.check_redis()
+        )
+        checks = {"database": db, "redis": redis_result, "pool": self.check_pool()}
+        self._result = {
+            # a saturated pool is reported, but the instance can still serve requests
+            "ready": db["ok"] and redis_result["ok"],
+            "checks": checks,
+            "checked_at": time.time(),
+        }
+        self._checked_at = time.monotonic()
+        return self._result
+
+    async def get_readiness(self) -> dict:
+        """
+        The get_readiness function returns the cached readiness result.
+
+        :return: The readiness result
+        """
+        if self._result is not None and time.monotonic() - self._checked_at < 3 * self.interval:
+            return self._result
+
+        async with self._lock:
+            if self._result is not None and time.monotonic() - self._checked_at < 3 * self.interval:
+                return self._result
+            return await self.refresh()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                async with self._lock:
+                    await self.refresh()
+            except Exception:
+                # a failed round must not end the task, or readiness would stay stale
+                logger.exception("Readiness checks failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """
+        The start function starts the background refresh task.
+
+        :return: None
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        The stop function cancels the background refresh task.
+
+        :return: None
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+
+def get_health_checker(request: Request) -> HealthChecker:
+    """
+    The get_health_checker function returns the readiness checker of the application serving the request.
+
+    :param request: Request: Current request
+    :return: The HealthChecker created by create_app
+    """
+    return request.app.state.health_checker
@@ -0,0 +1,627 @@
+import asyncio
+import functools
+import json
+import logging
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Tuple
+
+import anyio
+from fastapi import BackgroundTasks
+
+from contacts_book.conf.config import settings
+from contacts_book.services.metrics import metrics
+from contacts_book.services.redis_pool import redis_pool
+
+logger = logging.getLogger(__name__)
+
+# takes the first due job of the queue, unless the queue already runs `limit` jobs on all workers
+CLAIM_LUA_SCRIPT = """local limit = tonumber(ARGV[2])
+if limit > 0 and redis.call("ZCARD", KEYS[2]) >= limit then
+    return false
+end
+local ids = redis.call("ZRANGEBYSCORE", KEYS[1], "-inf", ARGV[1], "LIMIT", 0, 1)
+if #ids == 0 then
+    return false
+end
+local id = ids[1]
+redis.call("ZREM", KEYS[1], id)
+redis.call("ZADD", KEYS[2], ARGV[3], id)
+local key = ARGV[4] .. id
+redis.call("HSET", key, "status", "running", "started_at", ARGV[1])
+redis.call("HINCRBY", key, "attempts", 1)
+return id"""
+
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+# seconds a lease outlives the time limit of its job; the running worker renews it every half of this
+LEASE_MARGIN = 60
+
+_current_job: ContextVar[str | None] = ContextVar("current_job", default=None)
+
+# threadpool calls of the running job, each an event set when its thread returns
+_job_threads: ContextVar[set | None] = ContextVar("job_threads", default=None)
+
+
+def current_job() -> str | None:
+    """
+    The current_job function returns the id of the job the caller runs in, or None outside of the worker.
+
+    :return: The job id or None
+    """
+    return _current_job.get()
+
+
+def parse_queues(value: str) -> Dict[str, int]:
+    """
+    The parse_queues function parses the JOBS_QUEUES setting: "name:limit" pairs separated by commas.
+
+    :param value: str: For example "default:4,email:8"
+    :return: A dictionary of queue names and concurrency limits
+    """
+    queues = {}
+    for item in value.split(","):
+        name, _, limit = item.strip().partition(":")
+        if name:
+            queues[name] = int(limit or 1)
+    return queues
+
+
+def _parse_cron_field(field: str, low: int, high: int) -> set:
+    values = set()
+    for part in field.split(","):
+        expression, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if expression == "*":
+            start, end = low, high
+        elif "-" in expression:
+            start, end = (int(value) for value in expression.split("-", 1))
+        else:
+            start = int(expression)
+            end = high if step > 1 else start
+        if step < 1 or not low <= start <= end <= high:
+            raise ValueError(f"Invalid cron field: {field}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """
+    A five-field cron schedule (minute, hour, day of month, month, day of week) in UTC.
+    Fields take ``*``, numbers, ranges, lists and steps; Sunday is 0 or 7.
+    """
+
+    def __init__(self, spec: str):
+        fields = spec.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron schedule needs five fields: {spec}")
+        self.spec = spec
+        minutes, hours, days, months, weekdays = (
+            _parse_cron_field(field, low, high) for field, (low, high) in zip(fields, CRON_FIELDS)
+        )
+        self.minutes, self.hours, self.days, self.months = minutes, hours, days, months
+        self.weekdays = {day % 7 for day in weekdays}
+        # as in cron, a restricted day of month and day of week match either of them
+        self.either_day = fields[2] != "*" and fields[4] != "*"
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = moment.isoweekday() % 7 in self.weekdays
+        return day or weekday if self.either_day else day and weekday
+
+    def next_after(self, moment: datetime) -> datetime:
+        """
+        The next_after function returns the first time of the schedule after the moment.
+
+        :param moment: datetime: Aware datetime
+        :return: The next run time in UTC
+        """
+        moment = moment.astimezone(timezone.utc).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron schedule never runs: {self.spec}")
+
+
+class Task:
+    """
+    A function registered as a job: its name, queue, retries and time limit.
+    """
+
+    def __init__(self, name: str, func: Callable, queue: str, max_retries: int, timeout: float):
+        self.name = name
+        self.func = func
+        self.queue = queue
+        self.max_retries = max_retries
+        self.timeout = timeout
+
+
+class JobQueue:
+    """
+    Jobs kept in Redis and run by ``python -m contacts_book.worker``, so they survive restarts of the web workers.
+
+    Every queue is a sorted set of job ids scored by the time they are due, so delayed jobs, retries and
+    cron runs are plain entries in it. A worker claims a due job with one script call, which also checks
+    the concurrency limit of the queue across all workers, and keeps a lease on it in the running set;
+    jobs of a worker that died are requeued when their lease expires; the worker renews the lease while
+    the job runs. Failed jobs are retried with exponential backoff. The job hash (status, progress, result,
+    error) is kept ``result_ttl`` seconds after the job finishes.
+
+    A timed out job is cancelled, but a thread can't be: the job is recorded as timed out, and retried,
+    only after the threadpool calls it made through ``run_sync`` have returned, so it never runs twice at
+    once. Its time limit therefore doesn't bound the threadpool work itself.
+    """
+
+    def __init__(
+        self,
+        prefix: str = "jobs",
+        result_ttl: int = 86400,
+        retry_backoff: float = 5.0,
+        retry_backoff_max: float = 600.0,
+        timeout: float = 300.0,
+    ):
+        self.prefix = prefix
+        self.result_ttl = result_ttl
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.timeout = timeout
+        self.tasks: Dict[str, Task] = {}
+        self.crons: List[Tuple[CronSchedule, Task]] = []
+
+    @property
+    def redis(self):
+        return redis_pool.client
+
+    def job_key(self, job_id: str) -> str:
+        return f"{self.prefix}:job:{job_id}"
+
+    def queue_key(self, queue: str) -> str:
+        return f"{self.prefix}:queue:{queue}"
+
+    def running_key(self, queue: str) -> str:
+        return f"{self.prefix}:running:{queue}"
+
+    def task(
+        self,
+        func: Callable = None,
+        *,
+        name: str = None,
+        queue: str = "default",
+        max_retries: int = 3,
+        timeout: float = None,
+    ) -> Callable:
+        """
+        The task function is a decorator that registers the function as a job. The function is returned
+            unchanged, so it can still be called directly. Async functions run in the worker's event loop,
+            sync ones in its threadpool. Arguments and results must be JSON serializable.
+
+        :param func: Callable: The job function
+        :param name: str: Job name, the module and name of the function by default
+        :param queue: str: Queue of the jobs
+        :param max_retries: int: How many times a failed job is run again
+        :param timeout: float: Seconds a run may take, the queue default if None
+        :return: The function
+        """
+
+        def register(func: Callable) -> Callable:
+            task_name = name or f"{func.__module__}.{func.__qualname__}"
+            self.tasks[task_name] = Task(task_name, func, queue, max_retries, timeout or self.timeout)
+            func.job_name = task_name
+            return func
+
+        return register(func) if func is not None else register
+
+    def cron(self, spec: str, **options) -> Callable:
+        """
+        The cron function is a decorator that registers a job without arguments that workers enqueue
+            on the cron schedule. Only one worker enqueues each run.
+
+        :param spec: str: Cron schedule, for example "0 3 * * *"
+        :param options: Options of the task decorator
+        :return: The decorator
+        """
+        schedule = CronSchedule(spec)
+
+        def register(func: Callable) -> Callable:
+            self.task(func, **options)
+            self.crons.append((schedule, self.tasks[func.job_name]))
+            return func
+
+        return register
+
+    def get_task(self, func: Callable | str) -> Task:
+        name = func if isinstance(func, str) else getattr(func, "job_name", None)
+        if name not in self.tasks:
+            raise KeyError(f"{func} is not a registered job")
+        return self.tasks[name]
+
+    async def enqueue(
+        self,
+        func: Callable | str,
+        *args,
+        delay: float = 0,
+        at: datetime = None,
+        user_id: int = None,
+        **kwargs,
+    ) -> str:
+        """
+        The enqueue function adds a job to the queue of its task.
+
+        :param func: Callable | str: Registered job function or its name
+        :param args: Positional arguments of the job
+        :param delay: float: Seconds to wait before the job is run
+        :param at: datetime: Time to run the job at, instead of delay
+        :param user_id: int: Owner of the job, who can read its status
+        :param kwargs: Keyword arguments of the job
+        :return: The job id
+        """
+        task = self.get_task(func)
+        now = time.time()
+        due = at.timestamp() if at is not None else now + delay
+        job_id = uuid.uuid4().hex
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(
+                self.job_key(job_id),
+                mapping={
+                    "id": job_id,
+                    "task": task.name,
+                    "queue": task.queue,
+                    "args": json.dumps([list(args), kwargs]),
+                    "status": "queued",
+                    "attempts": 0,
+                    "max_retries": task.max_retries,
+                    "user_id": "" if user_id is None else user_id,
+                    "created_at": now,
+                    "scheduled_at": due,
+                },
+            )
+            pipe.zadd(self.queue_key(task.queue), {job_id: due})
+            await pipe.execute()
+        metrics.inc("jobs_enqueued_total", queue=task.queue)
+        return job_id
+
+    async def submit(self, background_tasks: BackgroundTasks, func: Callable, *args, **kwargs) -> str | None:
+        """
+        The submit function enqueues the job, or runs the function as a background task of the response
+            when Redis is not connected or the function is not a registered job.
+
+        :param background_tasks: BackgroundTasks: Background tasks of the response
+        :param func: Callable: Job function
+        :param args: Positional arguments of the job
+        :param kwargs: Keyword arguments of the job
+        :return: The job id, or None if it runs in the web worker
+        """
+        if self.redis is not None and getattr(func, "job_name", None) in self.tasks:
+            return await self.enqueue(func, *args, **kwargs)
+        background_tasks.add_task(func, *args, **kwargs)
+        return None
+
+    async def get(self, job_id: str) -> dict | None:
+        """
+        The get function returns the state of the job: its status, attempts, progress, result and error.
+
+        :param job_id: str: Job id
+        :return: A dictionary, or None if the job doesn't exist or has expired
+        """
+        job = await self.redis.hgetall(self.job_key(job_id))
+        if not job:
+            return None
+        args, kwargs = json.loads(job["args"])
+        return {
+            "id": job["id"],
+            "task": job["task"],
+            "queue": job["queue"],
+            "status": job["status"],
+            "args": args,
+            "kwargs": kwargs,
+            "attempts": int(job["attempts"]),
+            "max_retries": int(job["max_retries"]),
+            "user_id": int(job["user_id"]) if job["user_id"] else None,
+            "progress": json.loads(job["progress"]) if "progress" in job else None,
+            "result": json.loads(job["result"]) if "result" in job else None,
+            "error": job.get("error"),
+            **{
+                field: datetime.fromtimestamp(float(job[field]), timezone.utc) if field in job else None
+                for field in ("created_at", "scheduled_at", "started_at", "finished_at")
+            },
+        }
+
+    async def set_progress(self, progress: Any) -> None:
+        """
+        The set_progress function stores the progress of the running job, for example {"done": 10, "total": 100}.
+            It does nothing outside of a job.
+
+        :param progress: Any: JSON serializable progress
+        :return: None
+        """
+        job_id = current_job()
+        if job_id is not None:
+            await self.redis.hset(self.job_key(job_id), "progress", json.dumps(progress))
+
+    def retry_delay(self, attempts: int) -> float:
+        """
+        The retry_delay function returns the seconds to wait before the next run of a job that failed attempts times.
+
+        :param attempts: int: Runs so far
+        :return: Seconds, doubling with every attempt up to retry_backoff_max
+        """
+        return min(self.retry_backoff * 2 ** (attempts - 1), self.retry_backoff_max)
+
+    async def claim(self, queue: str, limit: int = 0) -> str | None:
+        """
+        The claim function takes the first due job of the queue and leases it to this worker.
+
+        :param queue: str: Queue name
+        :param limit: int: Most jobs of the queue running on all workers, 0 for no limit
+        :return: The job id, or None if there is no due job or the queue is at its limit
+        """
+        now = time.time()
+        return await self.redis.eval(
+            CLAIM_LUA_SCRIPT,
+            2,
+            self.queue_key(queue),
+            self.running_key(queue),
+            now,
+            limit,
+            now + self.timeout + LEASE_MARGIN,
+            f"{self.prefix}:job:",
+        )
+
+    async def execute(self, job_id: str) -> None:
+        """
+        The execute function runs a claimed job and records its result, or schedules a retry if it failed.
+
+        :param job_id: str: Id of a job claimed by this worker
+        :return: None
+        """
+        job = await self.get(job_id)
+        if job is None:
+            return
+        task = self.tasks.get(job["task"])
+        if task is None:
+            await self._finish(job, "failed", error=f"Unknown job {job['task']}")
+            return
+        lease = asyncio.create_task(self._keep_lease(job_id, job["queue"], task.timeout))
+
+        token = _current_job.set(job_id)
+        threads = set()
+        threads_token = _job_threads.set(threads)
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(self._call(task, job["args"], job["kwargs"]), task.timeout)
+        except Exception as err:
+            if isinstance(err, asyncio.TimeoutError):
+                # the threads of the job keep running: it is not retried before they return
+                await asyncio.gather(*(returned.wait() for returned in threads))
+            logger.warning("Job %s (%s) failed", job_id, task.name, exc_info=True)
+            error = "Timed out" if isinstance(err, asyncio.TimeoutError) else f"{type(err).__name__}: {err}"
+            if job["attempts"] <= job["max_retries"]:
+                await self._retry(job, error)
+            else:
+                await self._finish(job, "failed", error=error)
+        else:
+            await self._finish(job, "succeeded", result=result)
+        finally:
+            lease.cancel()
+            _job_threads.reset(threads_token)
+            _current_job.reset(token)
+            metrics.observe("job_duration_seconds", time.perf_counter() - started, queue=job["queue"])
+
+    async def _keep_lease(self, job_id: str, queue: str, timeout: float) -> None:
+        from redis.exceptions import RedisError
+
+        while True:
+            try:
+                # xx: a job that finished in the meantime is not leased again
+                await self.redis.zadd(
+                    self.running_key(queue), {job_id: time.time() + timeout + LEASE_MARGIN}, xx=True
+                )
+            except RedisError:
+                logger.warning("Lease of job %s was not renewed", job_id, exc_info=True)
+            await asyncio.sleep(LEASE_MARGIN / 2)
+
+    async def run_sync(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        The run_sync function runs a sync function in the threadpool. Jobs use it for their blocking work:
+            in a job the thread is tracked, so a timed out job waits for it before it is retried.
+
+        :param func: Callable: Sync function
+        :param args: Positional arguments of the function
+        :param kwargs: Keyword arguments of the function
+        :return: The result of the function
+        """
+        threads = _job_threads.get()
+        if threads is None:
+            return await anyio.to_thread.run_sync(functools.partial(func, *args, **kwargs))
+        loop = asyncio.get_running_loop()
+        returned = asyncio.Event()
+        threads.add(returned)
+
+        def run() -> Any:
+            try:
+                return func(*args, **kwargs)
+            finally:
+                loop.call_soon_threadsafe(returned.set)
+
+        return await anyio.to_thread.run_sync(run)
+
+    async def _call(self, task: Task, args: list, kwargs: dict) -> Any:
+        if asyncio.iscoroutinefunction(task.func):
+            return await task.func(*args, **kwargs)
+        return await self.run_sync(task.func, *args, **kwargs)
+
+    async def _retry(self, job: dict, error: str) -> None:
+        due = time.time() + self.retry_delay(job["attempts"])
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(self.running_key(job["queue"]), job["id"])
+            pipe.hset(self.job_key(job["id"]), mapping={"status": "retrying", "error": error, "scheduled_at": due})
+            pipe.zadd(self.queue_key(job["queue"]), {job["id"]: due})
+            await pipe.execute()
+        metrics.inc("jobs_retried_total", queue=job["queue"])
+
+    async def _finish(self, job: dict, status: str, result: Any = None, error: str = None) -> None:
+        fields = {"status": status, "finished_at": time.time()}
+        if status == "succeeded":
+            fields["result"] = json.dumps(result)
+        else:
+            fields["error"] = error
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(self.running_key(job["queue"]), job["id"])
+            pipe.hset(self.job_key(job["id"]), mapping=fields)
+            pipe.expire(self.job_key(job["id"]), self.result_ttl)
+            await pipe.execute()
+        metrics.inc("jobs_finished_total", queue=job["queue"], status=status)
+
+    async def recover(self, queue: str) -> int:
+        """
+        The recover function requeues the jobs of the queue whose lease has expired: their worker died
+            or lost Redis. A recovered job counts as a failed attempt.
+
+        :param queue: str: Queue name
+        :return: Number of recovered jobs
+        """
+        recovered = 0
+        for job_id in await self.redis.zrangebyscore(self.running_key(queue), "-inf", time.time()):
+            # only the worker that removes the lease recovers the job
+            if not await self.redis.zrem(self.running_key(queue), job_id):
+                continue
+            job = await self.get(job_id)
+            if job is None:
+                continue
+            if job["attempts"] <= job["max_retries"]:
+                await self._retry(job, "Lease expired")
+            else:
+                await self._finish(job, "failed", error="Lease expired")
+            recovered += 1
+        if recovered:
+            metrics.inc("jobs_recovered_total", recovered, queue=queue)
+        return recovered
+
+    async def schedule_cron(self, schedule: CronSchedule, task: Task, run_at: datetime) -> str | None:
+        """
+        The schedule_cron function enqueues the cron run of the task at run_at, unless another worker did.
+
+        :param schedule: CronSchedule: Schedule of the task
+        :param task: Task: Cron task
+        :param run_at: datetime: Time of the run
+        :return: The job id, or None if the run was enqueued already
+        """
+        key = f"{self.prefix}:cron:{task.name}:{int(run_at.timestamp())}"
+        if not await self.redis.set(key, 1, nx=True, ex=86400):
+            return None
+        return await self.enqueue(task.name, at=run_at)
+
+
+class Worker:
+    """
+    Runs the jobs of its queues: each queue gets as many concurrent runners as its limit. Runners poll their
+    queue every ``poll_interval`` seconds while it is empty; one more loop recovers expired leases and
+    enqueues cron runs. ``stop`` lets the running jobs finish.
+    """
+
+    def __init__(self, job_queue: JobQueue, queues: Dict[str, int], poll_interval: float = 0.5):
+        self.job_queue = job_queue
+        self.queues = queues
+        self.poll_interval = poll_interval
+        self._stopping = asyncio.Event()
+        self._task = None
+
+    async def work(self, queue: str) -> bool:
+        """
+        The work function runs one due job of the queue.
+
+        :param queue: str: Queue name
+        :return: True if a job was run
+        """
+        job_id = await self.job_queue.claim(queue, self.queues.get(queue, 0))
+        if job_id is None:
+            return False
+        await self.job_queue.execute(job_id)
+        return True
+
+    async def _sleep(self) -> None:
+        try:
+            await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _runner(self, queue: str) -> None:
+        from redis.exceptions import RedisError
+
+        while not self._stopping.is_set():
+            try:
+                if await self.work(queue):
+                    continue
+            except RedisError:
+                logger.exception("Job queue %s is unavailable", queue)
+            await self._sleep()
+
+    async def _maintain(self) -> None:
+        from redis.exceptions import RedisError
+
+        now = datetime.now(timezone.utc)
+        next_runs = [[schedule.next_after(now), schedule, task] for schedule, task in self.job_queue.crons]
+        while not self._stopping.is_set():
+            try:
+                for queue in self.queues:
+                    await self.job_queue.recover(queue)
+                now = datetime.now(timezone.utc)
+                for entry in next_runs:
+                    run_at, schedule, task = entry
+                    if run_at <= now:
+                        await self.job_queue.schedule_cron(schedule, task, run_at)
+                        # runs missed while no worker was up are skipped
+                        entry[0] = schedule.next_after(now)
+            except RedisError:
+                logger.exception("Job maintenance failed")
+            await self._sleep()
+
+    async def run(self) -> None:
+        """
+        The run function runs the worker until stop is called.
+
+        :return: None
+        """
+        self._stopping.clear()
+        runners = [
+            self._runner(queue) for queue, limit in self.queues.items() for _ in range(max(limit, 1))
+        ]
+        await asyncio.gather(self._maintain(), *runners)
+
+    def start(self) -> None:
+        """
+        The start function runs the worker in a task of the running loop.
+
+        :return: None
+        """
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """
+        The stop function stops claiming jobs and waits for the running ones.
+
+        :return: None
+        """
+        self._stopping.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+
+jobs = JobQueue(
+    result_ttl=settings.jobs_result_ttl,
+    retry_backoff=settings.jobs_retry_backoff,
+    retry_backoff_max=settings.jobs_retry_backoff_max,
+    timeout=settings.jobs_timeout,
+)
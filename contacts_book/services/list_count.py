@@ -0,0 +1,97 @@
+import hashlib
+import logging
+from typing import Tuple
+
+from sqlalchemy.orm import Session
+
+from contacts_book.conf.config import settings
+from contacts_book.database.models import User
+from contacts_book.repository import contacts as repository_contacts
+from contacts_book.repository import stats as repository_stats
+from contacts_book.services.metrics import metrics
+from contacts_book.services.redis_pool import redis_pool
+
+logger = logging.getLogger(__name__)
+
+COUNT_KEY_PREFIX = "contacts:count:"
+
+
+def count_key(user_id: int, version: int, search: str) -> str:
+    # the write version is part of the key: a write of the user makes all the cached counts unused
+    digest = hashlib.sha1(search.lower().encode()).hexdigest()
+    return f"{COUNT_KEY_PREFIX}{user_id}:{version}:{digest}"
+
+
+class ListCount:
+    """
+    Total counts of the contacts list, for the X-Total-Count header.
+
+    The count of all the user's contacts is the maintained total of the user's stats, read by primary key.
+    Search counts are exact while the book has up to ``exact_limit`` contacts; for bigger books they are
+    estimated from a sample of about ``sample_size`` contacts, every n-th id of the book; picking the sample still
+    reads the whole book, so only the search matching is saved. Search counts are cached in Redis for ``ttl``
+    seconds under the write version of the user's contacts, so any write invalidates them.
+    """
+
+    def __init__(self, exact_limit: int = 5000, sample_size: int = 1000, ttl: int = 300):
+        self.exact_limit = exact_limit
+        self.sample_size = sample_size
+        self.ttl = ttl
+
+    async def get_total(self, search: str | None, user: User, db: Session) -> Tuple[int, bool]:
+        """
+        The get_total function returns the number of the user's contacts that match the search.
+
+        :param search: str | None: Filter the contacts by firstname, lastname or email
+        :param user: User: Get the user id
+        :param db: Session: Pass the database session to the function
+        :return: The count and whether it is estimated
+        """
+        total, version = await repository_stats.get_list_counters(user, db)
+        if not search:
+            return total, False
+
+        key = count_key(user.id, version, search)
+        cached = await self._get(key)
+        if cached is not None:
+            metrics.inc("list_count_cache_total", result="hit")
+            count, estimated = cached.split(":")
+            return int(count), estimated == "1"
+        metrics.inc("list_count_cache_total", result="miss")
+
+        if total <= self.exact_limit:
+            count, estimated = await repository_contacts.count_contacts(search, user, db), False
+        else:
+            count, estimated = await repository_contacts.estimate_contacts(
+                search, user, db, total, self.sample_size
+            )
+        await self._set(key, f"{count}:{int(estimated)}")
+        return count, estimated
+
+    async def _get(self, key: str) -> str | None:
+        if redis_pool.client is None:
+            return None
+        from redis.exceptions import RedisError
+
+        try:
+            return await redis_pool.client.get(key)
+        except RedisError:
+            logger.warning("Count cache is not available", exc_info=True)
+            return None
+
+    async def _set(self, key: str, value: str) -> None:
+        if redis_pool.client is None:
+            return
+        from redis.exceptions import RedisError
+
+        try:
+            await redis_pool.client.set(key, value, ex=self.ttl)
+        except RedisError:
+            logger.warning("Count cache is not available", exc_info=True)
+
+
+list_count = ListCount(
+    exact_limit=settings.count_exact_limit,
+    sample_size=settings.count_sample_size,
+    ttl=settings.count_cache_ttl,
+)
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+import weakref
+from collections import deque
+
+from contacts_book.conf.config import settings
+from contacts_book.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LoopWatchdog:
+    """
+    Detects callbacks that block the event loop.
+
+    A heartbeat task sleeps for ``interval`` and measures how late it wakes up (the loop lag).
+    A watchdog thread checks the heartbeat: when the loop hasn't run it for ``threshold`` seconds,
+    it captures the stack of the loop thread and the route of the task running at that moment.
+    When the loop is back, the block is logged, counted in metrics and kept in ``blocks``.
+    """
+
+    def __init__(self, threshold: float = 0.1, interval: float = 0.05, keep: int = 50):
+        self.threshold = threshold
+        self.interval = interval
+        self.blocks = deque(maxlen=keep)
+        self._requests = weakref.WeakKeyDictionary()
+        self._loop = None
+        self._loop_thread_id = None
+        self._last_beat = time.monotonic()
+        self._pending = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def track(self, scope: dict) -> None:
+        """
+        The track function remembers the request scope of the current task, to name the route of a block.
+
+        :param scope: dict: ASGI scope of the request
+        :return: None
+        """
+        task = asyncio.current_task()
+        if task is not None:
+            self._requests[task] = scope
+
+    def _route(self, task) -> str | None:
+        scope = self._requests.get(task) if task is not None else None
+        if scope is None:
+            return None
+        # the route template, never the raw path: it is a metric label, and clients choose paths
+        return getattr(scope.get("route"), "path", None) or "unmatched"
+
+    def _capture(self) -> dict:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame, limit=20)) if frame is not None else ""
+        return {"route": self._route(asyncio.current_task(self._loop)), "stack": stack}
+
+    def _record(self, lag: float) -> None:
+        pending, self._pending = self._pending, None
+        block = {
+            "at": time.time(),
+            "duration_ms": round(lag * 1000, 1),
+            "route": pending["route"] if pending else None,
+            "stack": pending["stack"] if pending else "",
+        }
+        self.blocks.append(block)
+        metrics.inc("event_loop_blocked_total", route=block["route"] or "unknown")
+        metrics.observe("event_loop_blocked_seconds", lag)
+        logger.warning(
+            "Event loop blocked for %.1f ms in %s\n%s",
+            block["duration_ms"],
+            block["route"] or "unknown route",
+            block["stack"],
+        )
+
+    async def _heartbeat(self) -> None:
+        while True:
+            start = time.monotonic()
+            self._last_beat = start
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._last_beat = now
+            lag = max(now - start - self.interval, 0.0)
+            metrics.observe("event_loop_lag_seconds", lag)
+            if lag >= self.threshold:
+                self._record(lag)
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.threshold / 2):
+            if self._pending is None and time.monotonic() - self._last_beat > self.interval + self.threshold:
+                self._pending = self._capture()
+
+    def start(self) -> None:
+        """
+        The start function starts the heartbeat task in the running loop and the watchdog thread.
+
+        :return: None
+        """
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = self._loop.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        """
+        The stop function stops the heartbeat task and the watchdog thread.
+
+        :return: None
+        """
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+loop_watchdog = LoopWatchdog(
+    threshold=settings.loop_watchdog_threshold,
+    interval=settings.loop_watchdog_interval,
+)
@@ -0,0 +1,161 @@
+import itertools
+import linecache
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterable, List
+
+from sqlalchemy.orm import Session
+
+
+class MemoryProfiler:
+    """
+    tracemalloc snapshots of the worker, kept in memory (the latest ``keep`` of them) and compared by id.
+    """
+
+    def __init__(self, keep: int = 5):
+        self.keep = keep
+        self.snapshots: "OrderedDict[int, tracemalloc.Snapshot]" = OrderedDict()
+        self._ids = itertools.count(1)
+
+    def status(self) -> dict:
+        """
+        The status function returns whether tracemalloc is tracing and the traced memory.
+
+        :return: A dictionary with the tracing state
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "tracing": tracemalloc.is_tracing(),
+            "frames": tracemalloc.get_traceback_limit(),
+            "current_bytes": current,
+            "peak_bytes": peak,
+            "snapshots": list(self.snapshots),
+        }
+
+    def start(self, frames: int = 1) -> dict:
+        """
+        The start function starts tracing allocations. More frames give better tracebacks but cost more.
+
+        :param frames: int: Number of frames stored per allocation
+        :return: The tracing state
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        return self.status()
+
+    def stop(self) -> dict:
+        """
+        The stop function stops tracing and drops the snapshots, which are useless without tracing.
+
+        :return: The tracing state
+        """
+        tracemalloc.stop()
+        self.snapshots.clear()
+        return self.status()
+
+    def take_snapshot(self, limit: int = 10) -> dict:
+        """
+        The take_snapshot function takes a snapshot and returns its id and its biggest allocations by line.
+
+        :param limit: int: Number of lines to return
+        :return: A dictionary with the snapshot id and the top lines
+        """
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            )
+        )
+        snapshot_id = next(self._ids)
+        self.snapshots[snapshot_id] = snapshot
+        while len(self.snapshots) > self.keep:
+            self.snapshots.popitem(last=False)
+        return {"id": snapshot_id, "top": format_stats(snapshot.statistics("lineno")[:limit])}
+
+    def diff(self, first_id: int, second_id: int, group_by: str = "lineno", limit: int = 20) -> List[dict]:
+        """
+        The diff function compares two snapshots grouped by file or line, largest growth first.
+
+        :param first_id: int: Id of the older snapshot
+        :param second_id: int: Id of the newer snapshot
+        :param group_by: str: filename or lineno
+        :param limit: int: Number of entries to return
+        :return: A list of dictionaries with the size and count differences
+        """
+        first, second = self.snapshots[first_id], self.snapshots[second_id]
+        return format_stats(second.compare_to(first, group_by)[:limit])
+
+
+def format_stats(stats: Iterable) -> List[dict]:
+    """
+    The format_stats function turns tracemalloc statistics into dictionaries.
+
+    :param stats: Iterable: Statistic or StatisticDiff objects
+    :return: A list of dictionaries
+    """
+    result = []
+    for stat in stats:
+        frame = stat.traceback[0]
+        item = {
+            "file": frame.filename,
+            "line": frame.lineno,
+            "code": linecache.getline(frame.filename, frame.lineno).strip(),
+            "size_bytes": stat.size,
+            "count": stat.count,
+        }
+        if hasattr(stat, "size_diff"):
+            item["size_diff_bytes"] = stat.size_diff
+            item["count_diff"] = stat.count_diff
+        result.append(item)
+    return result
+
+
+def session_stats(sessions: Iterable[Session]) -> List[dict]:
+    """
+    The session_stats function returns the number of ORM objects in the identity map of every session.
+
+    :param sessions: Iterable[Session]: Open sessions
+    :return: A list of dictionaries, biggest identity map first
+    """
+    result = []
+    for session in list(sessions):
+        types = {}
+        for obj in list(session.identity_map.values()):
+            name = type(obj).__name__
+            types[name] = types.get(name, 0) + 1
+        result.append(
+            {
+                "session": id(session),
+                "sticky_key": session.info.get("sticky_key"),
+                "objects": sum(types.values()),
+                "by_type": types,
+            }
+        )
+    return sorted(result, key=lambda item: item["objects"], reverse=True)
+
+
+@contextmanager
+def measure_peak():
+    """
+    The measure_peak function is a context manager that measures the peak of memory allocated inside it.
+        The result dictionary gets the "peak_bytes" key when the block exits.
+
+    :return: A dictionary that gets the peak of allocated memory
+    """
+    result = {}
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    start, _ = tracemalloc.get_traced_memory()
+    try:
+        yield result
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        result["peak_bytes"] = peak - start
+        if not was_tracing:
+            tracemalloc.stop()
+
+
+memory_profiler = MemoryProfiler()
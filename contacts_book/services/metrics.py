@@ -0,0 +1,105 @@
+import threading
+from typing import Callable, Dict, List, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: dict) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in key) + "}"
+
+
+class Metrics:
+    """
+    In-process metrics of the worker, rendered in the Prometheus text format.
+
+    Counters and summaries (count, sum, max) are updated by the code that observes them;
+    gauges come from collectors that are called on every scrape.
+    """
+
+    def __init__(self):
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._summaries: Dict[str, Dict[LabelKey, List[float]]] = {}
+        self._collectors: List[Callable[[], Dict[str, float]]] = []
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """
+        The inc function increments the counter.
+
+        :param name: str: Metric name
+        :param value: float: Increment
+        :param labels: Metric labels
+        :return: None
+        """
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """
+        The observe function adds the value to the summary: its count, sum and max.
+
+        :param name: str: Metric name
+        :param value: float: Observed value
+        :param labels: Metric labels
+        :return: None
+        """
+        key = _label_key(labels)
+        with self._lock:
+            summary = self._summaries.setdefault(name, {}).setdefault(key, [0, 0.0, 0.0])
+            summary[0] += 1
+            summary[1] += value
+            summary[2] = max(summary[2], value)
+
+    def register_collector(self, collector: Callable[[], Dict[str, float]]) -> None:
+        """
+        The register_collector function adds a function that returns gauges (name to value) on every scrape.
+
+        :param collector: Callable: Function returning a dictionary of gauges
+        :return: None
+        """
+        self._collectors.append(collector)
+
+    def counter_value(self, name: str, **labels) -> float:
+        """
+        The counter_value function returns the current value of the counter.
+
+        :param name: str: Metric name
+        :param labels: Metric labels
+        :return: Counter value
+        """
+        return self._counters.get(name, {}).get(_label_key(labels), 0)
+
+    def render(self) -> str:
+        """
+        The render function returns all metrics in the Prometheus text format.
+
+        :return: Metrics as text
+        """
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self._summaries.items()):
+                lines.append(f"# TYPE {name} summary")
+                for key, (count, total, maximum) in series.items():
+                    lines.append(f"{name}_count{_format_labels(key)} {count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {total}")
+                    lines.append(f"{name}_max{_format_labels(key)} {maximum}")
+        for collector in self._collectors:
+            for name, value in collector().items():
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
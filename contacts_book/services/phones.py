@@ -0,0 +1,36 @@
+import re
+
+# E.164 numbers have at most 15 digits; shorter than 8 is not a full number anywhere
+E164_MIN_DIGITS = 8
+E164_MAX_DIGITS = 15
+
+
+def to_e164(phone: str | None, country_code: str = "380") -> str | None:
+    """
+    The to_e164 function returns the phone in E.164 format, like +380661111111, whatever its spaces,
+        dashes and brackets. Numbers with + or 00 are international; a leading 0 is the trunk prefix
+        of a national number, which gets the default country code, like the other numbers without one.
+
+    :param phone: str | None: Phone as entered
+    :param country_code: str: Country code of national numbers
+    :return: The E.164 phone, or None if it is not a phone number
+    """
+    if not phone:
+        return None
+    phone = phone.strip()
+    digits = re.sub(r"\D", "", phone)
+
+    if phone.startswith("+"):
+        number = digits
+    elif digits.startswith("00"):
+        number = digits[2:]
+    elif digits.startswith("0"):
+        number = country_code + digits[1:]
+    elif digits.startswith(country_code) and len(digits) > E164_MIN_DIGITS + 1:
+        number = digits
+    else:
+        number = country_code + digits
+
+    if not E164_MIN_DIGITS <= len(number) <= E164_MAX_DIGITS or number.startswith("0"):
+        return None
+    return f"+{number}"
@@ -0,0 +1,55 @@
+from fastapi_limiter import FastAPILimiter
+from fastapi_limiter.depends import RateLimiter
+from starlette.requests import Request
+from starlette.responses import Response
+
+# like the fastapi-limiter script, but a request adds its weight to the counter instead of 1
+WEIGHTED_LUA_SCRIPT = """local key = KEYS[1]
+local limit = tonumber(ARGV[1])
+local expire_time = tonumber(ARGV[2])
+local weight = tonumber(ARGV[3])
+
+local current = tonumber(redis.call('get', key) or "0")
+if current + weight > limit then
+    local pttl = redis.call("PTTL", key)
+    if pttl < 0 then
+        return expire_time
+    end
+    return pttl
+end
+if current > 0 then
+    redis.call("INCRBY", key, weight)
+else
+    redis.call("SET", key, weight, "px", expire_time)
+end
+return 0"""
+
+
+class WeightedRateLimiter(RateLimiter):
+    """
+    Rate limiter for batch endpoints: one call spends as many hits as the batch has items.
+
+    The weight is known only after the body is parsed, so the handler calls ``hit`` instead of
+    using the limiter as a route dependency. It uses the Redis, identifier and callback of FastAPILimiter.
+    """
+
+    async def hit(self, request: Request, response: Response, weight: int) -> None:
+        """
+        The hit function spends weight hits of the caller, or calls the 429 callback when they are not left.
+
+        :param request: Request: Current request
+        :param response: Response: Current response
+        :param weight: int: Number of hits, the batch size
+        :return: None
+        """
+        if not FastAPILimiter.redis:
+            raise Exception("You must call FastAPILimiter.init in startup event of fastapi!")
+        identifier = self.identifier or FastAPILimiter.identifier
+        callback = self.callback or FastAPILimiter.http_callback
+        rate_key = await identifier(request)
+        key = f"{FastAPILimiter.prefix}:{rate_key}:weighted"
+        pexpire = await FastAPILimiter.redis.eval(
+            WEIGHTED_LUA_SCRIPT, 1, key, str(self.times), str(self.milliseconds), str(weight)
+        )
+        if pexpire != 0:
+            return await callback(request, response, pexpire)
@@ -0,0 +1,107 @@
+from fastapi import HTTPException, status
+
+from contacts_book.conf.config import Settings, settings
+from contacts_book.services.metrics import metrics
+
+
+class RedisPool:
+    """
+    The one Redis connection pool of the worker.
+
+    The rate limiter, caches, token store and job queue all use ``redis_pool.client``.
+    It is opened and closed by the application lifespan.
+    """
+
+    def __init__(self):
+        self.pool = None
+        self.client = None
+
+    async def connect(self, app_settings: Settings = settings) -> None:
+        """
+        The connect function creates the connection pool and the client that uses it.
+            With redis_fake the client is an in-process fakeredis server without a pool.
+
+        :param app_settings: Settings: Settings with the Redis address and pool options
+        :return: None
+        """
+        if app_settings.redis_fake:
+            # in-process Redis for development and tests, from the dev dependencies
+            import fakeredis
+
+            self.client = fakeredis.FakeAsyncRedis(decode_responses=True)
+            return
+
+        import redis.asyncio as redis
+
+        self.pool = redis.ConnectionPool(
+            host=app_settings.redis_host,
+            port=app_settings.redis_port,
+            db=0,
+            encoding="utf-8",
+            decode_responses=True,
+            max_connections=app_settings.redis_max_connections,
+            socket_timeout=app_settings.redis_socket_timeout,
+            socket_connect_timeout=app_settings.redis_connect_timeout,
+            health_check_interval=app_settings.redis_health_check_interval,
+        )
+        self.client = redis.Redis(connection_pool=self.pool)
+
+    async def close(self) -> None:
+        """
+        The close function closes the client and disconnects every pooled connection.
+
+        :return: None
+        """
+        if self.client is not None:
+            await self.client.close()
+        if self.pool is not None:
+            await self.pool.disconnect()
+        self.client = None
+        self.pool = None
+
+    def stats(self) -> dict:
+        """
+        The stats function returns the usage of the connection pool.
+
+        :return: A dictionary with the pool usage
+        """
+        if self.pool is None:
+            return {"connected": False}
+        return {
+            "connected": True,
+            "max_connections": self.pool.max_connections,
+            "created": self.pool._created_connections,
+            "in_use": len(self.pool._in_use_connections),
+            "available": len(self.pool._available_connections),
+        }
+
+
+redis_pool = RedisPool()
+
+
+def _collect_redis_pool() -> dict:
+    stats = redis_pool.stats()
+    if not stats["connected"]:
+        return {}
+    return {
+        "redis_pool_max_connections": stats["max_connections"],
+        "redis_pool_created_connections": stats["created"],
+        "redis_pool_in_use_connections": stats["in_use"],
+        "redis_pool_available_connections": stats["available"],
+    }
+
+
+metrics.register_collector(_collect_redis_pool)
+
+
+async def get_redis():
+    """
+    The get_redis function is the dependency that returns the shared Redis client.
+
+    :return: A Redis client
+    """
+    if redis_pool.client is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Redis is not connected"
+        )
+    return redis_pool.client
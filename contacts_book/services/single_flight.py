@@ -0,0 +1,232 @@
+import asyncio
+import functools
+import hashlib
+import logging
+import uuid
+from enum import Enum
+from typing import Any, Callable, Dict
+
+import orjson
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from contacts_book.conf.config import settings
+from contacts_book.database.db import SessionLocal
+from contacts_book.database.models import User
+from contacts_book.services.metrics import metrics
+from contacts_book.services.redis_pool import redis_pool
+
+logger = logging.getLogger(__name__)
+
+# deletes the lock only if it is still ours
+RELEASE_LUA_SCRIPT = """if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0"""
+
+_MISSING = object()
+
+
+def _key_part(value: Any) -> str:
+    if isinstance(value, Session):
+        # primary and replica reads must not share results: read-your-writes goes to the primary
+        bind = value.get_bind()
+        return f"db={bind.url.render_as_string(hide_password=True)}"
+    if isinstance(value, User):
+        return f"user={value.id}"
+    if isinstance(value, Enum):
+        return repr(value.value)
+    return repr(value)
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent reads: callers with the same key await one computation.
+
+    Reads are sync functions that return plain data, such as row dictionaries, never ORM objects: those are
+    bound to the session that ran the read. The shared read gets a session of its own, on the database of the
+    first caller's session, and closes it: the caller's session is closed when that caller goes away, and
+    sessions are not shared between threads. Within a worker the first caller starts the read
+    in the threadpool and the others await the same task, so a burst of identical requests costs one query
+    and the event loop stays free. With ``redis_enabled`` the first worker to take a Redis lock for the key
+    runs the read and leaves the result in Redis, as JSON, for the callers that were waiting on that lock;
+    the others poll every ``poll_interval`` seconds. A caller only gets the result of a read that was running
+    when it arrived, so nothing older is served.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        redis_enabled: bool = False,
+        lock_timeout: float = 5.0,
+        poll_interval: float = 0.02,
+    ):
+        self.enabled = enabled
+        self.redis_enabled = redis_enabled
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self._calls: Dict[str, asyncio.Task] = {}
+
+    def coalesce(self, func: Callable | None = None, *, decode: Callable[[Any], Any] | None = None) -> Callable:
+        """
+        The coalesce function is a decorator that turns a sync repository read into a coalesced async one.
+            The key is the function and its arguments: a user is keyed by its id and a session by its database,
+            so primary and replica reads are not mixed.
+
+        :param func: Callable | None: Sync repository function returning plain data
+        :param decode: Callable[[Any], Any] | None: Turns a result loaded from JSON back into the types func returns
+        :return: The wrapped async function, or a decorator when func is not given
+        """
+        if func is None:
+            return functools.partial(self.coalesce, decode=decode)
+        name = f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return await run_in_threadpool(func, *args, **kwargs)
+            parts = [_key_part(arg) for arg in args]
+            parts += [f"{key}={_key_part(value)}" for key, value in sorted(kwargs.items())]
+            return await self.do(f"{name}({','.join(parts)})", func, args, kwargs, decode)
+
+        return wrapper
+
+    async def do(
+        self,
+        key: str,
+        func: Callable,
+        args: tuple = (),
+        kwargs: dict | None = None,
+        decode: Callable[[Any], Any] | None = None,
+    ) -> Any:
+        """
+        The do function returns the result of func, computed once for all concurrent callers with the same key.
+            The computation is shielded: a caller that goes away does not cancel it for the others. If its query
+            is cancelled because the client of the first caller disconnected, the others run it again.
+
+        :param key: str: Key of the call
+        :param func: Callable: Sync function, run in the threadpool
+        :param args: tuple: Positional arguments of func
+        :param kwargs: dict | None: Keyword arguments of func
+        :param decode: Callable[[Any], Any] | None: Turns a result shared through Redis back into the types of func
+        :return: The result of func
+        """
+        kwargs = kwargs or {}
+        while True:
+            task = self._calls.get(key)
+            leader = task is None
+            if leader:
+                task = asyncio.ensure_future(self._lead(key, func, args, kwargs, decode))
+                self._calls[key] = task
+                task.add_done_callback(functools.partial(self._done, key))
+                metrics.inc("single_flight_calls_total")
+            else:
+                metrics.inc("single_flight_coalesced_total", scope="worker")
+            try:
+                return await asyncio.shield(task)
+            except SQLAlchemyError as err:
+                # the query was cancelled because the leader's client went away: this caller is still here
+                if leader or getattr(err, "cancelled_by", None) != "disconnect":
+                    raise
+
+    def _done(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # retrieved, so nobody waiting doesn't log "exception was never retrieved"
+            task.exception()
+
+    async def _call(self, func: Callable, args: tuple, kwargs: dict) -> Any:
+        sessions = []
+
+        def own(value: Any) -> Any:
+            if not isinstance(value, Session):
+                return value
+            session = SessionLocal(bind=value.get_bind())
+            # a disconnect of the first caller still cancels the query: the others run it again
+            session.info["query_deadline"] = value.info.get("query_deadline")
+            sessions.append(session)
+            return session
+
+        args = tuple(own(arg) for arg in args)
+        kwargs = {key: own(value) for key, value in kwargs.items()}
+        try:
+            return await run_in_threadpool(func, *args, **kwargs)
+        finally:
+            for session in sessions:
+                await run_in_threadpool(session.close)
+
+    async def _lead(self, key: str, func: Callable, args: tuple, kwargs: dict, decode: Callable | None) -> Any:
+        redis = redis_pool.client
+        if not self.redis_enabled or redis is None:
+            return await self._call(func, args, kwargs)
+
+        from redis.exceptions import RedisError
+
+        lock_key = "singleflight:" + hashlib.sha1(key.encode()).hexdigest()
+        token = uuid.uuid4().hex
+        try:
+            result = await self._follow(redis, lock_key, token)
+        except RedisError:
+            logger.warning("Redis single-flight lock failed, reading without it", exc_info=True)
+            metrics.inc("single_flight_redis_errors_total")
+            return await self._call(func, args, kwargs)
+
+        if result is not _MISSING:
+            metrics.inc("single_flight_coalesced_total", scope="redis")
+            return decode(result) if decode is not None else result
+
+        try:
+            result = await self._call(func, args, kwargs)
+        except BaseException:
+            await self._release(redis, lock_key, token)
+            raise
+        await self._release(redis, lock_key, token, result)
+        return result
+
+    async def _follow(self, redis, lock_key: str, token: str) -> Any:
+        """
+        Takes the lock, or waits for the result of the worker holding it.
+        Returns _MISSING when this worker has to run the read: it holds the lock now, or the holder gave up
+        without a result, or it is taking longer than lock_timeout.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.lock_timeout
+        lock_ms = int(self.lock_timeout * 1000)
+        while loop.time() < deadline:
+            if await redis.set(lock_key, token, nx=True, px=lock_ms):
+                return _MISSING
+            holder = await redis.get(lock_key)
+            if holder is None:
+                continue
+            result_key = f"{lock_key}:{holder}"
+            while loop.time() < deadline:
+                await asyncio.sleep(self.poll_interval)
+                value, current = await redis.mget(result_key, lock_key)
+                if value is not None:
+                    return orjson.loads(value)
+                if current != holder:
+                    break
+        return _MISSING
+
+    async def _release(self, redis, lock_key: str, token: str, result: Any = _MISSING) -> None:
+        from redis.exceptions import RedisError
+
+        try:
+            async with redis.pipeline(transaction=False) as pipe:
+                if result is not _MISSING:
+                    pipe.set(f"{lock_key}:{token}", orjson.dumps(result), px=int(self.lock_timeout * 1000))
+                pipe.eval(RELEASE_LUA_SCRIPT, 1, lock_key, token)
+                await pipe.execute()
+        except RedisError:
+            logger.warning("Redis single-flight result was not shared", exc_info=True)
+            metrics.inc("single_flight_redis_errors_total")
+
+
+single_flight = SingleFlight(
+    enabled=settings.single_flight_enabled,
+    redis_enabled=settings.single_flight_redis,
+    lock_timeout=settings.single_flight_lock_timeout,
+    poll_interval=settings.single_flight_poll_interval,
+)
@@ -0,0 +1,64 @@
+from typing import List
+
+from sqlalchemy import select
+
+from contacts_book.conf.config import settings
+from contacts_book.database.db import SessionLocal, get_engine
+from contacts_book.database.models import User
+from contacts_book.repository import stats as repository_stats
+from contacts_book.services.jobs import jobs
+
+
+def user_ids_after(last_id: int, batch_size: int) -> List[int]:
+    """
+    The user_ids_after function returns the ids of the next batch_size users after last_id, in id order.
+        It blocks: the job runs it in the threadpool.
+
+    :param last_id: int: Id of the last user of the previous batch
+    :param batch_size: int: Users loaded at once
+    :return: A list of user ids
+    """
+    db = SessionLocal(bind=get_engine())
+    try:
+        return db.execute(
+            select(User.id).where(User.id > last_id).order_by(User.id).limit(batch_size)
+        ).scalars().all()
+    finally:
+        db.close()
+
+
+def reconcile_user(user_id: int) -> int:
+    """
+    The reconcile_user function repairs the drifted stats of the user in a transaction of its own.
+        It blocks: the job runs it in the threadpool.
+
+    :param user_id: int: Id of the user
+    :return: The number of counters repaired
+    """
+    db = SessionLocal(bind=get_engine())
+    try:
+        repaired = repository_stats.reconcile_user_stats(user_id, db, settings.stats_recent_days)
+        db.commit()
+        return repaired
+    finally:
+        db.close()
+
+
+@jobs.cron(settings.stats_reconcile_cron, name="reconcile_user_stats")
+async def reconcile_user_stats(batch_size: int = 500) -> int:
+    """
+    The reconcile_user_stats function repairs the drifted stats of all the users, a user per transaction,
+        so the counter rows of a user are locked only while the user's contacts are counted.
+        The queries run in the threadpool, so the worker's event loop keeps running the other jobs.
+
+    :param batch_size: int: Users loaded at once
+    :return: The number of counters repaired
+    """
+    repaired, last_id = 0, 0
+    while True:
+        user_ids = await jobs.run_sync(user_ids_after, last_id, batch_size)
+        if not user_ids:
+            return repaired
+        for user_id in user_ids:
+            repaired += await jobs.run_sync(reconcile_user, user_id)
+        last_id = user_ids[-1]
@@ -0,0 +1,61 @@
+"""
+Job worker entry point.
+
+    python -m contacts_book.worker      # or the contacts-book-worker script
+
+Runs the jobs of the queues in ``JOBS_QUEUES`` ("name:limit" pairs, the limit is the most jobs of the queue
+running at once on all workers) until SIGINT or SIGTERM, then lets the running jobs finish.
+"""
+import asyncio
+import importlib
+import logging
+import signal
+
+from contacts_book.conf.config import Settings, settings
+from contacts_book.database.db import configure_database, dispose_database
+from contacts_book.services.jobs import Worker, jobs, parse_queues
+from contacts_book.services.redis_pool import redis_pool
+
+# modules that register jobs
+JOB_MODULES = (
+    "contacts_book.services.dedup",
+    "contacts_book.services.email",
+    "contacts_book.services.user_stats",
+)
+
+
+async def run(app_settings: Settings = settings) -> None:
+    """
+    The run function connects the database and Redis, registers the jobs and runs the worker until it is stopped.
+
+    :param app_settings: Settings: Settings of the worker
+    :return: None
+    """
+    configure_database(app_settings)
+    await redis_pool.connect(app_settings)
+    for module in JOB_MODULES:
+        importlib.import_module(module)
+
+    worker = Worker(jobs, parse_queues(app_settings.jobs_queues), poll_interval=app_settings.jobs_poll_interval)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, lambda: asyncio.ensure_future(worker.stop()))
+    try:
+        await worker.run()
+    finally:
+        await redis_pool.close()
+        dispose_database()
+
+
+def main() -> None:
+    """
+    The main function runs the worker.
+
+    :return: None
+    """
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run(settings))
+
+
+if __name__ == "__main__":
+    main()
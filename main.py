@@ -1,74 +1,173 @@
-import redis.asyncio as redis
-from fastapi import FastAPI, Path, Query, Depends, HTTPException
-from fastapi_limiter import FastAPILimiter
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from sqlalchemy import text
-from sqlalchemy.orm import Session
-
-from contacts_book.routes import contacts, auth, users
-from contacts_book.database.db import get_db
-from contacts_book.conf.config import settings
+import importlib
+from contextlib import asynccontextmanager
 
-app = FastAPI()
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.middleware.cors import CORSMiddleware
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=settings.origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+from contacts_book.middleware.compression import CompressionMiddleware
+from contacts_book.middleware.concurrency_limit import ConcurrencyLimitMiddleware
+from contacts_book.middleware.idempotency import IdempotencyMiddleware
+from contacts_book.middleware.loop_watchdog import LoopWatchdogMiddleware
+from contacts_book.middleware.read_your_writes import ReadYourWritesMiddleware
+from contacts_book.routes import contacts, auth, users, diagnostics, health, jobs as jobs_routes
+from contacts_book.database.db import configure_database, dispose_database
+from contacts_book.services.change_feed import change_feed
+from contacts_book.services.concurrency_limit import AdaptiveLimiter, Priority
+from contacts_book.services.health import HealthChecker, get_health_checker
+from contacts_book.services.jobs import Worker, jobs, parse_queues
+from contacts_book.services.loop_watchdog import loop_watchdog
+from contacts_book.services.redis_pool import redis_pool
+from contacts_book.conf.config import Settings, settings
 
-app.include_router(auth.router, prefix="/api")
-app.include_router(contacts.router, prefix="/api")
-app.include_router(users.router, prefix='/api')
+# load-shedding order: probes first, then token refresh and login, bulk reads last; event streams are not limited.
+# Only the probes are critical: they don't touch the pool, everything that does is limited
+CONCURRENCY_RULES = [
+    ("GET", "/api/contacts/events", None),
+    ("*", "/api/health/*", Priority.critical),
+    ("GET", "/api/healthchecker", Priority.critical),
+    ("GET", "/api/auth/refresh_token", Priority.high),
+    ("POST", "/api/auth/login", Priority.high),
+    ("GET", "/api/contacts", Priority.low),
+    ("POST", "/api/contacts/batch_*", Priority.low),
+]
 
 
-@app.on_event("startup")
-async def startup():
+@asynccontextmanager
+async def lifespan(app: FastAPI):
     """
-    The startup function is called when the application starts up.
-    It's a good place to initialize things that are used by the app, such as caches or databases.
-    
-    :return: A coroutine, so we need to call it with await
-    :doc-author: Trelent
+    The lifespan function starts the subsystems when the application starts up and stops them when it stops:
+    the shared Redis pool, the rate limiter, the background readiness checks and the database pools.
+    The change feed subscription is started by its first client and stopped here. With JOBS_WORKER_IN_APP
+    the worker runs jobs too, which is meant for development with REDIS_FAKE.
+    Redis is imported here, so importing the application does not load it.
+
+    :param app: FastAPI: The application
+    :return: An async context manager
     """
-    r = await redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0, encoding="utf-8",
-                          decode_responses=True)
-    await FastAPILimiter.init(r)
+    from fastapi_limiter import FastAPILimiter
+
+    await redis_pool.connect(app.state.settings)
+    await FastAPILimiter.init(redis_pool.client)
+    app.state.health_checker.redis = redis_pool.client
+    app.state.health_checker.start()
+    if app.state.settings.loop_watchdog_enabled:
+        loop_watchdog.start()
+    worker = None
+    if app.state.settings.jobs_worker_in_app:
+        from contacts_book.worker import JOB_MODULES
+
+        for module in JOB_MODULES:
+            importlib.import_module(module)
+        worker = Worker(
+            jobs,
+            parse_queues(app.state.settings.jobs_queues),
+            poll_interval=app.state.settings.jobs_poll_interval,
+        )
+        worker.start()
+
+    yield
+
+    if worker is not None:
+        await worker.stop()
+    if app.state.settings.loop_watchdog_enabled:
+        await loop_watchdog.stop()
+    await app.state.health_checker.stop()
+    await change_feed.stop()
+    await redis_pool.close()
+    dispose_database()
 
 
-@app.get("/")
 def read_root():
     """
     The read_root function returns a dictionary with the key &quot;message&quot; and value &quot;Hello World&quot;.
-    
-    
+
+
     :return: A dictionary with a key &quot;message&quot; and value &quot;hello world&quot;
     :doc-author: Trelent
     """
     return {"message": "Hello World"}
 
 
-@app.get("/api/healthchecker")
-def healthchecker(db: Session = Depends(get_db)):
+async def healthchecker(health_checker: HealthChecker = Depends(get_health_checker)):
     """
     The healthchecker function is used to check the health of the database.
-        It will return a message if it can connect to the database, otherwise it will raise an exception.
-    
-    :param db: Session: Pass the database session to the function
+        It reads the cached database check of /api/health/ready, so probes don't query the database.
+
+    :param health_checker: HealthChecker: Readiness checker of the application
     :return: A dictionary with a message
     :doc-author: Trelent
     """
-    try:
-        # Make request
-        result = db.execute(text("SELECT 1")).fetchone()
-        if result is None:
-            raise HTTPException(
-                status_code=500, detail="Database is not configured correctly"
-            )
-        return {"message": "Welcome to FastAPI!"}
-    except Exception as ex:
-        print(ex)
+    result = await health_checker.get_readiness()
+    if not result["checks"]["database"]["ok"]:
         raise HTTPException(status_code=500, detail="Error connecting to the database")
+    return {"message": "Welcome to FastAPI!"}
+
+
+def create_app(app_settings: Settings = settings) -> FastAPI:
+    """
+    The create_app function builds the application. Nothing slow happens here: database engines,
+    the mail config, cloudinary and bcrypt are created on first use, Redis in the lifespan hook.
+    Only one application per process is supported: the database engines, the Redis pool, the change feed,
+    the loop watchdog and the jobs are process-wide, and building an application configures the database
+    for its settings. Only the settings, the health checker and the concurrency limiter live on app.state.
+
+    :param app_settings: Settings: Settings of the application
+    :return: The FastAPI application
+    """
+    configure_database(app_settings)
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.settings = app_settings
+    app.state.health_checker = HealthChecker.from_settings(app_settings)
+    app.state.concurrency_limiter = AdaptiveLimiter.from_settings(app_settings)
+
+    if app_settings.sqlalchemy_replica_urls:
+        app.add_middleware(ReadYourWritesMiddleware)
+
+    app.add_middleware(
+        IdempotencyMiddleware,
+        routes=[("POST", "/api/contacts/"), ("POST", "/api/auth/signup")],
+        ttl=app_settings.idempotency_ttl,
+        lock_timeout=app_settings.idempotency_lock_timeout,
+    )
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=app_settings.origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Total-Count", "X-Total-Count-Estimated"],
+    )
+
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=app_settings.compression_minimum_size,
+        threadpool_min_size=app_settings.compression_threadpool_min_size,
+    )
+
+    if app_settings.loop_watchdog_enabled:
+        app.add_middleware(LoopWatchdogMiddleware, watchdog=loop_watchdog)
+
+    if app_settings.concurrency_limit_enabled:
+        app.add_middleware(
+            ConcurrencyLimitMiddleware,
+            limiter=app.state.concurrency_limiter,
+            rules=CONCURRENCY_RULES,
+            retry_after=app_settings.concurrency_retry_after,
+        )
+
+    app.include_router(auth.router, prefix="/api")
+    app.include_router(contacts.router, prefix="/api")
+    app.include_router(users.router, prefix='/api')
+    app.include_router(diagnostics.router, prefix='/api')
+    app.include_router(health.router, prefix='/api')
+    app.include_router(jobs_routes.router, prefix='/api')
+
+    app.add_api_route("/", read_root, methods=["GET"])
+    app.add_api_route("/api/healthchecker", healthchecker, methods=["GET"])
+
+    return app
+
+
+app = create_app()
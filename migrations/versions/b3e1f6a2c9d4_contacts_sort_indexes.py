@@ -0,0 +1,61 @@
+"""'contacts_sort_indexes'
+
+Revision ID: b3e1f6a2c9d4
+Revises: 4975ee1e0299
+Create Date: 2026-10-19 10:12:41.532114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e1f6a2c9d4'
+down_revision: Union[str, None] = '4975ee1e0299'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+NAME_COLLATION = 'und-x-icu'
+
+INDEXES = {
+    'ix_contacts_user_id_name': ['user_id', 'lastname', 'firstname', 'id'],
+    'ix_contacts_user_id_created_at': ['user_id', 'created_at', 'id'],
+    'ix_contacts_user_id_updated_at': ['user_id', 'updated_at', 'id'],
+    'ix_contacts_user_id_birthday': [
+        'user_id',
+        sa.extract('month', sa.column('birthday')),
+        sa.extract('day', sa.column('birthday')),
+        'id',
+    ],
+}
+
+
+def _set_name_collation(collation: str | None) -> None:
+    # ICU collations exist on PostgreSQL only; other databases keep their default
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for column, nullable in (('firstname', False), ('lastname', True)):
+        op.alter_column(
+            'contacts',
+            column,
+            existing_type=sa.String(length=50),
+            type_=sa.String(length=50, collation=collation),
+            existing_nullable=nullable,
+        )
+
+
+def upgrade() -> None:
+    _set_name_collation(NAME_COLLATION)
+    # built without locking writes to the table on PostgreSQL
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES.items():
+            op.create_index(name, 'contacts', columns, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.drop_index(name, table_name='contacts', postgresql_concurrently=True)
+    _set_name_collation('default')
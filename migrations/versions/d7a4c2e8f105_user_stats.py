@@ -0,0 +1,62 @@
+"""'user_stats'
+
+Revision ID: d7a4c2e8f105
+Revises: b3e1f6a2c9d4
+Create Date: 2026-10-19 14:05:12.418263
+
+"""
+from datetime import datetime, timedelta
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7a4c2e8f105'
+down_revision: Union[str, None] = 'b3e1f6a2c9d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# days of the created counters filled in, at least the STATS_RECENT_DAYS window;
+# the reconciliation job drops the older ones
+BACKFILL_DAYS = 31
+
+
+def upgrade() -> None:
+    user_stats = op.create_table(
+        'user_stats',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=32), nullable=False),
+        sa.Column('value', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id', 'name'),
+    )
+
+    contacts = sa.table(
+        'contacts',
+        sa.column('user_id', sa.Integer),
+        sa.column('birthday', sa.DateTime),
+        sa.column('created_at', sa.DateTime),
+    )
+    month = sa.cast(sa.cast(sa.extract('month', contacts.c.birthday), sa.Integer), sa.String)
+    day = sa.cast(sa.func.date(contacts.c.created_at), sa.String)
+    since = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=BACKFILL_DAYS)
+
+    # name of the counter, grouping columns and filter of its contacts
+    counters = [
+        (sa.literal_column("'contacts'", sa.String), [], sa.true()),
+        (sa.literal_column("'birthdays:'", sa.String) + month, [month], contacts.c.birthday.is_not(None)),
+        (sa.literal_column("'created:'", sa.String) + day, [day], contacts.c.created_at >= since),
+    ]
+    for name, group_by, condition in counters:
+        select = (
+            sa.select(contacts.c.user_id, name, sa.func.count())
+            .where(contacts.c.user_id.is_not(None), condition)
+            .group_by(contacts.c.user_id, *group_by)
+        )
+        op.execute(user_stats.insert().from_select(['user_id', 'name', 'value'], select))
+
+
+def downgrade() -> None:
+    op.drop_table('user_stats')
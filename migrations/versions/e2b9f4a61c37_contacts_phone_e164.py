@@ -0,0 +1,98 @@
+"""'contacts_phone_e164'
+
+Revision ID: e2b9f4a61c37
+Revises: d7a4c2e8f105
+Create Date: 2026-10-19 16:48:27.903514
+
+"""
+import re
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b9f4a61c37'
+down_revision: Union[str, None] = 'd7a4c2e8f105'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEX_NAME = 'ix_contacts_user_id_phone_e164'
+BATCH_SIZE = 1000
+
+# country code of national numbers; another one with: alembic -x phone_country_code=48 upgrade head
+DEFAULT_COUNTRY_CODE = '380'
+E164_MIN_DIGITS = 8
+E164_MAX_DIGITS = 15
+
+
+def _to_e164(phone: str | None, country_code: str) -> str | None:
+    # contacts_book.services.phones.to_e164 as of this revision: a migration must not change with the app
+    if not phone:
+        return None
+    phone = phone.strip()
+    digits = re.sub(r'\D', '', phone)
+
+    if phone.startswith('+'):
+        number = digits
+    elif digits.startswith('00'):
+        number = digits[2:]
+    elif digits.startswith('0'):
+        number = country_code + digits[1:]
+    elif digits.startswith(country_code) and len(digits) > E164_MIN_DIGITS + 1:
+        number = digits
+    else:
+        number = country_code + digits
+
+    if not E164_MIN_DIGITS <= len(number) <= E164_MAX_DIGITS or number.startswith('0'):
+        return None
+    return f'+{number}'
+
+
+def _backfill() -> None:
+    contacts = sa.table(
+        'contacts',
+        sa.column('id', sa.Integer),
+        sa.column('phone', sa.String),
+        sa.column('phone_e164', sa.String),
+    )
+    update = (
+        contacts.update()
+        .where(contacts.c.id == sa.bindparam('contact_id'))
+        .values(phone_e164=sa.bindparam('e164'))
+    )
+    country_code = context.get_x_argument(as_dictionary=True).get('phone_country_code', DEFAULT_COUNTRY_CODE)
+    bind = op.get_bind()
+    last_id = 0
+    # short batches by id, each committed, so a big table is never locked for the whole backfill
+    while True:
+        rows = bind.execute(
+            sa.select(contacts.c.id, contacts.c.phone)
+            .where(contacts.c.id > last_id)
+            .order_by(contacts.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        values = [
+            {'contact_id': id, 'e164': _to_e164(phone, country_code)} for id, phone in rows
+        ]
+        bind.execute(update, values)
+        last_id = rows[-1].id
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column('phone_e164', sa.String(length=16), nullable=True))
+    with op.get_context().autocommit_block():
+        # the phones are normalized in Python, which an offline SQL script cannot do
+        if not context.is_offline_mode():
+            _backfill()
+        # not unique: existing books may have the same number saved twice
+        op.create_index(INDEX_NAME, 'contacts', ['user_id', 'phone_e164'], postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(INDEX_NAME, table_name='contacts', postgresql_concurrently=True)
+    op.drop_column('contacts', 'phone_e164')
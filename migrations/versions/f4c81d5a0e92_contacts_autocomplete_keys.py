@@ -0,0 +1,97 @@
+"""'contacts_autocomplete_keys'
+
+Revision ID: f4c81d5a0e92
+Revises: e2b9f4a61c37
+Create Date: 2026-10-19 18:22:05.316470
+
+"""
+import unicodedata
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4c81d5a0e92'
+down_revision: Union[str, None] = 'e2b9f4a61c37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+FIELDS = ('firstname', 'lastname', 'email')
+BATCH_SIZE = 1000
+
+
+def _autocomplete_key(value: str | None) -> str | None:
+    # contacts_book.services.autocomplete.autocomplete_key as of this revision: a migration must not change with the app
+    if not value:
+        return None
+    chars = []
+    for char in unicodedata.normalize('NFKD', value.casefold()):
+        # accents of Latin letters only: й and и are different Ukrainian letters
+        if unicodedata.combining(char) and chars and chars[-1].isascii():
+            continue
+        chars.append(char)
+    value = ' '.join(unicodedata.normalize('NFC', ''.join(chars)).split())
+    return value or None
+
+
+def _backfill() -> None:
+    contacts = sa.table(
+        'contacts',
+        sa.column('id', sa.Integer),
+        *(sa.column(field, sa.String) for field in FIELDS),
+        *(sa.column(f'{field}_key', sa.String) for field in FIELDS),
+    )
+    update = (
+        contacts.update()
+        .where(contacts.c.id == sa.bindparam('contact_id'))
+        .values({f'{field}_key': sa.bindparam(f'new_{field}_key') for field in FIELDS})
+    )
+    bind = op.get_bind()
+    last_id = 0
+    # short batches by id, each committed, so a big table is never locked for the whole backfill
+    while True:
+        rows = bind.execute(
+            sa.select(contacts.c.id, *(contacts.c[field] for field in FIELDS))
+            .where(contacts.c.id > last_id)
+            .order_by(contacts.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        values = [
+            {
+                'contact_id': row.id,
+                **{f'new_{field}_key': _autocomplete_key(getattr(row, field)) for field in FIELDS},
+            }
+            for row in rows
+        ]
+        bind.execute(update, values)
+        last_id = rows[-1].id
+
+
+def upgrade() -> None:
+    # byte order on PostgreSQL, so a plain btree index serves the prefix ranges
+    key_type = sa.String().with_variant(sa.String(collation='C'), 'postgresql')
+    for field in FIELDS:
+        op.add_column('contacts', sa.Column(f'{field}_key', key_type, nullable=True))
+    with op.get_context().autocommit_block():
+        # the keys are normalized in Python, which an offline SQL script cannot do
+        if not context.is_offline_mode():
+            _backfill()
+        for field in FIELDS:
+            op.create_index(
+                f'ix_contacts_user_id_{field}_key',
+                'contacts',
+                ['user_id', f'{field}_key', 'id'],
+                postgresql_concurrently=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for field in FIELDS:
+            op.drop_index(f'ix_contacts_user_id_{field}_key', table_name='contacts', postgresql_concurrently=True)
+    for field in FIELDS:
+        op.drop_column('contacts', f'{field}_key')
@@ -1,3 +1,5 @@
+from contextlib import contextmanager
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
@@ -5,7 +7,8 @@ from sqlalchemy.orm import sessionmaker
 
 from main import app
 from contacts_book.database.models import Base
-from contacts_book.database.db import get_db
+from contacts_book.database.db import get_db, get_read_db
+from contacts_book.services.memory import measure_peak
 
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -41,6 +44,7 @@ def client(session):
             session.close()
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
 
     yield TestClient(app)
 
@@ -61,4 +65,19 @@ def contact():
         "description": "fff",
         # "user_id": 1,
     }
-    return result
\ No newline at end of file
+    return result
+
+
+@pytest.fixture
+def assert_peak_memory():
+    # with assert_peak_memory(256 * 1024): asyncio.run(repository_call(...))
+
+    @contextmanager
+    def check(limit_bytes: int):
+        with measure_peak() as result:
+            yield result
+        assert result["peak_bytes"] <= limit_bytes, (
+            f"peak memory {result['peak_bytes']} B is over the limit of {limit_bytes} B"
+        )
+
+    return check
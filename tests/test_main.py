@@ -0,0 +1,29 @@
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+
+from main import create_app
+from contacts_book.conf.config import Settings
+
+
+def test_create_app_keeps_its_state_on_the_app():
+    first = create_app(Settings(compression_minimum_size=10, concurrency_limit_initial=7))
+    second = create_app(Settings())
+    assert first is not second
+    assert first.state.settings.compression_minimum_size == 10
+    assert first.state.concurrency_limiter is not second.state.concurrency_limiter
+    assert first.state.concurrency_limiter.limit == 7
+    response = TestClient(first).get("/")
+    assert response.json() == {"message": "Hello World"}
+
+
+def test_import_is_lazy():
+    code = (
+        "import sys, main; "
+        "print(','.join(m for m in ('fastapi_mail', 'cloudinary', 'passlib', 'psycopg2') if m in sys.modules))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout.strip()
+    assert output == ""
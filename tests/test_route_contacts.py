@@ -1,3 +1,4 @@
+from datetime import datetime
 from unittest.mock import MagicMock, patch, AsyncMock
 
 import pytest
@@ -5,6 +6,8 @@ import pytest
 from contacts_book.database.models import User
 from contacts_book.services.auth import auth_service
 from contacts_book.conf import messages
+from contacts_book.conf.config import settings
+from contacts_book.services.content_negotiation import packb, unpackb
 
 
 @pytest.fixture()
@@ -59,6 +62,107 @@ def test_get_contacts(client, contact, token, monkeypatch):
     data = response.json()
     assert type(data) == list
     assert data[0]["firstname"] == contact.get("firstname")
+    assert "X-Total-Count" not in response.headers
+
+
+def test_get_contacts_total_count(client, token, monkeypatch):
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("/api/contacts", params={"count": True, "limit": 0}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.headers["X-Total-Count"] == "1"
+    response = client.get("/api/contacts", params={"count": True, "search": "SOLO"}, headers=headers)
+    assert response.headers["X-Total-Count"] == "1"
+    assert "X-Total-Count-Estimated" not in response.headers
+    response = client.get("/api/contacts", params={"count": True, "search": "vader"}, headers=headers)
+    assert response.headers["X-Total-Count"] == "0"
+
+
+def test_get_contacts_msgpack(client, contact, token, monkeypatch):
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    response = client.get(
+        "/api/contacts",
+        headers={"Authorization": f"Bearer {token}", "Accept": "application/msgpack"},
+    )
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/msgpack"
+    data = unpackb(response.content)
+    assert data[0]["firstname"] == contact.get("firstname")
+    assert data[0]["birthday"] == 187401600
+
+
+def test_get_contacts_sorted(client, contact, token, monkeypatch):
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    response = client.get(
+        "/api/contacts",
+        params={"sort": "-birthday"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()[0]["firstname"] == contact.get("firstname")
+
+    response = client.get(
+        "/api/contacts",
+        params={"sort": "phone"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 422, response.text
+
+
+def test_get_upcoming_birthdays(client, token, monkeypatch):
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    response = client.get(
+        "/api/contacts/upcoming_birthdays", headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200, response.text
+    assert type(response.json()) == list
+
+
+def test_get_contacts_stats(client, token, monkeypatch):
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    response = client.get(
+        "/api/contacts/stats", headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["total"] == 1
+    assert data["recently_added"] == 1
+    assert data["birthdays_this_month"] == (1 if datetime.now().month == 12 else 0)
+    assert data["quota"] == settings.contacts_quota
+
+
+def test_create_contact_over_quota(client, contact, token, monkeypatch):
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    monkeypatch.setattr(settings, "contacts_quota", 1)
+    response = client.post(
+        "/api/contacts",
+        json={**contact, "email": "quota@ex.ua", "phone": "+30669999999"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 403, response.text
+    assert response.json()["detail"] == messages.CONTACTS_QUOTA_EXCEEDED
+
+
+def test_get_contact_events_without_redis(client, token, monkeypatch):
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    response = client.get(
+        "/api/contacts/events", headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 503, response.text
 
 
 def test_get_contact(client, token, contact, monkeypatch):
@@ -103,6 +207,42 @@ def test_update_contact(client, token, contact, monkeypatch):
     assert "id" in data
 
 
+def test_update_contact_msgpack(client, token, contact, monkeypatch):
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    new_contact = contact.copy()
+    new_contact["email"] = "someemail@ex.ua"
+    new_contact["birthday"] = 187401600
+    response = client.put(
+        "/api/contacts/1",
+        content=packb(new_contact),
+        headers={
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/msgpack",
+        },
+    )
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["email"] == new_contact["email"]
+    assert data["birthday"].startswith("1975-12-10T00:00:00")
+
+
+def test_update_contact_invalid_msgpack(client, token, monkeypatch):
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    response = client.put(
+        "/api/contacts/1",
+        content=b"\xc1",
+        headers={
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/msgpack",
+        },
+    )
+    assert response.status_code == 400, response.text
+
+
 def test_update_contact_not_found(client, token, contact, monkeypatch):
     monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
     monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
@@ -120,6 +260,164 @@ def test_update_contact_not_found(client, token, contact, monkeypatch):
     assert data["detail"] == messages.CONTACT_NOT_FOUND
 
 
+def test_batch_get_contacts(client, token, monkeypatch):
+    redis = AsyncMock()
+    redis.eval.return_value = 0
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", redis)
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    response = client.post(
+        "/api/contacts/batch_get",
+        json={"ids": [99, 1, 1]},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert [contact["id"] for contact in data["contacts"]] == [1]
+    assert data["missing"] == [99]
+    # one limiter call, weighted by the batch size
+    redis.eval.assert_awaited_once()
+    assert redis.eval.await_args.args[-1] == "3"
+
+
+def test_batch_get_contacts_too_many(client, token, monkeypatch):
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    response = client.post(
+        "/api/contacts/batch_get",
+        json={"ids": list(range(1, 102))},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 422, response.text
+
+
+def test_batch_update_contacts(client, token, contact, monkeypatch):
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    second = contact.copy()
+    second["email"] = "luke@ex.ua"
+    second["phone"] = "+30662222222"
+    response = client.post(
+        "/api/contacts", json=second, headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 201, response.text
+    second_id = response.json()["id"]
+
+    first = contact.copy()
+    first["email"] = "someemail@ex.ua"
+    first["description"] = "batch"
+    conflict = second.copy()
+    conflict["email"] = first["email"]
+    response = client.post(
+        "/api/contacts/batch_update",
+        json={
+            "items": [
+                {**first, "id": 1},
+                {**conflict, "id": second_id},
+                {**second, "id": 99},
+            ]
+        },
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert [item["status"] for item in data] == [200, 409, 404]
+    assert data[0]["contact"]["description"] == "batch"
+    assert data[1]["detail"] == messages.CONTACT_ALREADY_AXISTS
+    assert data[2]["detail"] == messages.CONTACT_NOT_FOUND
+
+
+def test_merge_contacts(client, token, contact, monkeypatch):
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    headers = {"Authorization": f"Bearer {token}"}
+    duplicate = {**contact, "email": "luke.sky@ex.ua", "phone": "+30 66 333 3333", "description": "imported"}
+    response = client.post("/api/contacts", json=duplicate, headers=headers)
+    assert response.status_code == 201, response.text
+    duplicate_id = response.json()["id"]
+
+    response = client.post("/api/contacts/merge", json={"target_id": 2, "source_ids": [duplicate_id]}, headers=headers)
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["id"] == 2
+    assert data["description"].endswith("imported")
+    assert client.get(f"/api/contacts/{duplicate_id}", headers=headers).status_code == 404
+
+    response = client.post("/api/contacts/merge", json={"target_id": 2, "source_ids": [duplicate_id]}, headers=headers)
+    assert response.status_code == 404, response.text
+    response = client.post("/api/contacts/merge", json={"target_id": 2, "source_ids": [2]}, headers=headers)
+    assert response.status_code == 400, response.text
+
+
+def test_lookup_phone(client, token, monkeypatch):
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("/api/contacts/lookup", params={"phone": "+30 (66) 222-22-22"}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert [item["id"] for item in response.json()] == [2]
+
+    response = client.get("/api/contacts/lookup", params={"phone": "+30669999999"}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json() == []
+
+    response = client.get("/api/contacts/lookup", params={"phone": "12-34"}, headers=headers)
+    assert response.status_code == 422, response.text
+    assert response.json()["detail"] == messages.INVALID_PHONE
+
+
+def test_autocomplete_contacts(client, token, monkeypatch):
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("/api/contacts/autocomplete", params={"q": "HA"}, headers=headers)
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert [item["id"] for item in data] == [1, 2]
+    assert set(data[0]) == {"id", "firstname", "lastname", "email"}
+
+    response = client.get("/api/contacts/autocomplete", params={"q": "luke@", "limit": 1}, headers=headers)
+    assert [item["id"] for item in response.json()] == [2]
+    response = client.get("/api/contacts/autocomplete", params={"q": ""}, headers=headers)
+    assert response.status_code == 422, response.text
+
+
+def test_get_duplicates_without_redis(client, token, monkeypatch):
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/api/contacts/duplicates", headers=headers).status_code == 503
+    assert client.post("/api/contacts/duplicates", headers=headers).status_code == 503
+
+
+def test_get_duplicates(client, token, monkeypatch):
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    monkeypatch.setattr("contacts_book.services.redis_pool.redis_pool.client", AsyncMock())
+    job = {
+        "id": "abc",
+        "status": "succeeded",
+        "result": {"groups": [{"score": 0.9, "ids": [1, 2]}], "contacts": 2, "comparisons": 1, "version": -1},
+    }
+    monkeypatch.setattr("contacts_book.routes.contacts.get_duplicates_search", AsyncMock(return_value=job))
+    response = client.get("/api/contacts/duplicates", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["groups"] == [{"score": 0.9, "ids": [1, 2]}]
+    assert data["stale"] is True
+
+    monkeypatch.setattr("contacts_book.routes.contacts.get_duplicates_search", AsyncMock(return_value=None))
+    response = client.get("/api/contacts/duplicates", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 404, response.text
+
+
 def test_delete_contact(client, token, monkeypatch):
     monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
     monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
@@ -140,3 +438,58 @@ def test_repeat_delete_contact(client, token, monkeypatch):
     assert response.status_code == 404, response.text
     data = response.json()
     assert data["detail"] == messages.CONTACT_NOT_FOUND
+
+
+def test_batch_delete_contacts(client, token, monkeypatch):
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    response = client.post(
+        "/api/contacts/batch_delete",
+        json={"ids": [2, 1]},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 200, response.text
+    assert response.json() == [
+        {"id": 2, "status": 200, "detail": None, "contact": None},
+        {"id": 1, "status": 404, "detail": messages.CONTACT_NOT_FOUND, "contact": None},
+    ]
+
+
+def test_get_job(client, token, user, session, monkeypatch):
+    current_user = session.query(User).filter(User.email == user.get("email")).first()
+    job = {
+        "id": "abc",
+        "task": "contacts_book.services.email.send_email",
+        "queue": "email",
+        "status": "succeeded",
+        "attempts": 1,
+        "max_retries": 5,
+        "user_id": current_user.id,
+        "progress": {"done": 1, "total": 1},
+        "result": None,
+        "error": None,
+        "created_at": "2023-12-10T00:00:00Z",
+        "scheduled_at": "2023-12-10T00:00:00Z",
+        "started_at": "2023-12-10T00:00:01Z",
+        "finished_at": "2023-12-10T00:00:02Z",
+    }
+    monkeypatch.setattr("contacts_book.services.redis_pool.redis_pool.client", MagicMock())
+    get_job = AsyncMock(return_value=job)
+    monkeypatch.setattr("contacts_book.routes.jobs.jobs.get", get_job)
+
+    response = client.get("/api/jobs/abc", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert response.json()["status"] == "succeeded"
+    assert response.json()["progress"] == {"done": 1, "total": 1}
+    get_job.assert_awaited_once_with("abc")
+
+    get_job.return_value = {**job, "user_id": current_user.id + 1}
+    response = client.get("/api/jobs/abc", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 404, response.text
+    assert response.json()["detail"] == messages.JOB_NOT_FOUND
+
+
+def test_get_job_without_redis(client, token):
+    response = client.get("/api/jobs/abc", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 503, response.text
@@ -0,0 +1,73 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from contacts_book.database.db import TimedQueuePool, pool_status, release_connection
+
+
+class TestPoolStatus(unittest.TestCase):
+    def setUp(self) -> None:
+        self.engine = create_engine(
+            "sqlite://", poolclass=TimedQueuePool, pool_size=2, max_overflow=1
+        )
+
+    def tearDown(self) -> None:
+        self.engine.dispose()
+
+    def test_pool_status_checked_out(self):
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            result = pool_status(self.engine)
+            self.assertEqual(result["pool"], "TimedQueuePool")
+            self.assertEqual(result["size"], 2)
+            self.assertEqual(result["checked_out"], 1)
+            self.assertEqual(result["max_overflow"], 1)
+        self.assertEqual(pool_status(self.engine)["checked_out"], 0)
+
+    def test_pool_status_wait_time(self):
+        with self.engine.connect():
+            pass
+        result = pool_status(self.engine)
+        self.assertEqual(result["wait_count"], 1)
+        self.assertGreaterEqual(result["wait_max_ms"], 0)
+
+    def test_wait_count_from_threads(self):
+        def checkout(_):
+            for _ in range(50):
+                with self.engine.connect():
+                    pass
+
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(checkout, range(8)))
+        self.assertEqual(pool_status(self.engine)["wait_count"], 400)
+
+
+class TestReleaseConnection(unittest.TestCase):
+    def setUp(self) -> None:
+        self.engine = create_engine(
+            "sqlite://", poolclass=TimedQueuePool, pool_size=2, max_overflow=1
+        )
+        self.session_maker = sessionmaker(
+            autoflush=False, expire_on_commit=False, bind=self.engine
+        )
+
+    def tearDown(self) -> None:
+        self.engine.dispose()
+
+    def test_session_is_lazy(self):
+        db = self.session_maker()
+        self.assertEqual(self.engine.pool.checkedout(), 0)
+        db.execute(text("SELECT 1"))
+        self.assertEqual(self.engine.pool.checkedout(), 1)
+        db.close()
+
+    def test_release_connection(self):
+        db = self.session_maker()
+        db.execute(text("SELECT 1"))
+        release_connection(db)
+        self.assertEqual(self.engine.pool.checkedout(), 0)
+        release_connection(db)
+        self.assertEqual(self.engine.pool.checkedout(), 0)
+        db.close()
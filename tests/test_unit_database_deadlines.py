@@ -0,0 +1,128 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from contacts_book.conf.config import Settings, settings
+from contacts_book.database.db import configure_database, get_db
+from contacts_book.database.deadlines import Deadline, QueryDeadline, raise_for_cancellation
+from contacts_book.services.metrics import metrics
+
+SLOW_QUERY = text(
+    "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c LIMIT 100000000) SELECT count(*) FROM c"
+)
+
+
+class TestQueryDeadline(unittest.TestCase):
+    def setUp(self) -> None:
+        self.engine = create_engine(
+            "sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False}
+        )
+        self.Session = sessionmaker(bind=self.engine)
+
+    def tearDown(self) -> None:
+        self.engine.dispose()
+
+    def test_deadline_interrupts_statement(self):
+        before = metrics.counter_value("db_queries_cancelled_total", reason="deadline")
+        db = self.Session()
+        db.info["query_deadline"] = QueryDeadline(0.05)
+        start = time.monotonic()
+        with self.assertRaises(OperationalError) as err:
+            db.execute(SLOW_QUERY)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(err.exception.cancelled_by, "deadline")
+        self.assertEqual(metrics.counter_value("db_queries_cancelled_total", reason="deadline"), before + 1)
+        db.close()
+
+        # the connection goes back to the pool without the deadline
+        db = self.Session()
+        self.assertEqual(db.execute(text("SELECT 1")).scalar(), 1)
+        db.close()
+
+    def test_cancel_from_another_thread(self):
+        deadline = QueryDeadline(10)
+        self.assertFalse(deadline.cancel("disconnect"))
+        errors = []
+
+        def run():
+            db = self.Session()
+            db.info["query_deadline"] = deadline
+            try:
+                db.execute(SLOW_QUERY)
+            except OperationalError as err:
+                errors.append(err)
+            finally:
+                db.close()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        while not deadline.executing:
+            time.sleep(0.001)
+        self.assertTrue(deadline.cancel("disconnect"))
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(errors[0].cancelled_by, "disconnect")
+        self.assertEqual(deadline.executing, set())
+
+    def test_raise_for_cancellation(self):
+        request = MagicMock()
+        request.scope = {"route": MagicMock(path="/api/contacts/")}
+        err = OperationalError("SELECT", {}, Exception("interrupted"))
+        raise_for_cancellation(request, err)
+
+        err.cancelled_by = "disconnect"
+        with self.assertRaises(HTTPException) as raised:
+            raise_for_cancellation(request, err)
+        self.assertEqual(raised.exception.status_code, 499)
+
+        before = metrics.counter_value("db_deadline_exceeded_total", route="/api/contacts/")
+        err.cancelled_by = "deadline"
+        with self.assertRaises(HTTPException) as raised:
+            raise_for_cancellation(request, err)
+        self.assertEqual(raised.exception.status_code, 504)
+        self.assertEqual(metrics.counter_value("db_deadline_exceeded_total", route="/api/contacts/"), before + 1)
+
+
+class TestRouteDeadline(unittest.TestCase):
+    def setUp(self) -> None:
+        configure_database(Settings(sqlalchemy_database_url="sqlite://", db_statement_timeout=0.1))
+        app = FastAPI()
+
+        @app.get("/slow", dependencies=[Depends(Deadline(0.05))])
+        def slow(db: Session = Depends(get_db)):
+            return db.execute(SLOW_QUERY).scalar()
+
+        @app.get("/default")
+        def default(db: Session = Depends(get_db)):
+            return db.execute(SLOW_QUERY).scalar()
+
+        @app.get("/fast", dependencies=[Depends(Deadline(5))])
+        def fast(db: Session = Depends(get_db)):
+            return db.execute(text("SELECT 1")).scalar()
+
+        self.client = TestClient(app)
+
+    def tearDown(self) -> None:
+        configure_database(settings)
+
+    def test_route_deadline(self):
+        before = metrics.counter_value("db_deadline_exceeded_total", route="/slow")
+        response = self.client.get("/slow")
+        self.assertEqual(response.status_code, 504, response.text)
+        self.assertEqual(metrics.counter_value("db_deadline_exceeded_total", route="/slow"), before + 1)
+
+    def test_default_deadline(self):
+        self.assertEqual(self.client.get("/default").status_code, 504)
+
+    def test_within_deadline(self):
+        response = self.client.get("/fast")
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertEqual(response.json(), 1)
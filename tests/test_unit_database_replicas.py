@@ -0,0 +1,95 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from contacts_book.database.replicas import ReplicaRouter
+
+
+class TestReplicaRouter(unittest.TestCase):
+    def setUp(self) -> None:
+        self.primary = create_engine("sqlite:///file:primary?mode=memory&uri=true")
+        self.replica = create_engine("sqlite:///file:replica?mode=memory&uri=true")
+        with self.primary.begin() as conn:
+            conn.execute(text("CREATE TABLE IF NOT EXISTS db_name (name VARCHAR)"))
+            conn.execute(text("DELETE FROM db_name"))
+            conn.execute(text("INSERT INTO db_name VALUES ('primary')"))
+        with self.replica.begin() as conn:
+            conn.execute(text("CREATE TABLE IF NOT EXISTS db_name (name VARCHAR)"))
+            conn.execute(text("DELETE FROM db_name"))
+            conn.execute(text("INSERT INTO db_name VALUES ('replica')"))
+        self.router = ReplicaRouter(self.primary, [self.replica], sticky_seconds=60)
+
+    def tearDown(self) -> None:
+        self.primary.dispose()
+        self.replica.dispose()
+
+    def read_name(self, key=None):
+        with Session(bind=self.router.get_read_engine(key)) as session:
+            return session.execute(text("SELECT name FROM db_name")).scalar()
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.read_name("user@ex.ua"), "replica")
+
+    def test_read_your_writes(self):
+        self.router.mark_write("user@ex.ua")
+        self.assertEqual(self.read_name("user@ex.ua"), "primary")
+        self.assertEqual(self.read_name("other@ex.ua"), "replica")
+
+    def test_lagging_replica_falls_back_to_primary(self):
+        self.router.max_lag = 1
+        with patch.object(ReplicaRouter, "replica_lag", return_value=30.0):
+            self.assertEqual(self.read_name(), "primary")
+        self.assertEqual(self.router.status()[0]["healthy"], False)
+
+    def test_unreachable_replica_falls_back_to_primary(self):
+        error = OperationalError("SELECT 1", {}, Exception("down"))
+        with patch.object(ReplicaRouter, "replica_lag", side_effect=error):
+            self.assertEqual(self.read_name(), "primary")
+
+    def test_no_replicas(self):
+        router = ReplicaRouter(self.primary, [])
+        self.assertIs(router.get_read_engine("user@ex.ua"), self.primary)
+
+    def test_one_caller_probes(self):
+        calls = []
+        started = threading.Event()
+
+        def slow_lag(router, replica):
+            calls.append(replica)
+            started.set()
+            time.sleep(0.2)
+            return 0.0
+
+        with patch.object(ReplicaRouter, "replica_lag", slow_lag):
+            with ThreadPoolExecutor(4) as executor:
+                first = executor.submit(self.router.is_healthy, 0)
+                started.wait()
+                # the replica was never checked: the others don't wait and skip it meanwhile
+                self.assertEqual(list(executor.map(self.router.is_healthy, [0, 0, 0])), [False] * 3)
+                self.assertTrue(first.result())
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(self.router.is_healthy(0))
+
+
+class TestSharedReadYourWrites(unittest.IsolatedAsyncioTestCase):
+    async def test_write_is_seen_by_other_workers(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        redis = fakeredis.FakeAsyncRedis()
+        primary = create_engine("sqlite://")
+        worker, other_worker = ReplicaRouter(primary, [], sticky_seconds=60), ReplicaRouter(primary, [])
+        self.assertFalse(await other_worker.wrote_recently("user@ex.ua", redis))
+
+        await worker.remember_write("user@ex.ua", redis)
+        self.assertTrue(await other_worker.wrote_recently("user@ex.ua", redis))
+        self.assertFalse(await other_worker.wrote_recently("other@ex.ua", redis))
+        self.assertFalse(await other_worker.wrote_recently("user@ex.ua", None))
+        self.assertGreater(await redis.pttl("replicas:sticky:user@ex.ua"), 59000)
+        await redis.close()
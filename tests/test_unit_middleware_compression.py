@@ -0,0 +1,111 @@
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from contacts_book.middleware.compression import (
+    CompressionMiddleware,
+    negotiate_encoding,
+    no_compression,
+)
+
+BODY = "contact;" * 1000
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=500, threadpool_min_size=4000)
+
+
+@app.get("/large", response_class=PlainTextResponse)
+async def large():
+    return BODY
+
+
+@app.get("/small", response_class=PlainTextResponse)
+async def small():
+    return "small"
+
+
+@app.get("/opt-out", response_class=PlainTextResponse, dependencies=[Depends(no_compression)])
+async def opt_out():
+    return BODY
+
+
+@app.get("/stream")
+async def stream():
+    async def chunks():
+        for _ in range(10):
+            yield BODY.encode()
+
+    return StreamingResponse(chunks(), media_type="text/csv")
+
+
+@app.get("/events")
+async def events():
+    async def chunks():
+        for _ in range(10):
+            yield BODY.encode()
+
+    return StreamingResponse(chunks(), media_type="text/event-stream")
+
+
+client = TestClient(app)
+
+
+def test_negotiate_encoding():
+    supported = ["zstd", "br", "gzip"]
+    assert negotiate_encoding("gzip, br", supported) == "br"
+    assert negotiate_encoding("gzip;q=1.0, br;q=0.5", supported) == "gzip"
+    assert negotiate_encoding("*", supported) == "zstd"
+    assert negotiate_encoding("identity", supported) is None
+    assert negotiate_encoding("gzip;q=0", supported) is None
+
+
+def test_gzip():
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.text == BODY
+
+
+def test_brotli():
+    pytest.importorskip("brotli")
+    response = client.get("/large", headers={"Accept-Encoding": "br"})
+    assert response.headers["content-encoding"] == "br"
+    assert response.text == BODY
+
+
+def test_zstd():
+    zstandard = pytest.importorskip("zstandard")
+    response = client.get("/large", headers={"Accept-Encoding": "zstd"})
+    assert response.headers["content-encoding"] == "zstd"
+    assert zstandard.ZstdDecompressor().decompressobj().decompress(response.content).decode() == BODY
+
+
+def test_below_minimum_size():
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.text == "small"
+
+
+def test_opt_out():
+    response = client.get("/opt-out", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.text == BODY
+
+
+def test_streaming():
+    response = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.text == BODY * 10
+
+
+def test_no_accept_encoding():
+    response = client.get("/large", headers={"Accept-Encoding": ""})
+    assert "content-encoding" not in response.headers
+    assert response.text == BODY
+
+
+def test_event_stream_not_compressed():
+    response = client.get("/events", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.text == BODY * 10
@@ -0,0 +1,129 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+
+from contacts_book.middleware.idempotency import IdempotencyMiddleware
+
+fakeredis = pytest.importorskip("fakeredis")
+
+calls = []
+
+app = FastAPI()
+app.add_middleware(IdempotencyMiddleware, routes=[("POST", "/items/")], lock_timeout=1.0, poll_interval=0.01)
+
+
+@app.post("/items/", status_code=201)
+async def create_item(item: dict):
+    calls.append(item)
+    await asyncio.sleep(item.get("delay", 0))
+    if item.get("fail"):
+        raise HTTPException(status_code=item.get("status", 503), detail="Unavailable")
+    return {"id": len(calls), **item}
+
+
+@app.post("/other/")
+async def other(item: dict):
+    calls.append(item)
+    return {"id": len(calls)}
+
+
+class TestIdempotencyMiddleware(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        calls.clear()
+        self.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        self.patcher = patch("contacts_book.middleware.idempotency.redis_pool.client", self.redis)
+        self.patcher.start()
+        self.client = httpx.AsyncClient(app=app, base_url="http://test")
+
+    async def asyncTearDown(self) -> None:
+        await self.client.aclose()
+        self.patcher.stop()
+        await self.redis.close()
+
+    async def post(self, json, key="key-1", path="/items/", token="Bearer a"):
+        headers = {"Authorization": token}
+        if key:
+            headers["Idempotency-Key"] = key
+        return await self.client.post(path, json=json, headers=headers)
+
+    async def test_replay(self):
+        first = await self.post({"name": "a"})
+        second = await self.post({"name": "a"})
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second.headers["idempotent-replayed"], "true")
+        self.assertNotIn("idempotent-replayed", first.headers)
+        self.assertEqual(len(calls), 1)
+
+    async def test_keys_are_scoped(self):
+        await self.post({"name": "a"})
+        await self.post({"name": "a"}, token="Bearer b")
+        await self.post({"name": "a"}, key="key-2")
+        self.assertEqual(len(calls), 3)
+
+    async def test_other_body(self):
+        await self.post({"name": "a"})
+        response = await self.post({"name": "b"})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(len(calls), 1)
+
+    async def test_concurrent_duplicate_waits(self):
+        first, second = await asyncio.gather(
+            self.post({"name": "a", "delay": 0.1}), self.post({"name": "a", "delay": 0.1})
+        )
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(
+            sorted(response.headers.get("idempotent-replayed", "") for response in (first, second)), ["", "true"]
+        )
+
+    async def test_concurrent_duplicate_runs_after_failure(self):
+        first, second = await asyncio.gather(
+            self.post({"fail": True, "delay": 0.1}), self.post({"fail": True, "delay": 0.1})
+        )
+        self.assertEqual((first.status_code, second.status_code), (503, 503))
+        self.assertEqual(len(calls), 2)
+
+    async def test_server_error_is_not_stored(self):
+        first = await self.post({"fail": True})
+        second = await self.post({"fail": True})
+        self.assertEqual((first.status_code, second.status_code), (503, 503))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(await self.redis.keys("idempotency:*"), [])
+
+    async def test_rate_limited_is_not_stored(self):
+        for status in (408, 409, 429):
+            with self.subTest(status=status):
+                first = await self.post({"fail": True, "status": status}, key=f"key-{status}")
+                second = await self.post({"fail": True, "status": status}, key=f"key-{status}")
+                self.assertEqual((first.status_code, second.status_code), (status, status))
+                self.assertNotIn("idempotent-replayed", second.headers)
+        self.assertEqual(len(calls), 6)
+        self.assertEqual(await self.redis.keys("idempotency:*"), [])
+
+    async def test_slow_first_request_keeps_the_key(self):
+        # runs longer than lock_timeout: the repeat gets a 409 instead of running it again
+        first, second = await asyncio.gather(
+            self.post({"name": "a", "delay": 1.5}), self.post({"name": "a", "delay": 1.5})
+        )
+        self.assertEqual(sorted((first.status_code, second.status_code)), [201, 409])
+        self.assertEqual(len(calls), 1)
+        third = await self.post({"name": "a", "delay": 1.5})
+        self.assertEqual(third.headers["idempotent-replayed"], "true")
+        self.assertEqual(len(calls), 1)
+
+    async def test_pass_through(self):
+        await self.post({"name": "a"}, key=None)
+        await self.post({"name": "a"}, key=None)
+        await self.post({"name": "a"}, path="/other/")
+        await self.post({"name": "a"}, path="/other/")
+        with patch("contacts_book.middleware.idempotency.redis_pool.client", None):
+            await self.post({"name": "b"})
+            await self.post({"name": "b"})
+        self.assertEqual(len(calls), 6)
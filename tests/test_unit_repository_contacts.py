@@ -4,19 +4,32 @@ from unittest.mock import MagicMock
 from datetime import datetime, timedelta
 
 
+from sqlalchemy import create_engine, event, select
 from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
 
 
-from contacts_book.database.models import Contact, User
-from contacts_book.schemas import ContactModel
+from contacts_book.database.models import Base, Contact, User
+from contacts_book.schemas import ContactModel, ContactSort
 from contacts_book.repository.contacts import (
+    autocomplete_contacts,
+    contact_rows_from_json,
+    contacts_order_by,
     get_contacts,
+    get_contact_rows,
+    get_contact_rows_by_ids,
+    get_contact_rows_by_phone,
+    get_contacts_by_ids,
     get_contact_by_id,
     get_contact_by_unique_fields,
+    get_contacts_by_unique_fields,
     get_upcoming_birthdays,
+    get_upcoming_birthday_rows,
     create_contact,
     update_contact,
+    update_contacts,
     delete_contact,
+    delete_contacts,
 )
 
 
@@ -37,21 +50,62 @@ class TestContactsRepository(unittest.IsolatedAsyncioTestCase):
     async def test_get_cats(self):
         contacts = [Contact(), Contact(), Contact()]
 
-        self.session.query().filter().limit().offset().all.return_value = contacts
+        self.session.query().filter().order_by().limit().offset().all.return_value = contacts
         result = await get_contacts(10, 0, None, self.user, self.session)
         self.assertEqual(result, contacts)
 
         search = "some"
-        self.session.query().filter().limit().offset().all.return_value = contacts
+        self.session.query().filter().order_by().limit().offset().all.return_value = contacts
         result = await get_contacts(10, 0, search, self.user, self.session)
         self.assertEqual(result, contacts)
 
+    async def test_get_contact_rows(self):
+        rows = [{"id": 1, "firstname": "Leya"}, {"id": 2, "firstname": "Han"}]
+        self.session.execute().mappings().all.return_value = rows
+        result = get_contact_rows.__wrapped__(10, 0, None, self.user, self.session)
+        self.assertEqual(result, rows)
+
+        result = get_contact_rows.__wrapped__(10, 0, "some", self.user, self.session)
+        self.assertEqual(result, rows)
+
+    def test_contacts_order_by(self):
+        stmt = select(Contact.id).order_by(*contacts_order_by("name"))
+        self.assertTrue(str(stmt).endswith("ORDER BY contacts.lastname, contacts.firstname, contacts.id"))
+        stmt = select(Contact.id).order_by(*contacts_order_by(ContactSort.created_at_desc))
+        self.assertTrue(str(stmt).endswith("ORDER BY contacts.created_at DESC, contacts.id DESC"))
+        with self.assertRaises(ValueError):
+            contacts_order_by("phone")
+
     async def test_get_contact_by_id(self):
         contact = Contact()
         self.session.query().filter().first.return_value = contact
         result = await get_contact_by_id(self.contact_id, self.user, self.session)
         self.assertEqual(result, contact)
 
+    async def test_get_contact_rows_by_ids(self):
+        rows = [{"id": 1, "firstname": "Leya"}]
+        self.session.execute().mappings().all.return_value = rows
+        result = await get_contact_rows_by_ids([1, 2], self.user, self.session)
+        self.assertEqual(result, rows)
+
+    async def test_get_contact_rows_by_phone(self):
+        rows = [{"id": 1, "firstname": "Leya"}]
+        self.session.execute().mappings().all.return_value = rows
+        result = await get_contact_rows_by_phone("+380661111111", self.user, self.session)
+        self.assertEqual(result, rows)
+
+    async def test_get_contacts_by_ids(self):
+        contacts = [Contact(id=1), Contact(id=2)]
+        self.session.query().filter().all.return_value = contacts
+        result = await get_contacts_by_ids([1, 2], self.user, self.session)
+        self.assertEqual(result, contacts)
+
+    async def test_get_contacts_by_unique_fields(self):
+        contacts = [Contact()]
+        self.session.query().filter().all.return_value = contacts
+        result = await get_contacts_by_unique_fields([self.body], self.user, self.session)
+        self.assertEqual(result, contacts)
+
     async def test_get_contact_by_unique_fields(self):
         contact = Contact()
         self.session.query().filter().first.return_value = contact
@@ -64,6 +118,7 @@ class TestContactsRepository(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result.lastname, self.body.lastname)
         self.assertEqual(result.email, self.body.email)
         self.assertEqual(result.phone, self.body.phone)
+        self.assertEqual(result.phone_e164, "+380661111111")
         self.assertEqual(result.birthday, self.body.birthday)
         self.assertEqual(result.description, self.body.description)
         self.assertTrue(hasattr(result, "id"))
@@ -109,7 +164,7 @@ class TestContactsRepository(unittest.IsolatedAsyncioTestCase):
                 birthday=datetime(1989, date.month, date.day),
             ),
         ]
-        self.session.query().filter().limit().offset().all.return_value = contacts
+        self.session.query().filter().order_by().limit().offset().all.return_value = contacts
         result = await get_upcoming_birthdays(self.user, self.session)
         self.assertEqual(result, contacts)
 
@@ -126,6 +181,166 @@ class TestContactsRepository(unittest.IsolatedAsyncioTestCase):
                 birthday=datetime(1989, date.month, date.day),
             ),
         ]
-        self.session.query().filter().limit().offset().all.return_value = contacts
+        self.session.query().filter().order_by().limit().offset().all.return_value = contacts
         result = await get_upcoming_birthdays(self.user, self.session)
         self.assertEqual(result, [])
+
+    async def test_get_upcoming_birthday_rows(self):
+        soon = datetime.now() + timedelta(days=2)
+        past = datetime.now() - timedelta(days=2)
+        rows = [
+            {"id": 1, "birthday": datetime(1989, soon.month, soon.day)},
+            {"id": 2, "birthday": datetime(1989, past.month, past.day)},
+        ]
+        self.session.execute().mappings.return_value = rows
+        result = get_upcoming_birthday_rows.__wrapped__(self.user, self.session)
+        self.assertEqual(result, rows[:1])
+
+    def test_contact_rows_from_json(self):
+        rows = [{"birthday": "1989-12-06T00:00:00", "created_at": "2026-10-19T10:20:30", "updated_at": None}]
+        self.assertEqual(
+            contact_rows_from_json(rows),
+            [{"birthday": datetime(1989, 12, 6), "created_at": datetime(2026, 10, 19, 10, 20, 30), "updated_at": None}],
+        )
+
+    async def test_update_contacts(self):
+        contact = Contact(id=1)
+        self.session.query().filter().populate_existing().all.return_value = [contact]
+        result = await update_contacts([(contact, self.body)], self.session)
+        self.assertEqual(result, [contact])
+        self.assertEqual(contact.email, self.body.email)
+        self.session.commit.assert_called_once()
+
+    async def test_update_contacts_empty(self):
+        result = await update_contacts([], self.session)
+        self.assertEqual(result, [])
+        self.session.commit.assert_not_called()
+
+    async def test_delete_contacts(self):
+        self.session.execute().all.return_value = [MagicMock(id=1, birthday=None, created_at=None)]
+        result = await delete_contacts([1, 2], self.user, self.session)
+        self.assertEqual(result, [1])
+        self.session.commit.assert_called_once()
+
+
+class TestContactsUniqueFields(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.engine = create_engine(
+            "sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False}
+        )
+        Base.metadata.create_all(self.engine)
+        self.session = Session(self.engine)
+        self.user = User(id=1, email="leya@ex.ua", password="secret")
+        self.session.add(self.user)
+        self.session.commit()
+
+    def tearDown(self) -> None:
+        self.session.close()
+        self.engine.dispose()
+
+    def body(self, email: str, phone: str) -> ContactModel:
+        return ContactModel(
+            firstname="Han", lastname="Solo", email=email, phone=phone, birthday=datetime(1975, 12, 10), description=""
+        )
+
+    async def test_update_finds_other_contact_with_the_number(self):
+        own = await create_contact(self.body("solo@ex.ua", "+380661111111"), self.user, self.session)
+        other = await create_contact(self.body("han@ex.ua", "+380662222222"), self.user, self.session)
+        # keeps its own email and takes the other's number, written differently
+        body = self.body("solo@ex.ua", "066 222 2222")
+        self.assertEqual(await get_contact_by_unique_fields(body, self.user, self.session, exclude_id=own.id), other)
+        body = self.body("solo@ex.ua", "+380663333333")
+        self.assertIsNone(await get_contact_by_unique_fields(body, self.user, self.session, exclude_id=own.id))
+        self.assertEqual(await get_contact_by_unique_fields(body, self.user, self.session), own)
+
+
+class TestContactsSortPlan(unittest.IsolatedAsyncioTestCase):
+    """
+    Every sort order of the contacts list must read an index, without a sort step.
+    """
+
+    def setUp(self) -> None:
+        self.engine = create_engine(
+            "sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False}
+        )
+        Base.metadata.create_all(self.engine)
+        self.session = Session(self.engine)
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute", self.capture)
+
+    def tearDown(self) -> None:
+        self.session.close()
+        self.engine.dispose()
+
+    def capture(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("SELECT"):
+            self.statements.append((statement, parameters))
+
+    def query_plan(self, statement, parameters) -> str:
+        rows = self.session.connection().exec_driver_sql(
+            "EXPLAIN QUERY PLAN " + statement, parameters
+        )
+        return "\n".join(row[-1] for row in rows)
+
+    async def test_sort_orders_use_index(self):
+        for sort in ContactSort:
+            for search in (None, "leya"):
+                with self.subTest(sort=sort.value, search=search):
+                    self.statements.clear()
+                    await get_contact_rows(10, 0, search, User(id=1), self.session, sort)
+                    plan = self.query_plan(*self.statements[-1])
+                    self.assertIn("USING INDEX ix_contacts_user_id_", plan)
+                    self.assertNotIn("TEMP B-TREE", plan)
+
+
+class TestContactsAutocomplete(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.engine = create_engine(
+            "sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False}
+        )
+        Base.metadata.create_all(self.engine)
+        self.session = Session(self.engine)
+        self.user = User(id=1, email="leya@ex.ua", password="secret")
+        self.session.add_all(
+            [
+                self.user,
+                Contact(firstname="Han", lastname="Solo", email="solo@ex.ua", user_id=1),
+                Contact(firstname="Hannah", lastname="Montana", email="hm@ex.ua", user_id=1),
+                Contact(firstname="Zoë", lastname="Hansen", email="zoe@ex.ua", user_id=1),
+                Contact(firstname="Luke", lastname="Skywalker", email="hanfan@ex.ua", user_id=1),
+                Contact(firstname="Hans", lastname="Other", email="hans@ex.ua", user_id=2),
+            ]
+        )
+        self.session.commit()
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute", self.capture)
+
+    def tearDown(self) -> None:
+        self.session.close()
+        self.engine.dispose()
+
+    def capture(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("SELECT"):
+            self.statements.append((statement, parameters))
+
+    async def names(self, prefix: str, limit: int = 10) -> list:
+        return [row["firstname"] for row in await autocomplete_contacts(prefix, limit, self.user, self.session)]
+
+    async def test_prefix_of_any_field(self):
+        # firstnames, the lastname and the email, by the matched key; other users' contacts are not matched
+        self.assertEqual(await self.names("HAN"), ["Han", "Luke", "Hannah", "Zoë"])
+        self.assertEqual(await self.names("han", limit=2), ["Han", "Luke"])
+        self.assertEqual(await self.names("zoe"), ["Zoë"])
+        self.assertEqual(await self.names("solo"), ["Han"])
+        self.assertEqual(await self.names("x"), [])
+        self.assertEqual(await self.names("  "), [])
+
+    async def test_reads_indexes(self):
+        await autocomplete_contacts("han", 10, self.user, self.session)
+        statement, parameters = self.statements[-1]
+        rows = self.session.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)
+        plan = "\n".join(row[-1] for row in rows)
+        for field in ("firstname", "lastname", "email"):
+            self.assertIn(f"USING INDEX ix_contacts_user_id_{field}_key (user_id=? AND {field}_key>? AND", plan)
+        self.assertNotIn("SCAN contacts", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
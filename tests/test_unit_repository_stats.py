@@ -0,0 +1,167 @@
+import unittest
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine, event, select, update
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from contacts_book.database.models import Base, Contact, User, UserStat
+from contacts_book.repository.contacts import (
+    create_contact,
+    delete_contact,
+    delete_contacts,
+    update_contact,
+    update_contacts,
+)
+from contacts_book.repository.stats import (
+    VERSION,
+    ContactsQuotaExceeded,
+    get_contacts_count,
+    get_list_counters,
+    get_user_stats,
+    lock_order,
+    reconcile_user_stats,
+)
+from contacts_book.schemas import ContactModel
+from contacts_book.services.metrics import metrics
+
+
+class TestUserStats(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.engine = create_engine(
+            "sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False}
+        )
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine, expire_on_commit=False)()
+        self.user = User(email="leya@ex.ua", password="secret")
+        self.session.add(self.user)
+        self.session.commit()
+        self.today = datetime.now().date()
+
+    def tearDown(self) -> None:
+        self.session.close()
+        self.engine.dispose()
+
+    def body(self, number: int, month: int = 1) -> ContactModel:
+        return ContactModel(
+            firstname=f"Contact {number}",
+            lastname="Organa",
+            email=f"contact{number}@ex.ua",
+            phone=f"+3806600000{number:02}",
+            birthday=datetime(1990, month, 1),
+            description="",
+        )
+
+    def stats(self) -> dict:
+        return dict(
+            self.session.execute(
+                select(UserStat.name, UserStat.value).where(
+                    UserStat.user_id == self.user.id, UserStat.name != VERSION
+                )
+            ).all()
+        )
+
+    async def test_writes_maintain_stats(self):
+        month = self.today.month
+        other = month % 12 + 1
+        contacts = [await create_contact(self.body(number, month), self.user, self.session) for number in range(3)]
+        self.assertEqual(
+            await get_user_stats(self.user, self.session, today=self.today),
+            {"total": 3, "birthdays_this_month": 3, "recently_added": 3},
+        )
+
+        await update_contact(self.body(0, other), contacts[0].id, self.user, self.session)
+        await update_contacts([(contacts[1], self.body(1, other))], self.session)
+        self.assertEqual(
+            self.stats(),
+            {"contacts": 3, f"birthdays:{month}": 1, f"birthdays:{other}": 2, f"created:{self.today}": 3},
+        )
+
+        await delete_contact(contacts[0].id, self.user, self.session)
+        self.assertEqual(await delete_contacts([contacts[1].id, contacts[2].id, 100], self.user, self.session),
+                         [contacts[1].id, contacts[2].id])
+        self.assertEqual(
+            await get_user_stats(self.user, self.session, today=self.today),
+            {"total": 0, "birthdays_this_month": 0, "recently_added": 0},
+        )
+
+    async def test_recently_added_window(self):
+        contact = await create_contact(self.body(1), self.user, self.session)
+        later = self.today + timedelta(days=7)
+        self.assertEqual((await get_user_stats(self.user, self.session, 8, later))["recently_added"], 1)
+        self.assertEqual((await get_user_stats(self.user, self.session, 7, later))["recently_added"], 0)
+        # a contact keeps the day it was added
+        await update_contact(self.body(1, 5), contact.id, self.user, self.session)
+        self.assertEqual((await get_user_stats(self.user, self.session, 1))["recently_added"], 1)
+
+    async def test_quota(self):
+        await create_contact(self.body(1), self.user, self.session, quota=2)
+        await create_contact(self.body(2), self.user, self.session, quota=2)
+        with self.assertRaises(ContactsQuotaExceeded):
+            await create_contact(self.body(3), self.user, self.session, quota=2)
+        # get_db rolls back
+        self.session.rollback()
+        self.assertEqual(await get_contacts_count(self.user, self.session), 2)
+        self.assertEqual(self.session.query(Contact).count(), 2)
+        # no quota
+        await create_contact(self.body(3), self.user, self.session)
+        self.assertEqual(await get_contacts_count(self.user, self.session), 3)
+
+    async def test_writes_lock_the_total_first(self):
+        self.assertEqual(
+            sorted(["version", "created:2026-10-19", "contacts", "birthdays:3"], key=lock_order),
+            ["contacts", "birthdays:3", "created:2026-10-19", "version"],
+        )
+        names = []
+
+        @event.listens_for(self.engine, "before_cursor_execute")
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("INSERT INTO user_stats"):
+                names.append([value for value in parameters if isinstance(value, str)])
+
+        contact = await create_contact(self.body(1, 3), self.user, self.session)
+        await delete_contact(contact.id, self.user, self.session)
+        event.remove(self.engine, "before_cursor_execute", capture)
+        # create: the reserved total, then the other counters; delete: the total first as well
+        self.assertEqual(names[0], ["contacts"])
+        self.assertEqual(names[1][-1], "version")
+        self.assertEqual(names[2][0], "contacts")
+        self.assertEqual(names[2][1:3], ["birthdays:3", names[1][1]])
+
+    async def test_reconcile_repairs_drift(self):
+        for number in range(2):
+            await create_contact(self.body(number, 3), self.user, self.session)
+        old = await create_contact(self.body(2, 4), self.user, self.session)
+        old_day = date(2020, 1, 1)
+        self.session.execute(
+            update(Contact).where(Contact.id == old.id).values(created_at=datetime(2020, 1, 1, 12))
+        )
+        self.session.execute(
+            update(UserStat)
+            .where(UserStat.user_id == self.user.id, UserStat.name == "contacts")
+            .values(value=10)
+        )
+        self.session.add(UserStat(user_id=self.user.id, name=f"created:{old_day}", value=1))
+        self.session.commit()
+
+        before = metrics.counter_value("user_stats_drift_total")
+        repaired = reconcile_user_stats(self.user.id, self.session, today=self.today)
+        self.session.commit()
+        # the total and today's count drifted; the old day is dropped, not repaired
+        self.assertEqual(repaired, 2)
+        self.assertEqual(metrics.counter_value("user_stats_drift_total"), before + 2)
+        self.assertEqual(
+            self.stats(),
+            {"contacts": 3, "birthdays:3": 2, "birthdays:4": 1, f"created:{self.today}": 2},
+        )
+
+        self.assertEqual(reconcile_user_stats(self.user.id, self.session, today=self.today), 0)
+
+    async def test_writes_bump_version(self):
+        self.assertEqual(await get_list_counters(self.user, self.session), (0, 0))
+        contact = await create_contact(self.body(1), self.user, self.session)
+        # an update that changes no counter is a write too
+        await update_contact(self.body(1), contact.id, self.user, self.session)
+        self.assertEqual(await get_list_counters(self.user, self.session), (1, 2))
+        await delete_contacts([contact.id], self.user, self.session)
+        self.assertEqual(await get_list_counters(self.user, self.session), (0, 3))
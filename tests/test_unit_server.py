@@ -0,0 +1,44 @@
+from unittest.mock import MagicMock, patch
+
+from contacts_book.conf.config import Settings
+from contacts_book.server import gunicorn_options, uvicorn_options, worker_count
+
+
+def test_worker_count():
+    assert worker_count(Settings(server_workers=3)) == 3
+    with patch("contacts_book.server.available_cpus", return_value=8):
+        assert worker_count(Settings(server_workers=0)) == 8
+
+
+def test_uvicorn_options():
+    options = uvicorn_options(
+        Settings(server_workers=2, server_backlog=4096, server_keep_alive=15, server_graceful_timeout=20)
+    )
+    assert options["workers"] == 2
+    assert options["loop"] == "uvloop"
+    assert options["http"] == "httptools"
+    assert options["backlog"] == 4096
+    assert options["timeout_keep_alive"] == 15
+    assert options["timeout_graceful_shutdown"] == 20
+
+
+def test_uvicorn_options_plain():
+    options = uvicorn_options(Settings(server_loop="asyncio", server_http="h11"))
+    assert options["loop"] == "asyncio"
+    assert options["http"] == "h11"
+
+
+def test_gunicorn_options():
+    options = gunicorn_options(Settings(server_workers=4, server_preload=True, server_pin_workers=True))
+    assert options["workers"] == 4
+    assert options["preload_app"] is True
+    assert options["worker_class"] == "uvicorn.workers.UvicornWorker"
+    assert callable(options["post_fork"])
+
+
+def test_pin_worker():
+    options = gunicorn_options(Settings(server_pin_workers=True))
+    worker = MagicMock(age=5, pid=100)
+    with patch("os.sched_getaffinity", return_value={0, 1}), patch("os.sched_setaffinity") as set_affinity:
+        options["post_fork"](MagicMock(), worker)
+    set_affinity.assert_called_once_with(0, {1})
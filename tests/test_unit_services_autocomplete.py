@@ -0,0 +1,25 @@
+import unittest
+
+from contacts_book.database.models import Contact
+from contacts_book.services.autocomplete import MAX_CODE_POINT, autocomplete_key, prefix_range
+
+
+class TestAutocompleteKeys(unittest.TestCase):
+    def test_autocomplete_key(self):
+        self.assertEqual(autocomplete_key("  Zoë   O'Neil "), "zoe o'neil")
+        self.assertEqual(autocomplete_key("ОЛЕКСІЙ"), "олексій")
+        self.assertEqual(autocomplete_key("Straße"), "strasse")
+        self.assertIsNone(autocomplete_key(None))
+        self.assertIsNone(autocomplete_key("   "))
+
+    def test_prefix_range(self):
+        self.assertEqual(prefix_range("han"), ("han", "hao"))
+        self.assertEqual(prefix_range("z"), ("z", "{"))
+        self.assertEqual(prefix_range("a" + chr(MAX_CODE_POINT)), ("a" + chr(MAX_CODE_POINT), None))
+
+    def test_contact_keeps_keys(self):
+        contact = Contact(firstname="Han", lastname="Solo", email="Han.Solo@Ex.ua")
+        self.assertEqual((contact.firstname_key, contact.lastname_key, contact.email_key),
+                         ("han", "solo", "han.solo@ex.ua"))
+        contact.lastname = None
+        self.assertIsNone(contact.lastname_key)
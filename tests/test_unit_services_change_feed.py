@@ -0,0 +1,131 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+import pytest
+
+from contacts_book.services.change_feed import ChangeFeed, format_event
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+class TestChangeFeed(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        self.patcher = patch("contacts_book.services.change_feed.redis_pool.client", self.redis)
+        self.patcher.start()
+        self.feed = ChangeFeed(replay_size=3, queue_size=2)
+
+    async def asyncTearDown(self) -> None:
+        await self.feed.stop()
+        self.patcher.stop()
+        await self.redis.close()
+
+    async def publish(self, *names):
+        return await self.feed.publish(1, [("contact.updated", f'{{"name": "{name}"}}') for name in names])
+
+    async def test_publish_without_redis(self):
+        with patch("contacts_book.services.change_feed.redis_pool.client", None):
+            self.assertEqual(await self.publish("a"), [])
+
+    async def test_replay(self):
+        ids = await self.publish("a", "b", "c")
+        self.assertEqual(len(ids), 3)
+
+        missed = await self.feed.replay(1, ids[0])
+        self.assertEqual([event_id for event_id, _, _ in missed], ids[1:])
+        self.assertEqual(missed[0][1:], ("contact.updated", '{"name": "b"}'))
+        self.assertEqual(await self.feed.replay(1, ids[2]), [])
+        self.assertIsNone(await self.feed.replay(1, "not-an-id"))
+
+    async def test_replay_trimmed(self):
+        ids = await self.publish(*"abcdefgh")
+        # MAXLEN ~ may keep more than replay_size, trim exactly to check the gap
+        await self.redis.xtrim("contacts:feed:1", maxlen=3, approximate=False)
+        self.assertIsNone(await self.feed.replay(1, ids[0]))
+        self.assertEqual(len(await self.feed.replay(1, ids[5])), 2)
+
+    async def test_stream_live_events(self):
+        stream = self.feed.stream(1, heartbeat=0.05)
+        self.assertEqual(await anext(stream), "retry: 3000\n\n")
+        waiting = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.01)
+        # other users' events are not delivered
+        await self.feed.publish(2, [("contact.deleted", '{"id": 5}')])
+        ids = await self.publish("a")
+        self.assertEqual(
+            await asyncio.wait_for(waiting, 1),
+            format_event(ids[0], "contact.updated", '{"name": "a"}'),
+        )
+        self.assertEqual(await asyncio.wait_for(anext(stream), 1), ": ping\n\n")
+        await stream.aclose()
+        self.assertEqual(self.feed._subscribers, {})
+
+    async def test_subscribes_to_connected_users_only(self):
+        first, second = self.feed.stream(1), self.feed.stream(1)
+        await anext(first)
+        await anext(second)
+        self.assertEqual(await self.redis.pubsub_channels(), ["contacts:feed:live:1"])
+        await first.aclose()
+        await asyncio.sleep(0.05)
+        self.assertEqual(await self.redis.pubsub_channels(), ["contacts:feed:live:1"])
+        await second.aclose()
+        await asyncio.sleep(0.05)
+        self.assertEqual(await self.redis.pubsub_channels(), [])
+        # the listener waits for the next subscriber and still delivers its events
+        stream = self.feed.stream(1)
+        await anext(stream)
+        waiting = asyncio.ensure_future(anext(stream))
+        ids = await self.publish("a")
+        self.assertIn(ids[0], await asyncio.wait_for(waiting, 1))
+        await stream.aclose()
+
+    async def test_stream_replays_missed_events(self):
+        ids = await self.publish("a", "b")
+        stream = self.feed.stream(1, last_event_id=ids[0])
+        await anext(stream)
+        self.assertEqual(await anext(stream), format_event(ids[1], "contact.updated", '{"name": "b"}'))
+        waiting = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.01)
+        ids = await self.publish("c")
+        self.assertIn(ids[0], await asyncio.wait_for(waiting, 1))
+        await stream.aclose()
+
+    async def test_stream_reset_when_too_far_behind(self):
+        stream = self.feed.stream(1)
+        await anext(stream)
+        await self.publish("a", "b", "c", "d")
+        await asyncio.sleep(0.05)
+        last_id = (await self.redis.xrevrange("contacts:feed:1", count=1))[0][0]
+        self.assertEqual(await asyncio.wait_for(anext(stream), 1), format_event(last_id, "reset", "{}"))
+        with self.assertRaises(StopAsyncIteration):
+            await anext(stream)
+
+    async def reconnect(self, last_event_id):
+        stream = self.feed.stream(1, last_event_id=last_event_id)
+        await anext(stream)
+        return stream
+
+    async def test_reconnect_with_expired_id_resumes_after_reset(self):
+        ids = await self.publish(*"abcdefgh")
+        await self.redis.xtrim("contacts:feed:1", maxlen=3, approximate=False)
+        reset = format_event(ids[-1], "reset", "{}")
+        for _ in range(2):
+            stream = await self.reconnect(ids[0])
+            self.assertEqual(await anext(stream), reset)
+            with self.assertRaises(StopAsyncIteration):
+                await anext(stream)
+        # the client reconnects with the id of the reset
+        stream = await self.reconnect(ids[-1])
+        ids = await self.publish("i")
+        self.assertEqual(
+            await asyncio.wait_for(anext(stream), 1), format_event(ids[0], "contact.updated", '{"name": "i"}')
+        )
+        await stream.aclose()
+
+    async def test_reset_of_empty_stream_replays_from_the_beginning(self):
+        self.assertEqual(await self.feed.reset_event(1), format_event("0-0", "reset", "{}"))
+        ids = await self.publish("a")
+        stream = await self.reconnect("0-0")
+        self.assertEqual(await anext(stream), format_event(ids[0], "contact.updated", '{"name": "a"}'))
+        await stream.aclose()
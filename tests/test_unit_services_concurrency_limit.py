@@ -0,0 +1,165 @@
+import asyncio
+import unittest
+
+import httpx
+from fastapi import FastAPI
+
+from contacts_book.middleware.concurrency_limit import ConcurrencyLimitMiddleware
+from contacts_book.services.concurrency_limit import AdaptiveLimiter, LimitExceeded, Priority
+from contacts_book.services.metrics import metrics
+
+
+class TestAdaptiveLimiter(unittest.IsolatedAsyncioTestCase):
+    async def test_admits_up_to_the_limit(self):
+        limiter = AdaptiveLimiter(initial=2, queue_timeout=0.05)
+        self.assertEqual(await limiter.acquire(Priority.normal), 0.0)
+        await limiter.acquire(Priority.normal)
+        with self.assertRaises(LimitExceeded) as err:
+            await limiter.acquire(Priority.normal)
+        self.assertEqual(err.exception.reason, "timeout")
+        # critical requests are never queued
+        await limiter.acquire(Priority.critical)
+        self.assertEqual(limiter.inflight, 3)
+
+    async def test_queued_request_waits_for_a_slot(self):
+        limiter = AdaptiveLimiter(initial=1, queue_timeout=1)
+        await limiter.acquire(Priority.normal)
+        waiting = asyncio.ensure_future(limiter.acquire(Priority.normal))
+        await asyncio.sleep(0.02)
+        self.assertEqual(limiter.queued, 1)
+        limiter.release(Priority.normal, 0.01)
+        self.assertGreaterEqual(await waiting, 0.02)
+        self.assertEqual((limiter.inflight, limiter.queued), (1, 0))
+
+    async def test_higher_priority_first(self):
+        limiter = AdaptiveLimiter(initial=1, queue_timeout=1)
+        await limiter.acquire(Priority.normal)
+        order = []
+
+        async def request(priority):
+            await limiter.acquire(priority)
+            order.append(priority)
+
+        tasks = [asyncio.ensure_future(request(priority)) for priority in (Priority.low, Priority.high)]
+        await asyncio.sleep(0.01)
+        limiter.release(Priority.normal, 0.01)
+        await asyncio.sleep(0.01)
+        limiter.release(Priority.high, 0.01)
+        await asyncio.gather(*tasks)
+        self.assertEqual(order, [Priority.high, Priority.low])
+
+    async def test_full_queue_sheds_lower_priority(self):
+        limiter = AdaptiveLimiter(initial=1, max_queue=1, queue_timeout=1)
+        await limiter.acquire(Priority.normal)
+        low = asyncio.ensure_future(limiter.acquire(Priority.low))
+        await asyncio.sleep(0.01)
+        with self.assertRaises(LimitExceeded) as err:
+            await limiter.acquire(Priority.low)
+        self.assertEqual(err.exception.reason, "queue_full")
+
+        high = asyncio.ensure_future(limiter.acquire(Priority.high))
+        await asyncio.sleep(0.01)
+        with self.assertRaises(LimitExceeded) as err:
+            await low
+        self.assertEqual(err.exception.reason, "shed")
+        limiter.release(Priority.normal, 0.01)
+        await high
+
+    async def test_cancelled_waiter_leaves_the_queue(self):
+        limiter = AdaptiveLimiter(initial=1, queue_timeout=1)
+        await limiter.acquire(Priority.normal)
+        waiting = asyncio.ensure_future(limiter.acquire(Priority.normal))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        await asyncio.sleep(0.01)
+        self.assertEqual(limiter.queued, 0)
+        limiter.release(Priority.normal, 0.01)
+        self.assertEqual(limiter.inflight, 0)
+
+    def test_aimd(self):
+        limiter = AdaptiveLimiter(initial=10, min_limit=4, max_limit=11, target_latency=0.1, backoff=0.5)
+        # no growth while the limit is not in use
+        limiter.inflight = 1
+        limiter.release(Priority.normal, 0.01)
+        self.assertEqual(limiter.limit, 10)
+
+        for _ in range(10):
+            limiter.inflight = 10
+            limiter.release(Priority.normal, 0.01)
+        self.assertAlmostEqual(limiter.limit, 11, delta=0.05)
+
+        limiter.inflight = 1
+        limiter.release(Priority.normal, 0.5)
+        self.assertAlmostEqual(limiter.limit, 5.5, delta=0.05)
+        # one decrease per latency window
+        limiter.inflight = 1
+        limiter.release(Priority.normal, 0.01, overloaded=True)
+        self.assertAlmostEqual(limiter.limit, 5.5, delta=0.05)
+
+        limiter._last_decrease = 0
+        limiter.inflight = 1
+        limiter.release(Priority.normal, 0.01, overloaded=True)
+        self.assertEqual(limiter.limit, 4)
+
+
+class TestConcurrencyLimitMiddleware(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.limiter = AdaptiveLimiter(initial=1, max_queue=1, queue_timeout=0.5)
+        app = FastAPI()
+        app.add_middleware(
+            ConcurrencyLimitMiddleware,
+            limiter=self.limiter,
+            rules=[("GET", "/stream", None), ("*", "/health/*", Priority.critical), ("GET", "/list", Priority.low)],
+            retry_after=2,
+        )
+
+        @app.get("/list")
+        async def listing():
+            await asyncio.sleep(0.1)
+            return {"ok": True}
+
+        @app.get("/health/live")
+        async def live():
+            return {"ok": True}
+
+        @app.get("/stream")
+        async def stream():
+            return {"inflight": self.limiter.inflight}
+
+        self.client = httpx.AsyncClient(app=app, base_url="http://test")
+
+    async def asyncTearDown(self) -> None:
+        await self.client.aclose()
+
+    def test_refresh_token_is_limited(self):
+        from main import CONCURRENCY_RULES
+
+        middleware = ConcurrencyLimitMiddleware(None, self.limiter, CONCURRENCY_RULES)
+        self.assertEqual(middleware.priority("GET", "/api/auth/refresh_token"), Priority.high)
+        self.assertEqual(middleware.priority("GET", "/api/health/ready"), Priority.critical)
+
+    def test_priority(self):
+        middleware = ConcurrencyLimitMiddleware(None, self.limiter, [("GET", "/api/contacts", Priority.low)])
+        self.assertEqual(middleware.priority("GET", "/api/contacts/"), Priority.low)
+        self.assertEqual(middleware.priority("GET", "/api/contacts/1"), Priority.normal)
+        self.assertEqual(middleware.priority("POST", "/api/contacts/"), Priority.normal)
+
+    async def test_sheds_with_retry_after(self):
+        before = metrics.counter_value("concurrency_rejected_total", priority="low", reason="queue_full")
+        responses = await asyncio.gather(*(self.client.get("/list") for _ in range(3)))
+        self.assertEqual(sorted(response.status_code for response in responses), [200, 200, 503])
+        rejected = next(response for response in responses if response.status_code == 503)
+        self.assertEqual(rejected.headers["retry-after"], "2")
+        self.assertEqual(
+            metrics.counter_value("concurrency_rejected_total", priority="low", reason="queue_full"), before + 1
+        )
+        self.assertIn("concurrency_queue_wait_seconds_count{priority=\"low\"}", metrics.render())
+        self.assertEqual(self.limiter.inflight, 0)
+
+    async def test_critical_and_exempt_routes(self):
+        listing = asyncio.ensure_future(self.client.get("/list"))
+        await asyncio.sleep(0.02)
+        self.assertEqual((await self.client.get("/health/live")).status_code, 200)
+        response = await self.client.get("/stream")
+        self.assertEqual(response.json(), {"inflight": 1})
+        self.assertEqual((await listing).status_code, 200)
@@ -0,0 +1,36 @@
+import unittest
+
+from starlette.requests import Request
+
+from contacts_book.services.content_negotiation import accept_qualities, wants_msgpack
+
+
+def request(accept: str | None) -> Request:
+    headers = [] if accept is None else [(b"accept", accept.encode())]
+    return Request({"type": "http", "headers": headers})
+
+
+class TestWantsMsgpack(unittest.TestCase):
+    def test_accept_qualities(self):
+        self.assertEqual(
+            accept_qualities("application/json, application/msgpack;v=1; q=0.5, */*;q=x"),
+            {"application/json": 1.0, "application/msgpack": 0.5, "*/*": 0.0},
+        )
+
+    def test_highest_quality_wins(self):
+        cases = {
+            None: False,
+            "application/json": False,
+            "application/msgpack": True,
+            "application/x-msgpack": True,
+            "application/msgpack;q=0": False,
+            "application/json, application/msgpack;q=0.5": False,
+            "application/json;q=0.5, application/msgpack": True,
+            # a tie goes to JSON when it is named, to MessagePack against a wildcard
+            "application/msgpack, application/json": False,
+            "application/msgpack, */*": True,
+            "application/msgpack;q=0.5, */*": False,
+        }
+        for accept, expected in cases.items():
+            with self.subTest(accept=accept):
+                self.assertIs(wants_msgpack(request(accept)), expected)
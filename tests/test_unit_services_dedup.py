@@ -0,0 +1,132 @@
+import tempfile
+import threading
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+
+from sqlalchemy import event, select
+
+from contacts_book.conf.config import Settings, settings
+from contacts_book.database.db import SessionLocal, configure_database, get_engine
+from contacts_book.database.models import Base, Contact, User, UserStat
+from contacts_book.repository.contacts import create_contact, merge_contacts
+from contacts_book.repository.stats import get_list_counters
+from contacts_book.schemas import ContactModel
+from contacts_book.services.dedup import (
+    find_duplicate_contacts,
+    find_duplicates,
+    normalize_email,
+    normalize_name,
+    normalize_phone,
+    soundex,
+)
+
+
+def contact(id, firstname, lastname, email="", phone="", birthday=None):
+    return SimpleNamespace(
+        id=id, firstname=firstname, lastname=lastname, email=email, phone=phone, birthday=birthday
+    )
+
+
+class TestDedupEngine(unittest.TestCase):
+    def test_normalize(self):
+        self.assertEqual(normalize_phone("+380 (66) 111-11-11"), "661111111")
+        self.assertEqual(normalize_phone("066 111 1111"), "661111111")
+        self.assertEqual(normalize_email(" Han.Solo+work@GoogleMail.com"), "hansolo@gmail.com")
+        self.assertEqual(normalize_email("han.solo+x@ex.ua"), "han.solo@ex.ua")
+        self.assertEqual(normalize_name("  Zoë  O'Neil "), "zoe o neil")
+        self.assertEqual(normalize_name("Олександр Гладков"), "oleksandr hladkov")
+
+    def test_soundex(self):
+        self.assertEqual([soundex(word) for word in ("robert", "rupert", "ashcraft", "tymczak", "pfister")],
+                         ["r163", "r163", "a261", "t522", "p236"])
+        self.assertEqual(soundex("smith"), soundex("smyth"))
+        self.assertEqual(soundex(""), "")
+
+    def test_find_duplicates(self):
+        contacts = [
+            contact(1, "Han", "Solo", "han@ex.ua", "+380661111111", datetime(1975, 12, 10)),
+            # other phone format and a typo in the name
+            contact(2, "Hann", "Solo", "solo@ex.ua", "066 111 11 11", datetime(1975, 12, 10)),
+            # same email, swapped names
+            contact(3, "Solo", "Han", "HAN@ex.ua", "+380669999999"),
+            # same name only
+            contact(4, "Han", "Solo", "other@ex.ua", "+380667777777"),
+            # shared phone, another person
+            contact(5, "Leia", "Organa", "leia@ex.ua", "+380661111111"),
+            contact(6, "Luke", "Skywalker", "luke@ex.ua", "+380662222222"),
+        ]
+        result = find_duplicates(contacts)
+        self.assertEqual([group["ids"] for group in result["groups"]], [[1, 2, 3]])
+        self.assertGreaterEqual(result["groups"][0]["score"], 0.9)
+        self.assertEqual(result["contacts"], 6)
+        # pairs sharing a block only, not all 15
+        self.assertLess(result["comparisons"], 15)
+
+    def test_big_blocks_are_skipped(self):
+        contacts = [contact(number, "Office", f"Worker{number}", phone="+380440000000") for number in range(5)]
+        self.assertEqual(find_duplicates(contacts, max_block_size=4)["comparisons"], 0)
+        self.assertEqual(find_duplicates(contacts, max_block_size=5)["comparisons"], 10)
+
+
+class TestDedupJob(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        # a file: the job reads in a thread, and an in-memory database is per connection
+        self.directory = tempfile.TemporaryDirectory()
+        configure_database(Settings(sqlalchemy_database_url=f"sqlite:///{self.directory.name}/dedup.db"))
+        Base.metadata.create_all(get_engine())
+        self.session = SessionLocal(bind=get_engine())
+        self.user = User(email="leya@ex.ua", password="secret")
+        self.session.add(self.user)
+        self.session.commit()
+
+    def tearDown(self) -> None:
+        self.session.close()
+        get_engine().dispose()
+        configure_database(settings)
+        self.directory.cleanup()
+
+    def body(self, firstname: str, email: str, phone: str, description: str = "") -> ContactModel:
+        return ContactModel(
+            firstname=firstname,
+            lastname="Solo",
+            email=email,
+            phone=phone,
+            birthday=datetime(1975, 12, 10),
+            description=description,
+        )
+
+    async def test_find_and_merge(self):
+        first = await create_contact(self.body("Han", "han@ex.ua", "+380661111111", "pilot"), self.user, self.session)
+        second = await create_contact(
+            self.body("Hann", "solo@ex.ua", "066 111 1111", "smuggler"), self.user, self.session
+        )
+        await create_contact(self.body("Luke", "luke@ex.ua", "+380662222222"), self.user, self.session)
+
+        result = await find_duplicate_contacts(self.user.id)
+        self.assertEqual([group["ids"] for group in result["groups"]], [[first.id, second.id]])
+        _, version = await get_list_counters(self.user, self.session)
+        self.assertEqual(result["version"], version)
+
+        merged = await merge_contacts(first, [second], self.user, self.session)
+        self.assertEqual(merged.description, "pilot\nsmuggler")
+        self.assertEqual(merged.email, "han@ex.ua")
+        self.assertEqual(self.session.query(Contact).count(), 2)
+        stats = dict(self.session.execute(select(UserStat.name, UserStat.value)).all())
+        self.assertEqual((stats["contacts"], stats["birthdays:12"]), (2, 2))
+        self.assertEqual((await find_duplicate_contacts(self.user.id))["groups"], [])
+
+    async def test_job_does_not_query_on_the_event_loop(self):
+        threads = set()
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            threads.add(threading.get_ident())
+
+        event.listen(get_engine(), "before_cursor_execute", capture)
+        try:
+            result = await find_duplicate_contacts(self.user.id)
+        finally:
+            event.remove(get_engine(), "before_cursor_execute", capture)
+        self.assertEqual(result["contacts"], 0)
+        self.assertTrue(threads)
+        self.assertNotIn(threading.get_ident(), threads)
@@ -0,0 +1,52 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from sqlalchemy import create_engine
+
+from contacts_book.services.health import HealthChecker
+
+
+class TestHealthChecker(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.engine = create_engine("sqlite://")
+        self.checker = HealthChecker(self.engine, interval=60)
+        self.checker.redis = AsyncMock()
+
+    def tearDown(self) -> None:
+        self.engine.dispose()
+
+    async def test_ready(self):
+        result = await self.checker.get_readiness()
+        self.assertTrue(result["ready"])
+        self.assertTrue(result["checks"]["database"]["ok"])
+        self.assertTrue(result["checks"]["redis"]["ok"])
+        self.assertIn("saturation", result["checks"]["pool"])
+
+    async def test_redis_down(self):
+        self.checker.redis.ping.side_effect = ConnectionError("refused")
+        result = await self.checker.get_readiness()
+        self.assertFalse(result["ready"])
+        self.assertEqual(result["checks"]["redis"]["error"], "refused")
+
+    async def test_result_is_cached(self):
+        with patch.object(HealthChecker, "check_db", return_value={"ok": True}) as check_db:
+            await asyncio.gather(*(self.checker.get_readiness() for _ in range(10)))
+            await self.checker.get_readiness()
+        self.assertEqual(check_db.call_count, 1)
+
+    async def test_background_refresh(self):
+        self.checker.start()
+        await asyncio.sleep(0.05)
+        self.assertIsNotNone(self.checker._result)
+        await self.checker.stop()
+        self.assertIsNone(self.checker._task)
+
+    async def test_background_refresh_survives_errors(self):
+        with patch.object(HealthChecker, "check_pool", side_effect=[RuntimeError("boom"), {"ok": True}]):
+            self.checker.interval = 0.01
+            self.checker.start()
+            await asyncio.sleep(0.05)
+            self.assertFalse(self.checker._task.done())
+            self.assertTrue(self.checker._result["checks"]["pool"]["ok"])
+        await self.checker.stop()
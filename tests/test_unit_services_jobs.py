@@ -0,0 +1,194 @@
+import asyncio
+import time
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from contacts_book.services.jobs import CronSchedule, JobQueue, Worker, current_job, parse_queues
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def test_parse_queues():
+    assert parse_queues("default:4, email:8,bulk") == {"default": 4, "email": 8, "bulk": 1}
+
+
+def test_cron_schedule():
+    start = datetime(2023, 12, 10, 10, 30, 15, tzinfo=timezone.utc)  # a Sunday
+    assert CronSchedule("* * * * *").next_after(start) == datetime(2023, 12, 10, 10, 31, tzinfo=timezone.utc)
+    assert CronSchedule("0 3 * * *").next_after(start) == datetime(2023, 12, 11, 3, 0, tzinfo=timezone.utc)
+    assert CronSchedule("*/20 * * * *").next_after(start) == datetime(2023, 12, 10, 10, 40, tzinfo=timezone.utc)
+    assert CronSchedule("0 9 * * 1-5").next_after(start) == datetime(2023, 12, 11, 9, 0, tzinfo=timezone.utc)
+    assert CronSchedule("0 0 1 1 *").next_after(start) == datetime(2024, 1, 1, 0, 0, tzinfo=timezone.utc)
+    assert CronSchedule("0 0 29 2 *").next_after(start) == datetime(2024, 2, 29, 0, 0, tzinfo=timezone.utc)
+    # a restricted day of month and day of week match either
+    assert CronSchedule("0 0 20 * 0,7").next_after(start) == datetime(2023, 12, 17, 0, 0, tzinfo=timezone.utc)
+    for spec in ("* * * *", "60 * * * *", "* * 0 * *", "*/0 * * * *"):
+        with pytest.raises(ValueError):
+            CronSchedule(spec)
+
+
+class TestJobQueue(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        self.patcher = patch("contacts_book.services.jobs.redis_pool.client", self.redis)
+        self.patcher.start()
+        self.jobs = JobQueue(retry_backoff=0.01, timeout=1.0)
+        self.worker = Worker(self.jobs, {"default": 2}, poll_interval=0.01)
+        self.calls = []
+
+        @self.jobs.task(name="add")
+        async def add(a, b=0):
+            self.calls.append(current_job())
+            await self.jobs.set_progress({"done": 1})
+            return a + b
+
+        @self.jobs.task(name="flaky", max_retries=2)
+        def flaky():
+            self.calls.append(current_job())
+            raise ValueError("boom")
+
+        @self.jobs.task(name="slow", max_retries=0, timeout=0.05)
+        async def slow():
+            await asyncio.sleep(1)
+
+    async def asyncTearDown(self) -> None:
+        self.patcher.stop()
+        await self.redis.close()
+
+    async def test_run_job(self):
+        job_id = await self.jobs.enqueue("add", 1, b=2, user_id=7)
+        job = await self.jobs.get(job_id)
+        self.assertEqual((job["status"], job["user_id"], job["args"], job["kwargs"]), ("queued", 7, [1], {"b": 2}))
+
+        self.assertTrue(await self.worker.work("default"))
+        job = await self.jobs.get(job_id)
+        self.assertEqual(job["status"], "succeeded")
+        self.assertEqual(job["result"], 3)
+        self.assertEqual(job["progress"], {"done": 1})
+        self.assertEqual(job["attempts"], 1)
+        self.assertEqual(self.calls, [job_id])
+        self.assertGreater(await self.redis.ttl(f"jobs:job:{job_id}"), 0)
+        self.assertFalse(await self.worker.work("default"))
+
+    async def test_delayed_job(self):
+        job_id = await self.jobs.enqueue("add", 1, delay=0.05)
+        self.assertFalse(await self.worker.work("default"))
+        await asyncio.sleep(0.06)
+        self.assertTrue(await self.worker.work("default"))
+        self.assertEqual((await self.jobs.get(job_id))["status"], "succeeded")
+
+    async def test_retries_with_backoff(self):
+        job_id = await self.jobs.enqueue("flaky")
+        self.assertTrue(await self.worker.work("default"))
+        job = await self.jobs.get(job_id)
+        self.assertEqual(job["status"], "retrying")
+        self.assertEqual(job["error"], "ValueError: boom")
+        # not due before the backoff
+        self.assertFalse(await self.worker.work("default"))
+
+        await asyncio.sleep(0.02)
+        self.assertTrue(await self.worker.work("default"))
+        await asyncio.sleep(0.03)
+        self.assertTrue(await self.worker.work("default"))
+        job = await self.jobs.get(job_id)
+        self.assertEqual((job["status"], job["attempts"]), ("failed", 3))
+        self.assertEqual(len(self.calls), 3)
+
+    def test_retry_delay(self):
+        queue = JobQueue(retry_backoff=5, retry_backoff_max=30)
+        self.assertEqual([queue.retry_delay(attempt) for attempt in range(1, 5)], [5, 10, 20, 30])
+
+    async def test_timeout(self):
+        job_id = await self.jobs.enqueue("slow")
+        self.assertTrue(await self.worker.work("default"))
+        job = await self.jobs.get(job_id)
+        self.assertEqual((job["status"], job["error"]), ("failed", "Timed out"))
+
+    async def test_timeout_waits_for_thread(self):
+        returned = []
+
+        @self.jobs.task(name="blocking", max_retries=1, timeout=0.05)
+        def blocking():
+            time.sleep(0.2)
+            returned.append(current_job())
+
+        job_id = await self.jobs.enqueue("blocking")
+        self.assertTrue(await self.worker.work("default"))
+        # the thread can't be stopped: the retry is scheduled only after it returned
+        self.assertEqual(returned, [job_id])
+        job = await self.jobs.get(job_id)
+        self.assertEqual((job["status"], job["error"]), ("retrying", "Timed out"))
+
+    async def test_lease_is_renewed(self):
+        @self.jobs.task(name="check_lease")
+        async def check_lease():
+            await asyncio.sleep(0.1)
+            return await self.redis.zscore("jobs:running:default", current_job()) - time.time()
+
+        job_id = await self.jobs.enqueue("check_lease")
+        with patch("contacts_book.services.jobs.LEASE_MARGIN", 0.02):
+            self.assertTrue(await self.worker.work("default"))
+        self.assertGreater((await self.jobs.get(job_id))["result"], self.jobs.timeout)
+        self.assertEqual(await self.redis.zcard("jobs:running:default"), 0)
+
+    async def test_concurrency_limit(self):
+        await self.jobs.enqueue("add", 1)
+        await self.jobs.enqueue("add", 2)
+        self.assertIsNotNone(await self.jobs.claim("default", limit=1))
+        self.assertIsNone(await self.jobs.claim("default", limit=1))
+        self.assertIsNotNone(await self.jobs.claim("default", limit=2))
+
+    async def test_recover_expired_lease(self):
+        job_id = await self.jobs.enqueue("add", 1)
+        self.assertEqual(await self.jobs.claim("default"), job_id)
+        self.assertEqual(await self.jobs.recover("default"), 0)
+
+        await self.redis.zadd("jobs:running:default", {job_id: time.time() - 1})
+        self.assertEqual(await self.jobs.recover("default"), 1)
+        job = await self.jobs.get(job_id)
+        self.assertEqual((job["status"], job["error"]), ("retrying", "Lease expired"))
+        await asyncio.sleep(0.02)
+        self.assertTrue(await self.worker.work("default"))
+        self.assertEqual((await self.jobs.get(job_id))["attempts"], 2)
+
+    async def test_cron(self):
+        @self.jobs.cron("* * * * *", name="tick")
+        async def tick():
+            return "tock"
+
+        schedule, task = self.jobs.crons[0]
+        run_at = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+        job_id = await self.jobs.schedule_cron(schedule, task, run_at)
+        self.assertIsNotNone(job_id)
+        # another worker doesn't enqueue the same run
+        self.assertIsNone(await self.jobs.schedule_cron(schedule, task, run_at))
+        self.assertTrue(await self.worker.work("default"))
+        self.assertEqual((await self.jobs.get(job_id))["result"], "tock")
+
+    async def test_worker_run_and_stop(self):
+        job_ids = [await self.jobs.enqueue("add", number) for number in range(5)]
+        self.worker.start()
+        for _ in range(100):
+            if (await self.jobs.get(job_ids[-1]))["status"] == "succeeded":
+                break
+            await asyncio.sleep(0.01)
+        await self.worker.stop()
+        self.assertEqual([(await self.jobs.get(job_id))["result"] for job_id in job_ids], [0, 1, 2, 3, 4])
+
+    async def test_submit(self):
+        background_tasks = MagicMock()
+        add = self.jobs.tasks["add"].func
+        job_id = await self.jobs.submit(background_tasks, add, 1, b=2)
+        self.assertEqual((await self.jobs.get(job_id))["task"], "add")
+        background_tasks.add_task.assert_not_called()
+
+        with patch("contacts_book.services.jobs.redis_pool.client", None):
+            self.assertIsNone(await self.jobs.submit(background_tasks, add, 1, b=2))
+        background_tasks.add_task.assert_called_once_with(add, 1, b=2)
+
+    async def test_unknown_job(self):
+        with self.assertRaises(KeyError):
+            await self.jobs.enqueue("missing")
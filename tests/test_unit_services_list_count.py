@@ -0,0 +1,83 @@
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from contacts_book.database.models import Base, User
+from contacts_book.repository.contacts import create_contact, update_contact
+from contacts_book.schemas import ContactModel
+from contacts_book.services.list_count import ListCount
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+class TestListCount(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.engine = create_engine(
+            "sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False}
+        )
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine, expire_on_commit=False)()
+        self.user = User(email="leya@ex.ua", password="secret")
+        self.session.add(self.user)
+        self.session.commit()
+        self.contacts = [
+            await create_contact(self.body(number, "Organa" if number % 2 else "Solo"), self.user, self.session)
+            for number in range(20)
+        ]
+
+        self.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        self.patcher = patch("contacts_book.services.list_count.redis_pool.client", self.redis)
+        self.patcher.start()
+
+    async def asyncTearDown(self) -> None:
+        self.patcher.stop()
+        await self.redis.close()
+        self.session.close()
+        self.engine.dispose()
+
+    def body(self, number: int, lastname: str) -> ContactModel:
+        return ContactModel(
+            firstname=f"Contact {number}",
+            lastname=lastname,
+            email=f"contact{number}@ex.ua",
+            phone=f"+3806600000{number:02}",
+            birthday=datetime(1990, 1, 1),
+            description="",
+        )
+
+    async def test_total_without_search(self):
+        self.assertEqual(await ListCount().get_total(None, self.user, self.session), (20, False))
+        self.assertEqual(await self.redis.keys("*"), [])
+
+    async def test_search_count_is_cached(self):
+        list_count = ListCount(exact_limit=100)
+        self.assertEqual(await list_count.get_total("organa", self.user, self.session), (10, False))
+        self.assertEqual(len(await self.redis.keys("contacts:count:*")), 1)
+
+        with patch("contacts_book.services.list_count.repository_contacts.count_contacts") as count_contacts:
+            self.assertEqual(await list_count.get_total("ORGANA", self.user, self.session), (10, False))
+        count_contacts.assert_not_called()
+
+        # a write changes the version, so the cached count is not used
+        await update_contact(self.body(0, "Organa"), self.contacts[0].id, self.user, self.session)
+        self.assertEqual(await list_count.get_total("organa", self.user, self.session), (11, False))
+
+    async def test_big_book_is_estimated(self):
+        # every 5th id, spread over the whole book
+        list_count = ListCount(exact_limit=10, sample_size=4)
+        self.assertEqual(await list_count.get_total("organa", self.user, self.session), (10, True))
+        # 11 contacts, most of them added last: the first four contacts would have given 5
+        self.assertEqual(await list_count.get_total("contact 1", self.user, self.session), (10, True))
+
+        # a sample as big as the book is an exact count
+        list_count = ListCount(exact_limit=10, sample_size=50)
+        self.assertEqual(await list_count.get_total("solo", self.user, self.session), (10, False))
+
+    async def test_without_redis(self):
+        with patch("contacts_book.services.list_count.redis_pool.client", None):
+            self.assertEqual(await ListCount().get_total("contact 1", self.user, self.session), (11, False))
@@ -0,0 +1,58 @@
+import asyncio
+import time
+import unittest
+
+from contacts_book.services.loop_watchdog import LoopWatchdog
+from contacts_book.services.metrics import metrics
+
+
+class FakeRoute:
+    path = "/api/users/avatar"
+
+
+def blocking_upload():
+    time.sleep(0.3)
+
+
+class TestLoopWatchdog(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.watchdog = LoopWatchdog(threshold=0.1, interval=0.02)
+        self.watchdog.start()
+        await asyncio.sleep(0.05)
+
+    async def asyncTearDown(self) -> None:
+        await self.watchdog.stop()
+
+    async def test_block_is_recorded_with_route_and_stack(self):
+        before = metrics.counter_value("event_loop_blocked_total", route="/api/users/avatar")
+
+        async def handler():
+            self.watchdog.track({"type": "http", "path": "/api/users/avatar", "route": FakeRoute()})
+            blocking_upload()
+
+        await asyncio.create_task(handler())
+        await asyncio.sleep(0.1)
+
+        self.assertEqual(len(self.watchdog.blocks), 1)
+        block = self.watchdog.blocks[0]
+        self.assertGreaterEqual(block["duration_ms"], 200)
+        self.assertEqual(block["route"], "/api/users/avatar")
+        self.assertIn("blocking_upload", block["stack"])
+        self.assertEqual(
+            metrics.counter_value("event_loop_blocked_total", route="/api/users/avatar"), before + 1
+        )
+
+    async def test_unmatched_path_is_not_a_label(self):
+        async def handler():
+            self.watchdog.track({"type": "http", "path": "/random/8f2c41"})
+            blocking_upload()
+
+        await asyncio.create_task(handler())
+        await asyncio.sleep(0.1)
+
+        self.assertEqual(self.watchdog.blocks[0]["route"], "unmatched")
+        self.assertEqual(metrics.counter_value("event_loop_blocked_total", route="/random/8f2c41"), 0)
+
+    async def test_no_block(self):
+        await asyncio.sleep(0.2)
+        self.assertEqual(len(self.watchdog.blocks), 0)
@@ -0,0 +1,128 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from contacts_book.database.models import Base, Contact, User
+from contacts_book.repository.contacts import get_contact_rows
+from contacts_book.services.auth import auth_service
+from contacts_book.services.memory import MemoryProfiler, measure_peak, session_stats
+
+
+class TestMemoryProfiler(unittest.TestCase):
+    def setUp(self) -> None:
+        self.profiler = MemoryProfiler(keep=2)
+
+    def tearDown(self) -> None:
+        self.profiler.stop()
+
+    def test_snapshot_without_tracing(self):
+        with self.assertRaises(RuntimeError):
+            self.profiler.take_snapshot()
+
+    def test_snapshots_and_diff(self):
+        self.assertTrue(self.profiler.start(frames=1)["tracing"])
+        first = self.profiler.take_snapshot()
+        leak = [bytearray(1024) for _ in range(200)]
+        second = self.profiler.take_snapshot(limit=3)
+        self.assertLessEqual(len(second["top"]), 3)
+
+        diff = self.profiler.diff(first["id"], second["id"], "lineno", limit=5)
+        self.assertTrue(diff[0]["file"].endswith("test_unit_services_memory.py"))
+        self.assertGreaterEqual(diff[0]["size_diff_bytes"], 200 * 1024)
+        self.assertIn("bytearray", diff[0]["code"])
+
+        by_file = self.profiler.diff(first["id"], second["id"], "filename", limit=5)
+        self.assertTrue(any(item["file"] == diff[0]["file"] for item in by_file))
+        del leak
+
+    def test_keeps_latest_snapshots(self):
+        self.profiler.start()
+        ids = [self.profiler.take_snapshot(limit=1)["id"] for _ in range(3)]
+        self.assertEqual(self.profiler.status()["snapshots"], ids[1:])
+        with self.assertRaises(KeyError):
+            self.profiler.diff(ids[0], ids[2])
+
+    def test_stop_drops_snapshots(self):
+        self.profiler.start()
+        self.profiler.take_snapshot()
+        status = self.profiler.stop()
+        self.assertFalse(status["tracing"])
+        self.assertEqual(status["snapshots"], [])
+
+
+class TestSessionStats(unittest.TestCase):
+    def test_identity_map_sizes(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        small, big = Session(engine), Session(engine)
+        # the identity map holds clean objects weakly, keep them referenced
+        objects = [User(id=1, email="a@ex.com", password="x")]
+        objects += [Contact(id=i, firstname=f"c{i}") for i in range(1, 4)]
+        objects.append(User(id=2, email="b@ex.com", password="x"))
+        small.add(objects[0])
+        big.add_all(objects[1:])
+        small.flush()
+        big.flush()
+
+        result = session_stats([small, big])
+        self.assertEqual(result[0]["objects"], 4)
+        self.assertEqual(result[0]["by_type"], {"Contact": 3, "User": 1})
+        self.assertEqual(result[1]["objects"], 1)
+        small.close()
+        big.close()
+
+
+class TestCurrentAdmin(unittest.IsolatedAsyncioTestCase):
+    async def test_admin_only(self):
+        user = User(id=1, email="Boss@ex.com")
+        with patch.object(auth_service, "get_user_from_token", AsyncMock(return_value=user)), patch(
+            "contacts_book.services.auth.settings.admin_emails", "other@ex.com, boss@ex.com"
+        ):
+            self.assertIs(await auth_service.get_current_admin("token", None), user)
+
+        with patch.object(auth_service, "get_user_from_token", AsyncMock(return_value=user)), patch(
+            "contacts_book.services.auth.settings.admin_emails", ""
+        ):
+            with self.assertRaises(HTTPException) as err:
+                await auth_service.get_current_admin("token", None)
+            self.assertEqual(err.exception.status_code, 403)
+
+
+def test_measure_peak():
+    with measure_peak() as result:
+        data = bytearray(512 * 1024)
+        del data
+    assert result["peak_bytes"] >= 512 * 1024
+
+
+@pytest.fixture(scope="module")
+def contacts_db():
+    engine = create_engine(
+        "sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        db.add(User(id=1, email="a@ex.com", password="x"))
+        db.add_all(
+            Contact(firstname=f"Name{i}", lastname="Last", email=f"c{i}@ex.com", phone=str(i), user_id=1)
+            for i in range(2000)
+        )
+        db.commit()
+        yield db
+
+
+def test_get_contact_rows_peak_memory(contacts_db, assert_peak_memory):
+    user = User(id=1)
+    # a page of 20 rows must not materialize the other 1980 contacts
+    with assert_peak_memory(256 * 1024):
+        rows = asyncio.run(get_contact_rows(20, 0, None, user, contacts_db))
+    assert len(rows) == 20
+    with assert_peak_memory(256 * 1024):
+        rows = asyncio.run(get_contact_rows(20, 0, "Name199", user, contacts_db))
+    assert len(rows) == 11
@@ -0,0 +1,33 @@
+import unittest
+
+from contacts_book.database.models import Contact
+from contacts_book.services.phones import to_e164
+
+
+class TestToE164(unittest.TestCase):
+    def test_formats_of_one_number(self):
+        for phone in (
+            "+380661111111",
+            "+380 (66) 111-11-11",
+            "00380661111111",
+            "380661111111",
+            "066 111 11 11",
+            "661111111",
+        ):
+            with self.subTest(phone=phone):
+                self.assertEqual(to_e164(phone), "+380661111111")
+
+    def test_other_country(self):
+        self.assertEqual(to_e164("+30 66 222 2222"), "+30662222222")
+        self.assertEqual(to_e164("(202) 555-0143", country_code="1"), "+12025550143")
+
+    def test_not_a_phone(self):
+        for phone in (None, "", "12-34", "+0661111111", "+1234567890123456", "phone"):
+            with self.subTest(phone=phone):
+                self.assertIsNone(to_e164(phone))
+
+    def test_contact_keeps_normalized_phone(self):
+        contact = Contact(phone="066 111 11 11")
+        self.assertEqual(contact.phone_e164, "+380661111111")
+        contact.phone = "junk"
+        self.assertIsNone(contact.phone_e164)
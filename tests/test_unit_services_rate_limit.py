@@ -0,0 +1,45 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from contacts_book.services.rate_limit import WeightedRateLimiter
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+class TestWeightedRateLimiter(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.redis = fakeredis.FakeAsyncRedis()
+        self.callback = AsyncMock()
+        self.limiter = WeightedRateLimiter(times=10, seconds=60)
+        self.patcher = patch.multiple(
+            "fastapi_limiter.FastAPILimiter",
+            redis=self.redis,
+            prefix="test",
+            identifier=AsyncMock(return_value="client"),
+            http_callback=self.callback,
+        )
+        self.patcher.start()
+
+    async def asyncTearDown(self) -> None:
+        self.patcher.stop()
+        await self.redis.close()
+
+    async def test_weight_is_spent(self):
+        await self.limiter.hit(None, None, 4)
+        await self.limiter.hit(None, None, 6)
+        self.callback.assert_not_awaited()
+        self.assertEqual(await self.redis.get("test:client:weighted"), b"10")
+
+        await self.limiter.hit(None, None, 1)
+        self.callback.assert_awaited_once()
+        pexpire = self.callback.await_args.args[2]
+        self.assertTrue(0 < pexpire <= 60000)
+        self.assertEqual(await self.redis.get("test:client:weighted"), b"10")
+
+    async def test_batch_over_limit(self):
+        await self.limiter.hit(None, None, 11)
+        self.callback.assert_awaited_once()
+        self.assertEqual(self.callback.await_args.args[2], 60000)
+        self.assertIsNone(await self.redis.get("test:client:weighted"))
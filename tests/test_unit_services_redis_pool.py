@@ -0,0 +1,65 @@
+import unittest
+
+from fastapi import HTTPException
+
+from contacts_book.conf.config import Settings
+from contacts_book.services.metrics import Metrics, metrics
+from contacts_book.services.redis_pool import RedisPool, get_redis, redis_pool
+
+
+class TestRedisPool(unittest.IsolatedAsyncioTestCase):
+    async def test_connect_and_close(self):
+        pool = RedisPool()
+        self.assertEqual(pool.stats(), {"connected": False})
+
+        await pool.connect(Settings(redis_max_connections=7))
+        stats = pool.stats()
+        self.assertEqual(stats["max_connections"], 7)
+        self.assertEqual(stats["in_use"], 0)
+        self.assertIs(pool.client.connection_pool, pool.pool)
+
+        await pool.close()
+        self.assertIsNone(pool.client)
+
+    async def test_connect_fake(self):
+        try:
+            import fakeredis
+        except ImportError:
+            self.skipTest("fakeredis is not installed")
+        pool = RedisPool()
+        await pool.connect(Settings(redis_fake=True))
+        self.assertIsInstance(pool.client, fakeredis.FakeAsyncRedis)
+        self.assertTrue(await pool.client.set("key", "value"))
+        self.assertEqual(await pool.client.get("key"), "value")
+        await pool.close()
+        self.assertIsNone(pool.client)
+
+    async def test_get_redis_not_connected(self):
+        with self.assertRaises(HTTPException) as err:
+            await get_redis()
+        self.assertEqual(err.exception.status_code, 503)
+
+    async def test_pool_metrics(self):
+        await redis_pool.connect(Settings(redis_max_connections=9))
+        try:
+            self.assertIn("redis_pool_max_connections 9", metrics.render())
+        finally:
+            await redis_pool.close()
+
+
+class TestMetrics(unittest.TestCase):
+    def test_render(self):
+        registry = Metrics()
+        registry.inc("requests_total", route="/api/contacts")
+        registry.inc("requests_total", route="/api/contacts")
+        registry.observe("wait_seconds", 0.5)
+        registry.observe("wait_seconds", 1.5)
+        registry.register_collector(lambda: {"pool_size": 5})
+
+        text = registry.render()
+        self.assertIn('requests_total{route="/api/contacts"} 2', text)
+        self.assertIn("wait_seconds_count 2", text)
+        self.assertIn("wait_seconds_sum 2.0", text)
+        self.assertIn("wait_seconds_max 1.5", text)
+        self.assertIn("pool_size 5", text)
+        self.assertEqual(registry.counter_value("requests_total", route="/api/contacts"), 2)
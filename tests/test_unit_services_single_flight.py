@@ -0,0 +1,163 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from contacts_book.database.models import User
+from contacts_book.services.single_flight import SingleFlight
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.flight = SingleFlight()
+        self.calls = []
+
+        @self.flight.coalesce
+        def read(limit: int, user: User, db: Session):
+            self.calls.append(limit)
+            time.sleep(0.05)
+            if limit < 0:
+                raise ValueError("negative limit")
+            return [limit, user.id]
+
+        self.read = read
+        self.db = MagicMock(spec=Session)
+
+    async def test_identical_calls_share_one_read(self):
+        user = User(id=1)
+        results = await asyncio.gather(*(self.read(10, user, self.db) for _ in range(5)))
+        self.assertEqual(results, [[10, 1]] * 5)
+        self.assertEqual(self.calls, [10])
+        self.assertEqual(self.flight._calls, {})
+
+    async def test_different_calls_are_not_shared(self):
+        await asyncio.gather(
+            self.read(10, User(id=1), self.db),
+            self.read(10, User(id=2), self.db),
+            self.read(20, User(id=1), self.db),
+        )
+        self.assertEqual(sorted(self.calls), [10, 10, 20])
+
+    async def test_error_is_shared(self):
+        results = await asyncio.gather(
+            *(self.read(-1, User(id=1), self.db) for _ in range(3)), return_exceptions=True
+        )
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual(self.calls, [-1])
+
+    async def test_query_cancelled_by_leader_disconnect_is_retried(self):
+        @self.flight.coalesce
+        def read(user: User):
+            self.calls.append(user.id)
+            time.sleep(0.05)
+            if len(self.calls) == 1:
+                err = OperationalError("SELECT", {}, Exception("interrupted"))
+                err.cancelled_by = "disconnect"
+                raise err
+            return user.id
+
+        user = User(id=1)
+        results = await asyncio.gather(read(user), read(user), read(user), return_exceptions=True)
+        self.assertIsInstance(results[0], OperationalError)
+        self.assertEqual(results[1:], [1, 1])
+        self.assertEqual(self.calls, [1, 1])
+
+    async def test_cancelled_caller_does_not_cancel_others(self):
+        user = User(id=1)
+        first = asyncio.ensure_future(self.read(10, user, self.db))
+        second = asyncio.ensure_future(self.read(10, user, self.db))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        self.assertEqual(await second, [10, 1])
+        self.assertEqual(self.calls, [10])
+
+    async def test_cancelled_leader_does_not_close_the_shared_session(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        sessions = []
+
+        @self.flight.coalesce
+        def read(user: User, db: Session):
+            sessions.append(db)
+            time.sleep(0.05)
+            return db.execute(text("SELECT :id"), {"id": user.id}).scalar()
+
+        user = User(id=1)
+        leader_db = Session(bind=engine)
+        leader = asyncio.ensure_future(read(user, leader_db))
+        follower = asyncio.ensure_future(read(user, Session(bind=engine)))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        # as get_read_db does when the request goes away
+        leader_db.close()
+        self.assertEqual(await follower, 1)
+        self.assertEqual(len(sessions), 1)
+        self.assertIsNot(sessions[0], leader_db)
+        self.assertIs(sessions[0].get_bind(), engine)
+        self.assertFalse(sessions[0].in_transaction())
+        engine.dispose()
+
+    async def test_disabled(self):
+        self.flight.enabled = False
+        await asyncio.gather(*(self.read(10, User(id=1), self.db) for _ in range(2)))
+        self.assertEqual(self.calls, [10, 10])
+
+
+class TestRedisSingleFlight(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        self.patcher = patch("contacts_book.services.single_flight.redis_pool.client", self.redis)
+        self.patcher.start()
+        self.calls = []
+
+    async def asyncTearDown(self) -> None:
+        self.patcher.stop()
+        await self.redis.close()
+
+    def read(self, limit: int):
+        self.calls.append(limit)
+        time.sleep(0.05)
+        return {"limit": limit}
+
+    async def test_workers_share_one_read(self):
+        # two SingleFlight objects stand for two workers
+        workers = [SingleFlight(redis_enabled=True, poll_interval=0.01) for _ in range(2)]
+        results = await asyncio.gather(
+            *(worker.do("key", self.read, (10,)) for worker in workers for _ in range(3))
+        )
+        self.assertEqual(results, [{"limit": 10}] * 6)
+        self.assertEqual(self.calls, [10])
+        # the lock is released, only the result is left until it expires
+        self.assertEqual(len(await self.redis.keys("singleflight:*")), 1)
+
+        # a later call does not get the old result
+        await workers[0].do("key", self.read, (10,))
+        self.assertEqual(self.calls, [10, 10])
+
+    async def test_result_shared_as_json(self):
+        workers = [SingleFlight(redis_enabled=True, poll_interval=0.01) for _ in range(2)]
+        decode = lambda result: {**result, "decoded": True}
+        results = await asyncio.gather(
+            workers[0].do("key", self.read, (10,)),
+            workers[1].do("key", self.read, (10,), decode=decode),
+        )
+        self.assertEqual(results, [{"limit": 10}, {"limit": 10, "decoded": True}])
+        (result_key,) = await self.redis.keys("singleflight:*")
+        self.assertEqual(await self.redis.get(result_key), '{"limit":10}')
+
+    async def test_redis_error_reads_without_lock(self):
+        from redis.exceptions import ConnectionError
+
+        broken = MagicMock()
+        broken.set = AsyncMock(side_effect=ConnectionError())
+        with patch("contacts_book.services.single_flight.redis_pool.client", broken):
+            result = await SingleFlight(redis_enabled=True).do("key", self.read, (10,))
+        self.assertEqual(result, {"limit": 10})
+        self.assertEqual(self.calls, [10])
@@ -0,0 +1,59 @@
+import tempfile
+import threading
+import unittest
+from datetime import datetime
+
+from sqlalchemy import event, select, update
+
+from contacts_book.conf.config import Settings, settings
+from contacts_book.database.db import SessionLocal, configure_database, get_engine
+from contacts_book.database.models import Base, User, UserStat
+from contacts_book.repository.contacts import create_contact
+from contacts_book.schemas import ContactModel
+from contacts_book.services.user_stats import reconcile_user_stats
+
+
+class TestReconcileJob(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        # a file: the job queries in threads, and an in-memory database is per connection
+        self.directory = tempfile.TemporaryDirectory()
+        configure_database(Settings(sqlalchemy_database_url=f"sqlite:///{self.directory.name}/stats.db"))
+        Base.metadata.create_all(get_engine())
+        self.session = SessionLocal(bind=get_engine())
+        self.users = [User(email=f"user{number}@ex.ua", password="secret") for number in range(3)]
+        self.session.add_all(self.users)
+        self.session.commit()
+
+    def tearDown(self) -> None:
+        self.session.close()
+        get_engine().dispose()
+        configure_database(settings)
+        self.directory.cleanup()
+
+    async def test_repairs_every_user_off_the_event_loop(self):
+        for user in self.users:
+            body = ContactModel(
+                firstname="Han",
+                lastname="Solo",
+                email=f"han{user.id}@ex.ua",
+                phone=f"+38066111111{user.id}",
+                birthday=datetime(1975, 12, 10),
+                description="",
+            )
+            await create_contact(body, user, self.session)
+        self.session.execute(update(UserStat).where(UserStat.name == "contacts").values(value=5))
+        self.session.commit()
+
+        threads = set()
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            threads.add(threading.get_ident())
+
+        event.listen(get_engine(), "before_cursor_execute", capture)
+        try:
+            self.assertEqual(await reconcile_user_stats(batch_size=2), 3)
+        finally:
+            event.remove(get_engine(), "before_cursor_execute", capture)
+        self.assertNotIn(threading.get_ident(), threads)
+        totals = self.session.execute(select(UserStat.value).where(UserStat.name == "contacts")).scalars().all()
+        self.assertEqual(totals, [1, 1, 1])